@@ -0,0 +1,53 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import specialty_extractor
+
+
+class AsyncLookupEngine:
+    """
+    Run several doctrine.fr lookups at once on top of a shared DoctrineClient.
+    `max_concurrency` caps the number of leads in flight; the client's rate
+    limiter caps the request rate across all of them.
+    """
+
+    def __init__(self, client, max_concurrency=4):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def lookup(self, first_name, last_name, city, fresh=False):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.client.lookup, first_name, last_name, city, fresh
+        )
+
+    async def lookup_many(self, leads):
+        """
+        Look up a list of (first_name, last_name, city) tuples, optionally
+        followed by a `fresh` flag, and return the results in the same order. A lead whose lookup raises gets the exception
+        in its place instead of failing the whole batch.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(lead):
+            async with semaphore:
+                return await self.lookup(*lead)
+
+        return await asyncio.gather(*(bounded(lead) for lead in leads), return_exceptions=True)
+
+    def run(self, leads):
+        """Blocking wrapper around lookup_many for synchronous callers"""
+        return asyncio.run(self.lookup_many(leads))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+async def extract_lawyer_data_async(first_name, last_name, city):
+    """
+    Asyncio version of specialty_extractor.extract_lawyer_data
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, specialty_extractor.get_client().lookup, first_name, last_name, city
+    )
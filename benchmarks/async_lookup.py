@@ -0,0 +1,93 @@
+"""
+Compare leads/minute of the sequential lookup loop with AsyncLookupEngine
+against a local mock doctrine.fr server, using the same request budget.
+
+    python -m benchmarks.async_lookup --leads 20 --latency 0.2
+"""
+import io
+import os
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import specialty_extractor
+from rate_limiter import AdaptiveRateLimiter
+from async_extractor import AsyncLookupEngine
+from benchmarks.mock_doctrine import start_server
+
+
+def make_leads(count):
+    return [(f"First{i}", f"LAST{i}", "PARIS") for i in range(count)]
+
+
+def make_client(base_url, cookie_file, rate):
+    # A fixed rate: the budget never climbs, so both loops get the same one
+    return specialty_extractor.DoctrineClient(
+        cookie_file=cookie_file, rate_limiter=AdaptiveRateLimiter(rate, max_rate=rate), site_url=base_url
+    )
+
+
+def check_found(label, results):
+    """Fail loudly unless every lookup found its lawyer, so the timings measure real lookups"""
+    found = sum(1 for result in results if not isinstance(result, Exception) and result[2])
+    if found < len(results):
+        errors = {repr(result) for result in results if isinstance(result, Exception)}
+        raise SystemExit(f"{label}: only {found} of {len(results)} lookups found a lawyer {sorted(errors)}")
+
+
+def run_sequential(base_url, cookie_file, leads, rate, pause):
+    client = make_client(base_url, cookie_file, rate)
+    start = time.perf_counter()
+    results = []
+    for lead in leads:
+        results.append(client.lookup(*lead))
+        time.sleep(random.uniform(pause * 2 / 3, pause * 4 / 3))
+    elapsed = time.perf_counter() - start
+    client.close()
+    check_found("sequential", results)
+    return elapsed
+
+
+def run_async(base_url, cookie_file, leads, rate, concurrency):
+    client = make_client(base_url, cookie_file, rate)
+    engine = AsyncLookupEngine(client, max_concurrency=concurrency)
+    start = time.perf_counter()
+    results = engine.run(leads)
+    elapsed = time.perf_counter() - start
+    engine.close()
+    client.close()
+    check_found("async", results)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--leads", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock server latency per request (s)")
+    parser.add_argument("--rate", type=float, default=2.0, help="shared request budget (requests/s)")
+    parser.add_argument("--pause", type=float, default=1.5, help="sequential pause between leads (s)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    server, base_url = start_server(latency=args.latency)
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("benchmark-cookie")
+        cookie_file = f.name
+    leads = make_leads(args.leads)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sequential = run_sequential(base_url, cookie_file, leads, args.rate, args.pause)
+            concurrent = run_async(base_url, cookie_file, leads, args.rate, args.concurrency)
+    finally:
+        server.shutdown()
+        os.unlink(cookie_file)
+
+    print(f"{args.leads} leads, {args.latency * 1000:.0f} ms latency, {args.rate} requests/s budget")
+    print(f"sequential:          {args.leads / sequential * 60:7.1f} leads/min ({sequential:.1f} s)")
+    print(f"async (x{args.concurrency} in flight): {args.leads / concurrent * 60:7.1f} leads/min ({concurrent:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import re
+import time
+import threading
+from collections import Counter, deque
+from gspread.utils import a1_to_rowcol
+
+RANGE = re.compile(r"([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?")
+
+
+class QuotaResponse:
+    status_code = 429
+    headers = {}
+    text = "Quota exceeded for quota metric 'Requests' [429]"
+
+
+class QuotaExceeded(Exception):
+    """Stand-in for gspread's APIError on a 429"""
+
+    def __init__(self, kind):
+        super().__init__(f"APIError: [429]: Quota exceeded for {kind} requests per minute")
+        self.response = QuotaResponse()
+
+
+class FakeSpreadsheet:
+    """
+    In-memory spreadsheet with Google Sheets' per-minute read and write
+    quotas. `window` can be shortened to run long benchmarks faster with the
+    same number of requests per window.
+    """
+
+    def __init__(self, read_quota=60, write_quota=60, window=60):
+        self.read_quota = read_quota
+        self.write_quota = write_quota
+        self.window = window
+        self.sheets = {}
+        self.calls = Counter()  # API calls, by method
+        self.rejected = Counter()  # Calls refused for quota, by read/write
+        self.history = {"read": deque(), "write": deque()}
+        self.lock = threading.Lock()
+
+    def charge(self, kind, method):
+        """Count a call against the quota, raising QuotaExceeded when it is used up"""
+        quota = self.read_quota if kind == "read" else self.write_quota
+        now = time.monotonic()
+        with self.lock:
+            history = self.history[kind]
+            while history and now - history[0] >= self.window:
+                history.popleft()
+            if quota and len(history) >= quota:
+                self.rejected[kind] += 1
+                raise QuotaExceeded(kind)
+            history.append(now)
+            self.calls[method] += 1
+
+    def batch_update(self, body):
+        self.charge("write", "spreadsheet.batch_update")
+        deletes = [request["deleteDimension"]["range"] for request in body["requests"]]
+        for target in deletes:
+            sheet = self.sheets[target["sheetId"]]
+            del sheet.rows[target["startIndex"]:target["endIndex"]]
+
+
+class FakeWorksheet:
+    """In-memory stand-in for the parts of gspread's Worksheet the bot uses"""
+
+    def __init__(self, spreadsheet, sheet_id, rows, row_count=1000):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.rows = [list(row) for row in rows]
+        self.row_count = max(row_count, len(self.rows))
+        spreadsheet.sheets[sheet_id] = self
+
+    def cell(self, row, col):
+        if row - 1 < len(self.rows) and col - 1 < len(self.rows[row - 1]):
+            return self.rows[row - 1][col - 1]
+        return ""
+
+    def set_cell(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        # Sheets stores None as an empty cell
+        cells[col - 1] = "" if value is None else value
+
+    def write_block(self, row, col, values):
+        for i, cells in enumerate(values):
+            for j, value in enumerate(cells):
+                self.set_cell(row + i, col + j, value)
+
+    def column(self, col, start=1):
+        values = [self.cell(row, col) for row in range(start, len(self.rows) + 1)]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def get_all_values(self):
+        self.spreadsheet.charge("read", "get_all_values")
+        return [list(row) for row in self.rows]
+
+    def row_values(self, row):
+        self.spreadsheet.charge("read", "row_values")
+        values = list(self.rows[row - 1]) if row <= len(self.rows) else []
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def col_values(self, col):
+        self.spreadsheet.charge("read", "col_values")
+        return self.column(col)
+
+    def batch_get(self, ranges, major_dimension=None):
+        self.spreadsheet.charge("read", "batch_get")
+        results = []
+        for a1 in ranges:
+            first_col, first_row, _, _ = RANGE.fullmatch(a1).groups()
+            if not first_col:
+                # Whole row, e.g. "1:1"
+                row = int(first_row)
+                values = list(self.rows[row - 1]) if row <= len(self.rows) else []
+                while values and values[-1] == "":
+                    values.pop()
+                if major_dimension == "COLUMNS":
+                    results.append([[value] for value in values])
+                else:
+                    results.append([values] if values else [])
+                continue
+            col = a1_to_rowcol(f"{first_col}1")[1]
+            start = int(first_row or 1)
+            if major_dimension == "COLUMNS":
+                values = self.column(col, start)
+                results.append([values] if values else [])
+            else:
+                # Row-major A{n}:{m} reads whole rows n to m, without trailing empty rows or cells
+                _, _, _, last_row = RANGE.fullmatch(a1).groups()
+                end = min(int(last_row) if last_row else len(self.rows), len(self.rows))
+                values = []
+                for row in self.rows[start - 1:end]:
+                    row = list(row)
+                    while row and row[-1] == "":
+                        row.pop()
+                    values.append(row)
+                while values and not values[-1]:
+                    values.pop()
+                results.append(values)
+        return results
+
+    def update(self, values=None, range_name=None):
+        self.spreadsheet.charge("write", "update")
+        row, col = a1_to_rowcol(range_name.split(":")[0])
+        self.write_block(row, col, values)
+
+    def batch_update(self, data):
+        self.spreadsheet.charge("write", "batch_update")
+        for entry in data:
+            row, col = a1_to_rowcol(entry["range"].split(":")[0])
+            self.write_block(row, col, entry["values"])
+
+    def add_rows(self, count):
+        self.spreadsheet.charge("write", "add_rows")
+        self.row_count += count
@@ -0,0 +1,129 @@
+"""
+Measure the memory and iteration cost of the leads held during a cycle: the
+full get_all_values() list of lists against a LeadTable.
+
+    python -m benchmarks.lead_table --rows 78000 1000000
+    python -m benchmarks.lead_table --rows 78000 --done 0.5
+
+Each representation of each size is built in a fresh process from rows
+generated one at a time, and reports the memory it keeps and the time per
+row of the work every cycle does on each row: reading the name, city and URL
+and finding the seven result columns. The list version looks positions up
+with headers.index() and strips cells on every read, as the bot used to.
+"pending" iterates a table skipping the --done share of rows that already
+have a profile URL.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+
+HEADERS = [
+    "NomBarreau", "CITY", "Last Name", "First Name", "Company Name", "cbSiretSiren", "cbAdresse1",
+    "cbAdresse2", "cbCp", "avLang", "Email", "Website", "Phone", "speciality 1", "speciality 2",
+    "speciality 3", "speciality 4", "speciality 5", "Serment", "doctrineURL",
+]
+RESULT_HEADERS = [f"speciality {i}" for i in range(1, 6)] + ["Serment", "doctrineURL"]
+CITIES = [f"CITY{i:03d}" for i in range(160)]
+
+
+def generate_rows(count, done, seed=0):
+    """Sheet rows like the export's, a `done` share of them with a profile URL"""
+    rng = random.Random(seed)
+    for i in range(count):
+        city = rng.choice(CITIES)
+        row = [
+            f"Barreau de {city.title()} ", city, f"LAST{i} ", f"First{i}", f"Cabinet {i}", f"{rng.randrange(10 ** 9):09d}",
+            f"{rng.randrange(1, 300)} rue de la Paix", "", f"{rng.randrange(10000, 99999)}", "fr",
+            f"first{i}.last{i}@example.fr", "", f"+33 1 {rng.randrange(10 ** 8):08d}",
+            "", "", "", "", "", "", "",
+        ]
+        if rng.random() < done:
+            row[18] = "2010-01-01"
+            row[19] = f"https://www.doctrine.fr/p/avocat/lawyer-{i}"
+        yield row
+
+
+def rss_mb():
+    """Resident memory now, in MB (peak memory where /proc is not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        import resource
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def list_row_work(headers, row):
+    first_name = row[headers.index("First Name")].strip()
+    last_name = row[headers.index("Last Name")].strip()
+    city = row[headers.index("CITY")].strip()
+    url_index = headers.index("doctrineURL")
+    current_url = row[url_index].strip() if url_index < len(row) else ""
+    positions = [headers.index(name) for name in RESULT_HEADERS]
+    return first_name, last_name, city, current_url, positions
+
+
+def table_row_work(headers, row):
+    from lead_table import column_map
+
+    columns = column_map(headers)
+    first_name = row[columns.first_name]
+    last_name = row[columns.last_name]
+    city = row[columns.city]
+    current_url = row[columns.url]
+    positions = [columns[name] for name in RESULT_HEADERS]
+    return first_name, last_name, city, current_url, positions
+
+
+def run_case(kind, rows_count, done, results):
+    from lead_table import LeadTable
+
+    before = rss_mb()
+    start = time.perf_counter()
+    if kind == "list":
+        rows = list(enumerate([HEADERS] + list(generate_rows(rows_count, done))))[1:]
+    else:
+        rows = LeadTable.from_values(HEADERS, generate_rows(rows_count, done), start=1)
+    build = time.perf_counter() - start
+    memory = rss_mb() - before
+
+    work = list_row_work if kind == "list" else table_row_work
+    start = time.perf_counter()
+    iterated = rows.pending(skip_url=lambda url: "/p/avocat/" in url) if kind == "pending" else rows
+    count = 0
+    for _, row in iterated:
+        work(HEADERS, row)
+        count += 1
+    iterate = time.perf_counter() - start
+    results.put({"memory": memory, "build": build, "iterate": iterate, "count": count})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LeadTable memory and iteration benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[78000, 1000000])
+    parser.add_argument("--done", type=float, default=0.3, help="share of rows that already have a profile URL")
+    args = parser.parse_args()
+
+    print(f"{len(HEADERS)} columns, {len(CITIES)} cities, {args.done:.0%} of rows already done")
+    print(f"{'rows':>8} {'representation':<16} {'kept MB':>8} {'bytes/row':>10} {'build s':>8} "
+          f"{'rows iterated':>14} {'µs/row':>7}")
+    context = multiprocessing.get_context("spawn")
+    for rows_count in args.rows:
+        for kind in ("list", "table", "pending"):
+            results = context.Queue()
+            process = context.Process(target=run_case, args=(kind, rows_count, args.done, results))
+            process.start()
+            result = results.get()
+            process.join()
+            label = {"list": "list of lists", "table": "LeadTable", "pending": "LeadTable.pending"}[kind]
+            print(f"{rows_count:>8} {label:<16} {result['memory']:>8.1f} "
+                  f"{result['memory'] * 1024 ** 2 / rows_count:>10.0f} {result['build']:>8.2f} "
+                  f"{result['count']:>14} {result['iterate'] / rows_count * 1e6:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
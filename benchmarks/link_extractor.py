@@ -0,0 +1,118 @@
+"""
+Measure link_extractor lookups/second against Bing result pages served
+from benchmarks/fixtures/bing by a local server, with no network access.
+
+    python -m benchmarks.link_extractor --lookups 200 --latency 0.05
+    python -m benchmarks.link_extractor --lookups 20 --render
+
+Compares a fresh session per lookup (as each call used to open its own
+HTMLSession), the pooled extract_and_check_links one lookup at a time and
+extract_and_check_links_many. Pages without a profile link in their raw
+HTML are only rendered with --render, which needs pyppeteer's Chromium.
+"""
+import os
+import time
+import argparse
+import threading
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import link_extractor
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "bing")
+
+
+def load_fixtures():
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                pages[name[:-len(".html")]] = f.read()
+    return pages
+
+
+def start_server(pages, latency):
+    """Serve /search?page=<fixture name> on a free localhost port and return (server, base_url)"""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            name = parse_qs(urlparse(self.path).query).get("page", [""])[0]
+            html = pages.get(name)
+            if html is None:
+                self.send_error(404)
+                return
+            data = html.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def fresh_session_lookup(url):
+    """One session per lookup, the way each call used to work (without the render)"""
+    session = requests.Session()
+    try:
+        return link_extractor.find_profile_link(session.get(url, timeout=30).text)
+    finally:
+        session.close()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="link_extractor throughput on local Bing fixtures")
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="local server latency per page (s)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--render", action="store_true", help="render pages without a link in their raw HTML")
+    args = parser.parse_args()
+
+    pages = load_fixtures()
+    server, base_url = start_server(pages, args.latency)
+    names = sorted(pages)
+    urls = [f"{base_url}/search?page={names[i % len(names)]}&q={i}" for i in range(args.lookups)]
+
+    start = time.perf_counter()
+    for html in pages.values():
+        for _ in range(200):
+            link_extractor.find_profile_link(html)
+    parse_us = (time.perf_counter() - start) / (200 * len(pages)) * 1e6
+
+    extractor = link_extractor.LinkExtractor(pool_size=args.concurrency, render=args.render)
+    link_extractor._default_extractor = extractor
+
+    baseline, baseline_time = timed(lambda: [fresh_session_lookup(url) for url in urls])
+    sequential, sequential_time = timed(lambda: [link_extractor.extract_and_check_links(url) for url in urls])
+    many, many_time = timed(link_extractor.extract_and_check_links_many, urls, args.concurrency)
+    extractor.close()
+    server.shutdown()
+
+    found = sum(1 for link in many if link)
+    print(f"{len(pages)} fixtures, {args.lookups} lookups, latency {args.latency * 1000:.0f} ms, "
+          f"render {'on' if args.render else 'off'}; lxml parse {parse_us:.0f} µs/page")
+    print(f"{'mode':<28} {'lookups/s':>10} {'found':>6}")
+    for mode, links, elapsed in (
+        ("fresh session per lookup", baseline, baseline_time),
+        ("pooled, one at a time", sequential, sequential_time),
+        (f"many, concurrency {args.concurrency}", many, many_time),
+    ):
+        print(f"{mode:<28} {len(urls) / elapsed:>10.1f} {sum(1 for link in links if link):>6}")
+    if found != sum(1 for link in sequential if link):
+        print("⚠️ Batch and one-at-a-time lookups found different links")
+
+
+if __name__ == "__main__":
+    main()
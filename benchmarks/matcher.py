@@ -0,0 +1,66 @@
+"""
+Precision/recall of the lead matcher on a labelled corpus, and its cost per hit.
+
+    python -m benchmarks.matcher --threshold 0.75 --calls 100000
+
+Each corpus entry is a lead, one search hit and whether the hit is that
+lawyer. Mistakes are listed with their score so the threshold can be tuned.
+"""
+import os
+import json
+import time
+import argparse
+from lead_matcher import LeadMatcher
+
+CORPUS = os.path.join(os.path.dirname(__file__), "match_corpus.json")
+
+
+def evaluate(corpus, threshold):
+    counts = {"tp": 0, "fp": 0, "fn": 0, "tn": 0}
+    mistakes = []
+    for case in corpus:
+        matcher = LeadMatcher(*case["lead"], threshold=threshold)
+        accepted = matcher.best([case["hit"]]) is not None
+        outcome = ("t" if accepted == case["match"] else "f") + ("p" if accepted else "n")
+        counts[outcome] += 1
+        if accepted != case["match"]:
+            mistakes.append((matcher.score(case["hit"]), case["note"], case["lead"]))
+    return counts, mistakes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lead matcher accuracy and speed")
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    counts, mistakes = evaluate(corpus, args.threshold)
+    precision = counts["tp"] / max(1, counts["tp"] + counts["fp"])
+    recall = counts["tp"] / max(1, counts["tp"] + counts["fn"])
+    print(f"{len(corpus)} cases at threshold {args.threshold}: "
+          f"precision {precision:.1%}, recall {recall:.1%} ({counts})")
+    for score, note, lead in mistakes:
+        print(f"  wrong at score {score:.2f}: {note} {lead}")
+
+    print("\nScore by threshold:")
+    for threshold in (0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9):
+        counts, _ = evaluate(corpus, threshold)
+        precision = counts["tp"] / max(1, counts["tp"] + counts["fp"])
+        recall = counts["tp"] / max(1, counts["tp"] + counts["fn"])
+        print(f"  {threshold:.2f}  precision {precision:6.1%}  recall {recall:6.1%}")
+
+    # One matcher per lead, scored against every hit of its search
+    pairs = [(LeadMatcher(*case["lead"]), case["hit"]) for case in corpus]
+    start = time.perf_counter()
+    for i in range(args.calls):
+        matcher, hit = pairs[i % len(pairs)]
+        matcher.score(hit)
+    elapsed = time.perf_counter() - start
+    print(f"\nscore(): {elapsed / args.calls * 1e6:.2f} us per hit over {args.calls} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+CATEGORIES = [
+    "Droit du travail", "Droit de la famille", "Droit pénal", "Baux commerciaux",
+    "Droit immobilier", "Droit des sociétés", "Procédures collectives", "Droit fiscal",
+]
+
+
+def lawyer_id_for(query):
+    return "mock-" + hashlib.md5(query.encode("utf-8")).hexdigest()[:12]
+
+
+def decisions_payload(lawyer_id, version=0):
+    """Synthetic decisions of a lawyer; another `version` stands for new decisions"""
+    rng = random.Random(f"{lawyer_id}:{version}" if version else lawyer_id)
+    domains = []
+    for d in range(3):
+        subs = [
+            {"categoryName": rng.choice(CATEGORIES), "count": rng.randint(1, 200)}
+            for _ in range(rng.randint(1, 4))
+        ]
+        domains.append({"name": f"domain {d}", "sub": subs})
+    return {"domains": domains}
+
+
+def search_hit(query):
+    """A hit named after the query's words, its last word being the city"""
+    words = query.split()
+    hit = {"id": lawyer_id_for(query), "sermentDate": "2010-01-01"}
+    if len(words) > 1:
+        hit["name"] = " ".join(words[:-1])
+        hit["city"] = words[-1]
+    return hit
+
+
+def page_html(read_key):
+    next_data = {"props": {"pageProps": {"readKey": read_key}}}
+    return (
+        "<html><head></head><body><div id=\"__next\"></div>"
+        f"<script id=\"__NEXT_DATA__\" type=\"application/json\">{json.dumps(next_data)}</script>"
+        "</body></html>"
+    )
+
+
+def load_recordings(path):
+    """
+    Load recorded responses from a directory holding search.json (query ->
+    search response), pages/<lawyer id>.html and decisions/<lawyer id>.json.
+    Anything missing is served synthetically.
+    """
+    recordings = {"search": {}, "pages": {}, "decisions": {}}
+    search_file = os.path.join(path, "search.json")
+    if os.path.exists(search_file):
+        with open(search_file, encoding="utf-8") as f:
+            recordings["search"] = json.load(f)
+    for kind, suffix in (("pages", ".html"), ("decisions", ".json")):
+        folder = os.path.join(path, kind)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if name.endswith(suffix):
+                with open(os.path.join(folder, name), encoding="utf-8") as f:
+                    recordings[kind][name[:-len(suffix)]] = f.read()
+    return recordings
+
+
+class MockDoctrineHandler(BaseHTTPRequestHandler):
+    """
+    Serve the three doctrine.fr endpoints used by a lookup, from recordings
+    when given and synthetic payloads otherwise. Can also inject 429s and
+    reject reused readKeys as stale. With `conditional`, /decisions sends an
+    ETag and answers a matching If-None-Match with 304.
+    """
+
+    latency = 0.05  # Seconds added to every response
+    throttle_rate = 0.0  # Share of requests answered with 429
+    retry_after = 1  # Retry-After seconds sent with injected 429s
+    stale_key_rate = 0.0  # Share of reused readKeys rejected as stale
+    recordings = None
+    rng = random.Random(0)
+    lock = threading.Lock()
+    counts = Counter()  # Requests served, by endpoint
+    used_keys = set()  # readKeys already used once
+    conditional = False
+    versions = {}  # lawyer ID -> version of their decisions; bump it to change them
+    bytes_sent = Counter()  # Response body bytes, by endpoint
+    endpoint = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type, headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        with self.lock:
+            self.bytes_sent[self.endpoint] += len(data)
+
+    def _chance(self, rate):
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def _count(self, endpoint):
+        self.endpoint = endpoint
+        with self.lock:
+            self.counts[endpoint] += 1
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        recordings = self.recordings or {"search": {}, "pages": {}, "decisions": {}}
+        if self._chance(self.throttle_rate):
+            self._count("429")
+            self._send(429, "{}", "application/json", {"Retry-After": str(self.retry_after)})
+            return
+
+        if url.path == "/api/v2/search":
+            self._count("search")
+            query = params.get("q", [""])[0]
+            recorded = recordings["search"].get(query)
+            body = json.dumps(recorded) if recorded is not None else json.dumps({"hits": [search_hit(query)]})
+            self._send(200, body, "application/json")
+        elif url.path.startswith("/p/avocat/"):
+            self._count("page")
+            lawyer_id = url.path.rsplit("/", 1)[-1]
+            html = recordings["pages"].get(lawyer_id)
+            if html is None:
+                # A new key per page view, so a stored key can go stale
+                with self.lock:
+                    html = page_html(f"key-{lawyer_id}-{self.rng.randrange(10 ** 6)}")
+            self._send(200, html, "text/html")
+        elif url.path.startswith("/api/v2/lawyers/") and url.path.endswith("/decisions"):
+            self._count("decisions")
+            lawyer_id = url.path.split("/")[4]
+            read_key = params.get("read_key", [""])[0]
+            with self.lock:
+                reused = read_key in self.used_keys
+                self.used_keys.add(read_key)
+            if reused and self._chance(self.stale_key_rate):
+                self._count("stale_key")
+                self._send(403, "{}", "application/json")
+                return
+            recorded = recordings["decisions"].get(lawyer_id)
+            body = recorded or json.dumps(decisions_payload(lawyer_id, self.versions.get(lawyer_id, 0)))
+            if not self.conditional:
+                self._send(200, body, "application/json")
+                return
+            etag = '"' + hashlib.md5(body.encode("utf-8")).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, "", "application/json", {"ETag": etag})
+            else:
+                self._send(200, body, "application/json", {"ETag": etag})
+        elif url.path == "/dashboard":
+            # Logged-out visitors are sent to the login page
+            self._count("dashboard")
+            if "session=" in (self.headers.get("Cookie") or ""):
+                self._send(200, "<html></html>", "text/html")
+            else:
+                self._send(302, "", "text/html", {"Location": "/inscription"})
+        else:
+            self._send(404, "{}", "application/json")
+
+
+def start_server(latency=0.05, throttle_rate=0.0, stale_key_rate=0.0, retry_after=1,
+                 recordings=None, seed=0, conditional=False):
+    """
+    Start the mock server on a free localhost port and return (server, base_url).
+    Request counts are in server.RequestHandlerClass.counts and body bytes in
+    server.RequestHandlerClass.bytes_sent.
+    """
+    handler = type("Handler", (MockDoctrineHandler,), {
+        "latency": latency, "throttle_rate": throttle_rate, "stale_key_rate": stale_key_rate,
+        "retry_after": retry_after, "recordings": recordings, "rng": random.Random(seed),
+        "lock": threading.Lock(), "counts": Counter(), "used_keys": set(),
+        "conditional": conditional, "versions": {}, "bytes_sent": Counter(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
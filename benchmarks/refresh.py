@@ -0,0 +1,103 @@
+"""
+Compare refresh mode with a full reprocess of the processed lawyers, against
+the mock doctrine.fr server and an in-memory processed sheet.
+
+    python -m benchmarks.refresh --lawyers 500 --change-rate 0.05
+    python -m benchmarks.refresh --lawyers 500 --no-conditional
+
+A full reprocess looks every lawyer up again (search, profile page,
+decisions). Refresh then runs twice over the same sheet with the readKeys
+the lookups stored: once with no refresh state, and again after
+--change-rate of the lawyers got new decisions. --no-conditional makes the
+mock ignore ETags, so only the content hash tells what changed.
+"""
+import io
+import os
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import specialty_extractor
+from refresh import Refresher, RefreshState
+from benchmarks.mock_doctrine import start_server, lawyer_id_for, decisions_payload
+from benchmarks.fake_sheets import FakeSpreadsheet, FakeWorksheet
+from benchmarks.replay import HEADERS, CITIES
+
+
+def make_processed_rows(count, seed=0):
+    """Processed rows as the bot writes them, with the mock's current specialties"""
+    rng = random.Random(seed)
+    leads = []
+    rows = []
+    for i in range(count):
+        lead = (f"First{i}", f"LAST{i}", rng.choice(CITIES))
+        lawyer_id = lawyer_id_for(" ".join(lead))
+        specialties = (specialty_extractor.top_specialties(decisions_payload(lawyer_id)) + ["None"] * 5)[:5]
+        rows.append([f"Barreau de {lead[2].title()}", lead[2], lead[1], lead[0]] + specialties
+                    + ["2010-01-01", f"https://www.doctrine.fr/p/avocat/{lawyer_id}"])
+        leads.append(lead)
+    return leads, rows
+
+
+def server_totals(server):
+    handler = server.RequestHandlerClass
+    requests = sum(count for endpoint, count in handler.counts.items() if endpoint != "stale_key")
+    return requests, sum(handler.bytes_sent.values())
+
+
+def measure(server, func):
+    """Run func and return (requests, bytes, seconds) seen by the server"""
+    requests_before, bytes_before = server_totals(server)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    elapsed = time.perf_counter() - start
+    requests_after, bytes_after = server_totals(server)
+    return requests_after - requests_before, bytes_after - bytes_before, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh mode against a full reprocess")
+    parser.add_argument("--lawyers", type=int, default=500)
+    parser.add_argument("--change-rate", type=float, default=0.05, help="share of lawyers with new decisions")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock doctrine.fr latency per request (s)")
+    parser.add_argument("--no-conditional", action="store_true", help="mock ignores If-None-Match")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    with open("session_cookie.txt", "w") as f:
+        f.write("benchmark-cookie")
+    server, base_url = start_server(latency=args.latency, conditional=not args.no_conditional)
+    leads, rows = make_processed_rows(args.lawyers)
+    processed_sheet = FakeWorksheet(FakeSpreadsheet(10 ** 6, 10 ** 6, 60), 2, [HEADERS] + rows)
+
+    client = specialty_extractor.DoctrineClient()
+    client.site_url = base_url
+    client.rate_limiter.rate = client.rate_limiter.max_rate = 10 ** 6
+    refresher = Refresher(client, processed_sheet, RefreshState("refresh_state.sqlite3"),
+                          batch_size=args.lawyers, max_age=0)
+
+    results = [("full reprocess",) + measure(server, lambda: [client.lookup(*lead) for lead in leads]) + (0,)]
+    for label in ("refresh, no state", "refresh, after changes"):
+        if label == "refresh, after changes":
+            changed = random.Random(1).sample(range(len(leads)), int(len(leads) * args.change_rate))
+            for i in changed:
+                server.RequestHandlerClass.versions[lawyer_id_for(" ".join(leads[i]))] = 1
+        before = refresher.counts["rewritten"]
+        requests, size, elapsed = measure(server, refresher.run_batch)
+        results.append((label, requests, size, elapsed, refresher.counts["rewritten"] - before))
+    server.shutdown()
+
+    full_requests, full_bytes = results[0][1], results[0][2]
+    print(f"{args.lawyers} lawyers, {args.change_rate:.0%} changed, "
+          f"conditional requests {'off' if args.no_conditional else 'on'}")
+    print(f"{'pass':<24} {'requests':>9} {'vs full':>8} {'KB':>8} {'vs full':>8} {'rewritten':>10} {'seconds':>8}")
+    for label, requests, size, elapsed, rewritten in results:
+        print(f"{label:<24} {requests:>9} {requests / full_requests:>8.0%} {size / 1024:>8.0f} "
+              f"{size / full_bytes:>8.0%} {rewritten:>10} {elapsed:>8.2f}")
+    print(f"Refresher's own estimate: {refresher.report()}")
+
+
+if __name__ == "__main__":
+    main()
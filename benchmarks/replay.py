@@ -0,0 +1,174 @@
+"""
+Run LeadProcessor end to end against the mock doctrine.fr server and an
+in-memory Google Sheet, with no network access.
+
+    python -m benchmarks.replay --rows 1000 10000 78000
+    python -m benchmarks.replay --rows 1000 --throttle-rate 0.02 --stale-key-rate 0.1
+    python -m benchmarks.replay --rows 1000 --disable pipeline city_index
+    python -m benchmarks.replay --rows 1000 78000 --bulk
+
+Every sheet size runs in a fresh process, which reports leads/minute, API
+calls per lead (doctrine.fr and Sheets) and its peak memory. The fake sheet
+enforces Sheets' per-minute quotas; --quota-window shortens the minute so
+large sheets finish in reasonable time with the same requests per window.
+--bulk reads the leads from a CSV export and uploads results in bulk.
+"""
+import io
+import csv
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+HEADERS = [
+    "NomBarreau", "CITY", "Last Name", "First Name", "speciality 1", "speciality 2",
+    "speciality 3", "speciality 4", "speciality 5", "Serment", "doctrineURL",
+]
+CITIES = ["PARIS", "LYON", "MARSEILLE", "BORDEAUX", "LILLE", "NANTES", "MONTPELLIER", "RENNES"]
+FEATURES = ("pipeline", "city_index", "cache", "incremental", "single_flight")
+
+
+def make_rows(count, duplicates, seed=0):
+    """Synthetic leads, a `duplicates` share of them repeating an earlier lead"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        if rows and rng.random() < duplicates:
+            rows.append(list(rng.choice(rows)))
+            continue
+        city = rng.choices(CITIES, weights=[8, 3, 3, 2, 2, 1, 1, 1])[0]
+        rows.append([f"Barreau de {city.title()}", city, f"LAST{i}", f"First{i}"] + [""] * 7)
+    return rows
+
+
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def run_size(args, rows_count, results):
+    import run_bot
+    import metrics
+    from benchmarks.mock_doctrine import start_server
+    from benchmarks.fake_sheets import FakeSpreadsheet, FakeWorksheet
+
+    os.chdir(tempfile.mkdtemp())
+    with open("session_cookie.txt", "w") as f:
+        f.write("benchmark-cookie")
+    server, base_url = start_server(
+        latency=args.latency, throttle_rate=args.throttle_rate,
+        stale_key_rate=args.stale_key_rate, retry_after=args.retry_after
+    )
+    spreadsheet = FakeSpreadsheet(args.read_quota, args.write_quota, args.quota_window)
+    rows = make_rows(rows_count, args.duplicates)
+    leads_sheet = FakeWorksheet(spreadsheet, 1, [HEADERS] + rows)
+    processed_sheet = FakeWorksheet(spreadsheet, 2, [HEADERS])
+
+    processor = run_bot.LeadProcessor("benchmark", "leads", delay=0)
+    processor.setup_google_sheets = lambda: (leads_sheet, processed_sheet)
+    processor.client.site_url = base_url
+    processor.doctrine_limiter.rate = processor.doctrine_limiter.max_rate = args.rate
+    processor.sheets_limiter.rate = processor.sheets_limiter.max_rate = 10.0
+    processor.sheets_limiter.base_cooldown = max(0.5, args.quota_window / 2)
+    processor.lookup_concurrency = args.concurrency
+    processor.pipeline_report_interval = None
+    if "pipeline" in args.disable:
+        processor.pipelined = False
+    if "city_index" in args.disable:
+        processor.client.city_index = None
+    if "cache" in args.disable:
+        processor.client.cache = None
+    if "incremental" in args.disable:
+        processor.incremental_scan = False
+    if args.bulk:
+        with open("leads.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADERS)
+            writer.writerows(rows)
+        processor.bulk_source = "leads.csv"
+    if "single_flight" in args.disable:
+        processor.group_duplicates = lambda rows, headers: rows
+        processor.client.single_flight.do = lambda key, func, *a, **kw: func(*a, **kw)
+
+    # Stop after the first cycle that finds nothing left to do
+    read_leads = processor.read_leads
+
+    def read_until_done(sheet, due=()):
+        headers, rows = read_leads(sheet, due)
+        if not rows or (not processor.incremental_scan and len(sheet.rows) <= 1):
+            processor.should_stop = True
+            return headers, []
+        return headers, rows
+    processor.read_leads = read_until_done
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.process_leads()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    leads = sum(value for (name, _), value in metrics.registry.counters.items() if name == "leads_total")
+    doctrine_calls = sum(
+        count for endpoint, count in server.RequestHandlerClass.counts.items() if endpoint != "stale_key"
+    )
+    sheets_calls = sum(spreadsheet.calls.values())
+    results.put({
+        "rows": rows_count,
+        "elapsed": elapsed,
+        "leads": leads,
+        "left": len(leads_sheet.rows) - 1,
+        "moved": len(processed_sheet.rows) - 1,
+        "doctrine_calls": doctrine_calls,
+        "sheets_calls": sheets_calls,
+        "throttled": server.RequestHandlerClass.counts["429"] + sum(spreadsheet.rejected.values()),
+        "memory": peak_memory_mb(),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end throughput benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000])
+    parser.add_argument("--latency", type=float, default=0.01, help="mock doctrine.fr latency per request (s)")
+    parser.add_argument("--rate", type=float, default=500, help="doctrine.fr request budget (requests/s)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duplicates", type=float, default=0.05, help="share of rows repeating a lead")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of doctrine.fr requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--stale-key-rate", type=float, default=0.0, help="share of reused readKeys rejected")
+    parser.add_argument("--read-quota", type=int, default=60, help="Sheets reads per window")
+    parser.add_argument("--write-quota", type=int, default=60, help="Sheets writes per window")
+    parser.add_argument("--quota-window", type=float, default=60, help="Sheets quota window (s)")
+    parser.add_argument("--disable", nargs="*", default=[], choices=FEATURES)
+    parser.add_argument("--bulk", action="store_true", help="bulk mode: read a CSV export, upload results at the end")
+    args = parser.parse_args()
+
+    print(f"latency {args.latency * 1000:.0f} ms, budget {args.rate} requests/s, concurrency {args.concurrency}, "
+          f"{args.duplicates:.0%} duplicates, disabled: {', '.join(args.disable) or 'nothing'}"
+          f"{', bulk mode' if args.bulk else ''}")
+    print(f"{'rows':>7} {'leads/min':>10} {'doctrine/lead':>14} {'sheets/lead':>12} "
+          f"{'429s':>5} {'moved':>7} {'left':>5} {'peak MB':>8}")
+    context = multiprocessing.get_context("spawn")
+    for rows_count in args.rows:
+        results = context.Queue()
+        process = context.Process(target=run_size, args=(args, rows_count, results))
+        process.start()
+        result = results.get()
+        process.join()
+        leads = max(1, result["leads"])
+        memory = f"{result['memory']:8.1f}" if result["memory"] is not None else f"{'n/a':>8}"
+        print(f"{rows_count:>7} {result['leads'] / result['elapsed'] * 60:>10.0f} "
+              f"{result['doctrine_calls'] / leads:>14.2f} {result['sheets_calls'] / leads:>12.3f} "
+              f"{result['throttled']:>5} {result['moved']:>7} {result['left']:>5} {memory}")
+
+
+if __name__ == "__main__":
+    main()
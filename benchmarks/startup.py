@@ -0,0 +1,89 @@
+"""
+Measure cold start and per-lead CPU cost of the decisions aggregation.
+
+    python -m benchmarks.startup --runs 5 --calls 20000
+
+Cold start is the wall time of a fresh interpreter importing each module.
+The heavy modules that used to be imported eagerly are timed as well, for
+comparison. The per-call numbers compare extract_data with the old pandas
+version when pandas is installed.
+"""
+import sys
+import time
+import random
+import argparse
+import statistics
+import subprocess
+import specialty_extractor
+
+COLD_IMPORTS = {
+    "specialty_extractor": "import specialty_extractor",
+    "run_bot": "import run_bot",
+    "pandas + seleniumbase + gspread (old eager imports)": "import pandas, seleniumbase, gspread",
+}
+
+
+def cold_import_time(statement, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", statement], capture_output=True)
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None
+    return statistics.median(times)
+
+
+def decisions_payload(domains=12, subs=8, seed=0):
+    rng = random.Random(seed)
+    return {"domains": [
+        {"sub": [{"categoryName": f"category {d}-{s}", "count": rng.randint(0, 500)} for s in range(subs)]}
+        for d in range(domains)
+    ]}
+
+
+def pandas_extract_data(data):
+    """The previous DataFrame-based implementation, kept for comparison"""
+    import pandas as pd
+    subcategories = [
+        {'Subcategory': sub['categoryName'], 'Count': sub['count']}
+        for domain in data.get('domains', []) for sub in domain.get('sub', [])
+    ]
+    if not subcategories:
+        return []
+    df = pd.DataFrame(subcategories)
+    return df.sort_values(by='Count', ascending=False).head(5)['Subcategory'].tolist()
+
+
+def per_call(func, data, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func(data)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start and per-call benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("Cold start (median of fresh interpreters):")
+    for label, statement in COLD_IMPORTS.items():
+        elapsed = cold_import_time(statement, args.runs)
+        print(f"  {label:55s} {'not installed' if elapsed is None else f'{elapsed * 1000:8.1f} ms'}")
+
+    data = decisions_payload()
+    print(f"\nTop-5 aggregation over {sum(len(d['sub']) for d in data['domains'])} subcategories:")
+    print(f"  extract_data (heapq)   {per_call(specialty_extractor.extract_data, data, args.calls) * 1e6:8.1f} us/call")
+    try:
+        import pandas  # noqa: F401
+    except ImportError:
+        print("  pandas baseline        not installed")
+        return
+    pandas_calls = max(1, args.calls // 20)
+    print(f"  pandas (previous)      {per_call(pandas_extract_data, data, pandas_calls) * 1e6:8.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Show how lookup throughput scales with the number of coordinated workers.
+
+    python -m benchmarks.workers --leads 160 --latency 0.1 --rate 1000
+    python -m benchmarks.workers --rate 10   # shared budget caps the total
+
+Each worker is a separate process that leases batches of leads from a
+SQLite lease store and looks them up against a local mock doctrine.fr
+server. All workers draw from one shared token bucket.
+"""
+import io
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+import specialty_extractor
+from lease_store import SQLiteLeaseStore
+from rate_limiter import SharedRateLimiter
+from benchmarks.mock_doctrine import start_server
+
+
+def worker(worker_id, keys, store_path, base_url, cookie_file, rate, batch_size):
+    store = SQLiteLeaseStore(store_path)
+    client = specialty_extractor.DoctrineClient(
+        cookie_file=cookie_file, site_url=base_url,
+        rate_limiter=SharedRateLimiter(store, "doctrine.fr", rate, max_rate=rate)
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        while True:
+            claimed = store.claim(keys, worker_id, ttl=60, limit=batch_size)
+            if not claimed:
+                break
+            for key in claimed:
+                client.lookup(*key.split("|"))
+            store.release(claimed, worker_id, done=True)
+    client.close()
+    store.close()
+
+
+def run(workers, leads, base_url, cookie_file, rate, batch_size):
+    keys = [f"first{i}|last{i}|paris" for i in range(leads)]
+    store_path = tempfile.mktemp(suffix=".sqlite3")
+    SQLiteLeaseStore(store_path).close()
+    processes = [
+        multiprocessing.Process(
+            target=worker, args=(f"w{i}", keys, store_path, base_url, cookie_file, rate, batch_size)
+        )
+        for i in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    os.unlink(store_path)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker scaling benchmark")
+    parser.add_argument("--leads", type=int, default=160)
+    parser.add_argument("--latency", type=float, default=0.1, help="mock server latency per request (s)")
+    parser.add_argument("--rate", type=float, default=1000, help="shared request budget (requests/s)")
+    parser.add_argument("--batch", type=int, default=5, help="leads claimed per lease")
+    parser.add_argument("--max-workers", type=int, default=8)
+    args = parser.parse_args()
+
+    server, base_url = start_server(latency=args.latency)
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("benchmark-cookie")
+        cookie_file = f.name
+
+    print(f"{args.leads} leads, {args.latency * 1000:.0f} ms latency, {args.rate} requests/s shared budget")
+    try:
+        workers = 1
+        baseline = None
+        while workers <= args.max_workers:
+            elapsed = run(workers, args.leads, base_url, cookie_file, args.rate, args.batch)
+            leads_per_min = args.leads / elapsed * 60
+            baseline = baseline or leads_per_min
+            requests_per_s = args.leads * 3 / elapsed
+            print(f"  {workers} worker(s): {leads_per_min:8.1f} leads/min "
+                  f"({requests_per_s:6.1f} requests/s, x{leads_per_min / baseline:.2f})")
+            workers *= 2
+    finally:
+        server.shutdown()
+        os.unlink(cookie_file)
+
+
+if __name__ == "__main__":
+    main()
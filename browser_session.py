@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+from urllib.parse import urlparse
+
+DOCTRINE_URL = "https://www.doctrine.fr"
+
+
+class BrowserSession:
+    """
+    One SeleniumBase Chrome kept open for the whole process and reused for
+    every step that needs a human: logging in, confirming the session and
+    solving CAPTCHAs. While a step runs, the attached DoctrineClients are
+    paused; when it completes, the browser's cookies are copied straight into
+    their requests sessions (and the session cookie file) and they resume.
+    """
+
+    def __init__(self, user_data_dir=None, extension_dir=None, site_url=DOCTRINE_URL):
+        self.user_data_dir = user_data_dir or os.path.join(os.getcwd(), 'user_data')
+        self.extension_dir = extension_dir or os.path.join(os.getcwd(), 'extension')
+        self.site_url = site_url
+        self.lock = threading.RLock()  # One human step at a time; the driver is not thread-safe
+        self.context = None  # SeleniumBase SB context manager, entered once
+        self.sb = None
+        self.clients = []  # DoctrineClients paused during steps and given the cookies after
+        self.captcha_timeout = 300  # Seconds to wait for a CAPTCHA to be solved
+        self.poll_interval = 1  # Seconds between checks that a CAPTCHA is gone
+        self.generation = 0  # Bumped every time fresh cookies are handed off
+
+    def attach(self, client):
+        with self.lock:
+            if client not in self.clients:
+                self.clients.append(client)
+
+    def start(self):
+        """Open Chrome unless it is already open and responding"""
+        with self.lock:
+            if self.sb:
+                try:
+                    self.sb.driver.current_url
+                    return
+                except Exception:
+                    print("⚠️ Browser window was closed, opening a new one")
+                    self.close()
+            from seleniumbase import SB  # Imported here so runs that never open a browser skip it
+
+            self.context = SB(user_data_dir=self.user_data_dir, extension_dir=self.extension_dir)
+            self.sb = self.context.__enter__()
+
+    def pause_clients(self):
+        for client in self.clients:
+            client.pause()
+
+    def resume_clients(self):
+        for client in self.clients:
+            client.resume()
+
+    def hand_off_cookies(self):
+        """Copy the browser's doctrine.fr cookies into every attached client"""
+        domain = urlparse(self.site_url).hostname
+        if domain.startswith("www."):
+            domain = domain[len("www."):]
+        cookies = [c for c in self.sb.driver.get_cookies() if c.get("domain", "").endswith(domain)]
+        for client in self.clients:
+            client.set_cookies(cookies)
+        self.generation += 1
+        print(f"Handed {len(cookies)} browser cookies to {len(self.clients)} HTTP clients")
+
+    def human_step(self, url, prompt=None, done=None, timeout=None):
+        """
+        Open url with the workers paused and wait for a person to finish the
+        step: until Enter is pressed when `prompt` is given, otherwise until
+        done(sb) is true or `timeout` seconds pass. The cookies are handed off
+        either way. Returns True if the step was completed.
+        """
+        with self.lock:
+            self.pause_clients()
+            try:
+                self.start()
+                self.sb.open(url)
+                completed = True
+                if prompt:
+                    input(prompt)
+                elif done:
+                    deadline = time.time() + (timeout or self.captcha_timeout)
+                    while not done(self.sb):
+                        if time.time() >= deadline:
+                            completed = False
+                            break
+                        time.sleep(self.poll_interval)
+                self.hand_off_cookies()
+                return completed
+            finally:
+                self.resume_clients()
+
+    def login(self):
+        return self.human_step(f"{self.site_url}/inscription", prompt="Press Enter After login")
+
+    def check_login(self):
+        return self.human_step(f"{self.site_url}/dashboard", prompt="Press Enter After login")
+
+    def solve_captcha(self, url, generation=None):
+        """
+        Show a lawyer page until its data loads again, i.e. the CAPTCHA was
+        solved. `generation` is the value seen before the page failed: if
+        another worker's step handed off fresh cookies since, it returns
+        straight away.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return True
+            print("\n⚠️ Access denied! Pausing lookups until the CAPTCHA is solved...")
+            print("Solving Captcha", url)
+            solved = self.human_step(
+                url, done=lambda sb: "readKey" in sb.get_page_source(), timeout=self.captcha_timeout
+            )
+            print("CAPTCHA solved, resuming lookups" if solved else "⚠️ CAPTCHA not solved in time, resuming lookups")
+            return solved
+
+    def close(self):
+        with self.lock:
+            context, self.context, self.sb = self.context, None, None
+            if context:
+                try:
+                    context.__exit__(None, None, None)
+                except Exception as e:
+                    print(f"Error closing browser: {str(e)}")
+
+
+_default_browser = None
+_default_lock = threading.Lock()
+
+def get_browser():
+    """Return the process-wide BrowserSession, creating it on first use"""
+    global _default_browser
+    with _default_lock:
+        if _default_browser is None:
+            _default_browser = BrowserSession()
+        return _default_browser
@@ -0,0 +1,250 @@
+import os
+import csv
+import json
+import time
+import threading
+from sheet_writer import SheetWriteBuffer
+from sheet_scanner import SheetScanner
+from lead_table import column_map
+
+
+def read_table(path):
+    """
+    Read a leads export (.csv or .parquet) and return (headers, rows) with
+    every cell as a string, like the values of a Google Sheet
+    """
+    if path.lower().endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq  # Only needed for Parquet exports
+        except ImportError:
+            raise RuntimeError("Reading Parquet needs pyarrow: pip install pyarrow")
+        table = pq.read_table(path)
+        headers = [str(name).strip() for name in table.column_names]
+        columns = [table.column(i).to_pylist() for i in range(table.num_columns)]
+        rows = [["" if value is None else str(value) for value in cells] for cells in zip(*columns)]
+        return headers, rows
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        headers = [h.strip() for h in next(reader, [])]
+        rows = [row for row in reader]
+    return headers, rows
+
+
+class ResultStore:
+    """
+    Append-only JSONL file of lead results, one line per queued update or
+    move. Lines are written as results come in, so a restart knows which
+    leads are done; `<path>.uploaded` counts the lines already uploaded.
+    Once a pass is fully uploaded the file is archived and a new one begins.
+    """
+
+    def __init__(self, path="bulk_results.jsonl"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.records.append(json.loads(line))
+                    except ValueError:
+                        break  # A line cut short by a crash; everything before it is intact
+        self.file = open(path, "a", encoding="utf-8")
+        self.uploaded = 0
+        if os.path.exists(self.uploaded_path):
+            with open(self.uploaded_path) as f:
+                self.uploaded = min(int(f.read().strip() or 0), len(self.records))
+
+    @property
+    def uploaded_path(self):
+        return self.path + ".uploaded"
+
+    def append(self, record):
+        with self.lock:
+            self.records.append(record)
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def pending(self):
+        return len(self.records) - self.uploaded
+
+    def mark_uploaded(self, count):
+        with self.lock:
+            self.uploaded = count
+            with open(self.uploaded_path, "w") as f:
+                f.write(str(count))
+
+    def done_keys(self):
+        """Identity keys of the leads that already have a result"""
+        return {record["key"] for record in self.records}
+
+    def rotate(self):
+        """Archive the finished pass as <path>.<timestamp> and start an empty store"""
+        with self.lock:
+            self.file.close()
+            archive = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S')}"
+            os.replace(self.path, archive)
+            if os.path.exists(self.uploaded_path):
+                os.remove(self.uploaded_path)
+            self.records = []
+            self.uploaded = 0
+            self.file = open(self.path, "a", encoding="utf-8")
+        print(f"Uploaded results archived to {archive}")
+
+    def export_parquet(self, path):
+        """Write the results as a Parquet table (row, op, key, url, values and data as JSON)"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = {"row": [], "op": [], "key": [], "url": [], "values": [], "data": []}
+        for record in self.records:
+            for name in ("row", "op", "key", "url"):
+                columns[name].append(record.get(name))
+            columns["values"].append(json.dumps(record.get("values"), ensure_ascii=False))
+            columns["data"].append(json.dumps(record.get("data"), ensure_ascii=False))
+        pq.write_table(pa.table(columns), path)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class BulkWriteBuffer:
+    """
+    Drop-in for SheetWriteBuffer in bulk mode: results go to a ResultStore
+    as they come in and reach Google Sheets only on upload, at the end of the
+    pass or every `upload_interval` seconds. An upload replays the stored
+    results into one SheetWriteBuffer `chunk_rows` rows at a time, so a
+    whole sheet takes a handful of batched calls. Rows are re-located by lead
+    identity first, and moved rows are only deleted on the final upload.
+    """
+
+    def __init__(self, store, headers, open_sheets=None, upload_interval=None, chunk_rows=10000,
+                 rate_limiter=None, journal=None, processed_lock=None):
+        self.store = store
+        self.headers = headers  # Header row of the export; uploads use the sheet's own
+        self.open_sheets = open_sheets  # Returns (leads_sheet, processed_sheet); None never uploads
+        self.upload_interval = upload_interval  # Seconds between uploads; None uploads at the end only
+        self.chunk_rows = chunk_rows  # Records per batched write
+        self.rate_limiter = rate_limiter
+        self.journal = journal
+        self.processed_lock = processed_lock  # See SheetWriteBuffer
+        self.sheet_writer = None  # Keeps the moved rows to delete until the final upload
+        self.scanner = None
+        self.last_upload = time.time()
+        self.pending_deletes = set()  # Moves are deleted by sheet_writer, never here
+        self.row_keys = {}  # row index -> identity key of the lead queued for it
+        self.row_map = {}  # export row index -> row index in the sheet now (None if gone)
+
+    def pending_count(self):
+        return self.store.pending()
+
+    def queue_update(self, row_idx, row, headers, values, journal_key=None):
+        updated_row = list(row) + [""] * max(0, len(headers) - len(row))
+        columns = column_map(headers)
+        for header, value in values.items():
+            updated_row[columns[header]] = value
+        self.row_keys[row_idx] = journal_key
+        self.store.append({"op": "update", "row": row_idx, "key": journal_key, "values": values})
+        return updated_row
+
+    def queue_move(self, row_idx, row_data, key=None, partial=False):
+        """`key` is the doctrine URL, as for SheetWriteBuffer; the record is keyed by the lead"""
+        self.store.append({
+            "op": "move", "row": row_idx, "key": self.row_keys.pop(row_idx, None), "url": key,
+            "data": None if partial else list(row_data),
+        })
+
+    def should_flush(self):
+        if not self.upload_interval or not self.store.pending():
+            return False
+        return time.time() - self.last_upload >= self.upload_interval
+
+    def flush(self, final=False):
+        """Upload what is stored: on schedule when should_flush(), otherwise only when final"""
+        if final or self.should_flush():
+            self.upload(final=final)
+        return True
+
+    def upload(self, final=False):
+        if not self.open_sheets:
+            return
+        pending = self.store.pending()
+        # A final upload also finishes a pass whose results were all uploaded but not deleted
+        if not pending and not (final and self.store.records):
+            return
+        if self.sheet_writer is None:
+            leads_sheet, processed_sheet = self.open_sheets()
+            if not leads_sheet or not processed_sheet:
+                print("⚠️ Could not open the sheets, results stay in the local store")
+                return
+            self.sheet_writer = SheetWriteBuffer(
+                leads_sheet, processed_sheet, max_pending=float("inf"), max_age=float("inf"),
+                rate_limiter=self.rate_limiter, journal=self.journal, processed_lock=self.processed_lock
+            )
+            self.scanner = SheetScanner(leads_sheet, rate_limiter=self.rate_limiter)
+            restored = True
+        else:
+            restored = False
+
+        print(f"Uploading {pending} stored results")
+        writer = self.sheet_writer
+        # Rows may have moved since the export was taken: find every lead's rows
+        # now, and keep the rows already waiting to be deleted for their leads
+        key_rows = self.scanner.locate()
+        # Cells are placed by the live header row, which may not be in the export's order
+        headers = self.scanner.headers
+        if restored:
+            self.restore_deletes(key_rows)
+        else:
+            writer.relocate(key_rows)
+        available = {key: list(rows) for key, rows in key_rows.items()}
+        for row_num in writer.pending_deletes:
+            rows = available.get(writer.journal_keys.get(row_num), [])
+            if row_num in rows:
+                rows.remove(row_num)
+
+        start = self.store.uploaded
+        while start < len(self.store.records):
+            end = min(start + self.chunk_rows, len(self.store.records))
+            for record in self.store.records[start:end]:
+                row_idx = self.current_row(record, available)
+                if row_idx is None:
+                    continue
+                if record["op"] == "update":
+                    writer.queue_update(row_idx, [], headers, record["values"], journal_key=record["key"])
+                else:
+                    # The row's update may have gone out with the previous chunk,
+                    # taking its journal key along
+                    writer.journal_keys[row_idx + 1] = record["key"]
+                    data = record["data"]
+                    writer.queue_move(row_idx, data, key=record.get("url"), partial=data is None)
+            writer.flush()
+            self.store.mark_uploaded(end)
+            start = end
+        if final:
+            writer.commit_deletes()
+            self.store.rotate()
+            self.row_map = {}
+        self.last_upload = time.time()
+
+    def current_row(self, record, available):
+        """Row index a record's lead occupies now, or None if it left the sheet"""
+        export_row = record["row"]
+        if export_row not in self.row_map:
+            rows = available.get(record["key"])
+            self.row_map[export_row] = rows.pop(0) - 1 if rows else None
+            if self.row_map[export_row] is None:
+                print(f"Row {export_row + 1} is no longer in the sheet, dropping its result")
+        return self.row_map[export_row]
+
+    def restore_deletes(self, key_rows):
+        """Queue the deletes of rows moved by an earlier run that stopped before its final upload"""
+        available = {key: list(rows) for key, rows in key_rows.items()}
+        for record in self.store.records[:self.store.uploaded]:
+            rows = available.get(record["key"]) if record["op"] == "move" else None
+            if rows:
+                row_num = rows.pop(0)
+                self.sheet_writer.pending_deletes.add(row_num)
+                self.sheet_writer.journal_keys[row_num] = record["key"]
@@ -0,0 +1,133 @@
+import math
+import time
+import threading
+from collections import Counter
+from specialty_extractor import search_params
+from lead_matcher import name_tokens, hit_name, hit_city
+
+
+def city_key(city):
+    return " ".join(name_tokens(city))
+
+
+def name_key(*parts):
+    """Order-free key for a person's name: 'Aurélia', 'BADY' and 'Bady Aurélia' share one"""
+    return " ".join(sorted(name_tokens(" ".join(str(p or "") for p in parts))))
+
+
+class CityIndex:
+    """
+    Local name index of the lawyers of a city, built by paging through the
+    lawyer search once per city. Leads of a dense city are resolved from the
+    index instead of one search request each; names the index does not know,
+    or shares between several lawyers, fall back to the per-lead search.
+    """
+
+    def __init__(self, client, page_size=50, max_pages=200, min_leads=10, ttl=24 * 3600):
+        self.client = client  # DoctrineClient whose session and rate budget are used
+        self.page_size = page_size
+        self.max_pages = max_pages  # Cap on search pages per city; bigger cities are indexed in part
+        self.min_leads = min_leads  # Leads a city needs before it is worth prefetching
+        self.ttl = ttl  # Seconds before a city's index is rebuilt
+        self.cities = {}  # normalized city -> {name key: (lawyer_id, oath_date), or None if ambiguous}
+        self.built_at = {}  # normalized city -> time its index was built
+        self.pages_fetched = 0
+        self.resolved = 0
+        self.fallbacks = 0
+        self.lock = threading.Lock()
+
+    def is_fresh(self, city):
+        built_at = self.built_at.get(city)
+        return built_at is not None and time.time() - built_at < self.ttl
+
+    def prefetch_dense(self, leads):
+        """Prefetch every city with at least min_leads of the given (first, last, city) leads"""
+        counts = Counter(city_key(lead[2]) for lead in leads if lead[2])
+        for city, count in counts.most_common():
+            if count < self.min_leads:
+                break
+            if not self.is_fresh(city):
+                self.prefetch(city, leads=count)
+
+    def prefetch(self, city, leads=None):
+        """
+        Page through the lawyer search for `city` and index the hits by name.
+        With the number of `leads` to look up there, paging goes on only
+        while a page is expected to resolve more than one lead: a city of
+        more than max_pages pages is indexed in part when it has enough
+        leads, and is left to the per-lead search when it does not.
+        """
+        if not self.client.load_cookie():
+            return
+        # Until the total is known, never spend more pages than the searches they replace
+        max_pages = self.max_pages if leads is None else min(self.max_pages, leads)
+        entries = {}
+        url = f"{self.client.site_url}/api/v2/search"
+        headers = {"Accept": "application/json"}
+        pages = 0
+        total = None
+        while pages < max_pages:
+            params = search_params(city, start=pages * self.page_size, size=self.page_size, top_only=False)
+            response = self.client.get(url, params=params, headers=headers)
+            if response.status_code != 200:
+                print(f"City prefetch for {city} stopped with status code {response.status_code}")
+                break
+            data = response.json()
+            hits = data.get("hits", [])
+            pages += 1
+            for hit in hits:
+                self.add_hit(entries, city, hit)
+
+            if total is None:
+                total = data.get("total") or data.get("nbHits")
+                if isinstance(total, dict):
+                    total = total.get("value")
+                if total:
+                    if leads is not None and leads * self.page_size <= total:
+                        # A page of this city holds less than one of the leads on average
+                        print(f"{city}: {total} lawyers for {leads} leads, keeping the first page "
+                              f"and searching the other leads one by one")
+                        break
+                    max_pages = min(self.max_pages, math.ceil(total / self.page_size))
+                    if math.ceil(total / self.page_size) > max_pages:
+                        print(f"{city}: {total} lawyers, indexing the first {max_pages} pages "
+                              f"({max_pages * self.page_size / total:.0%} of them)")
+            if len(hits) < self.page_size or (total and pages * self.page_size >= total):
+                break
+
+        self.pages_fetched += pages
+        self.cities[city] = entries
+        self.built_at[city] = time.time()
+        print(f"Indexed {len(entries)} names in {city} from {pages} search pages")
+
+    def add_hit(self, entries, city, hit):
+        lawyer_id = hit.get("id")
+        key = name_key(hit_name(hit))
+        if not lawyer_id or not key:
+            return
+        # A query on the city name also matches lawyers from elsewhere
+        other_city = hit_city(hit)
+        if other_city and f" {city} " not in f" {other_city} ":
+            return
+        entry = (lawyer_id, hit.get("sermentDate", "Not found"))
+        if key in entries and (entries[key] is None or entries[key][0] != lawyer_id):
+            entries[key] = None  # Namesakes: leave it to the per-lead search
+        else:
+            entries[key] = entry
+
+    def resolve(self, first_name, last_name, city):
+        """Return (lawyer_id, oath_date) from the city's index, or None to search for the lead"""
+        entries = self.cities.get(city_key(city))
+        if entries is None:
+            return None
+        entry = entries.get(name_key(first_name, last_name))
+        with self.lock:
+            if entry:
+                self.resolved += 1
+                return entry
+            self.fallbacks += 1
+            return None
+
+    def report(self):
+        return (f"city index: {len(self.cities)} cities from {self.pages_fetched} pages, "
+                f"{self.resolved} leads resolved, {self.fallbacks} fell back to search")
@@ -0,0 +1,139 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import Counter
+
+# Lifecycle of a lead, in order
+QUEUED = "queued"
+FETCHED = "fetched"
+WRITTEN = "written"
+MOVED = "moved"
+DELETED = "deleted"
+FAILED = "failed"
+
+
+class LeadJournal:
+    """
+    Durable record of where each lead is in its lifecycle, keyed by the
+    normalized (first, last, city) identity. A lead that was fetched but not
+    yet written back keeps its result here, so a restart can write it without
+    fetching it again.
+    """
+
+    def __init__(self, path="lead_journal.sqlite3"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS leads (
+                key TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                result TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Rows sent to the processed sheet whose leads rows are not deleted yet
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS appends (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                start_row INTEGER NOT NULL,
+                rows TEXT NOT NULL,
+                keys TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def mark(self, key, state, result=None):
+        """Move a lead to `state`, storing its lookup result when one is given"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO leads (key, state, result, attempts, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, "
+                "result = COALESCE(excluded.result, leads.result), "
+                "attempts = leads.attempts + excluded.attempts, updated_at = excluded.updated_at",
+                (key, state, json.dumps(result) if result is not None else None,
+                 1 if state == FAILED else 0, time.time())
+            )
+            self.conn.commit()
+
+    def mark_many(self, keys, state):
+        keys = [key for key in keys if key]
+        if not keys:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE leads SET state = ?, updated_at = ? WHERE key = ?",
+                [(state, now, key) for key in keys]
+            )
+            self.conn.commit()
+
+    def get(self, key):
+        """Return (state, result, attempts) for a lead, or None if it was never journaled"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT state, result, attempts FROM leads WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        state, result, attempts = row
+        return state, json.loads(result) if result else None, attempts
+
+    def pending_result(self, key):
+        """
+        Return the stored result of a lead that was found but not yet deleted
+        from the leads sheet, so it can be written back without a new lookup
+        """
+        entry = self.get(key)
+        if not entry:
+            return None
+        state, result, _ = entry
+        if state in (FETCHED, WRITTEN, MOVED) and result and result[2]:
+            return tuple(result)
+        return None
+
+    def record_append(self, start_row, rows, keys):
+        """Record rows about to be written from start_row of the processed sheet; returns the record's id"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO appends (start_row, rows, keys, created_at) VALUES (?, ?, ?, ?)",
+                (start_row, json.dumps(rows), json.dumps(keys), time.time())
+            )
+            self.conn.commit()
+        return cursor.lastrowid
+
+    def unfinished_appends(self, before=None):
+        """Return (id, start_row, rows, keys) of appends recorded before `before` and not cleared"""
+        with self.lock:
+            records = self.conn.execute(
+                "SELECT id, start_row, rows, keys FROM appends WHERE created_at < ? ORDER BY id",
+                (before or time.time(),)
+            ).fetchall()
+        return [(append_id, start_row, json.loads(rows), json.loads(keys))
+                for append_id, start_row, rows, keys in records]
+
+    def clear_appends(self, ids):
+        """Forget appends whose leads rows have been deleted"""
+        if not ids:
+            return
+        with self.lock:
+            self.conn.executemany("DELETE FROM appends WHERE id = ?", [(append_id,) for append_id in ids])
+            self.conn.commit()
+
+    def summary(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM leads GROUP BY state").fetchall()
+        return Counter(dict(rows))
+
+    def compact(self):
+        """Forget leads that have been fully processed"""
+        with self.lock:
+            self.conn.execute("DELETE FROM leads WHERE state = ?", (DELETED,))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,121 @@
+import re
+from functools import lru_cache
+from lookup_cache import normalize_name
+
+TOKEN_SPLIT = re.compile(r"[\s\-'’.,]+")
+
+
+def name_tokens(value):
+    """Folded name parts: 'Dupont-Martin' -> ['dupont', 'martin']"""
+    return [token for token in TOKEN_SPLIT.split(normalize_name(value)) if token]
+
+
+@lru_cache(maxsize=65536)
+def trigrams(value):
+    padded = f"  {value} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def trigram_similarity(a, b):
+    """Jaccard similarity of the two strings' trigram sets, from 0 to 1"""
+    if a == b:
+        return 1.0
+    ta, tb = trigrams(a), trigrams(b)
+    return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+
+def token_similarity(token, candidates):
+    """
+    Best similarity of `token` to any of `candidates`. Folded names must be
+    equal to count fully; an initial matching its name counts 0.7, and a
+    merely similar name at most 0.5, since 'Julie' is not 'Julien'.
+    """
+    best = 0.0
+    for candidate in candidates:
+        if token == candidate:
+            return 1.0
+        if len(token) == 1 or len(candidate) == 1:
+            score = 0.7 if token[0] == candidate[0] else 0.0
+        else:
+            score = 0.5 * trigram_similarity(token, candidate)
+        best = max(best, score)
+    return best
+
+
+def hit_name(hit):
+    """Full name of a search hit, from whichever name fields it carries"""
+    if hit.get("firstName") or hit.get("lastName"):
+        return f"{hit.get('firstName') or ''} {hit.get('lastName') or ''}"
+    for field in ("name", "fullName", "displayName", "title"):
+        if hit.get(field):
+            return str(hit[field])
+    return ""
+
+
+def hit_city(hit):
+    for field in ("city", "barreau", "bar"):
+        if hit.get(field):
+            return " ".join(name_tokens(hit[field]))
+    return ""
+
+
+class LeadMatcher:
+    """
+    Score lawyer search hits against one lead. Names are compared after
+    accent and case folding, in any order, with hyphenated names split into
+    parts; the city is compared by trigram similarity. Hits scoring below
+    `threshold` are rejected before any further request is made for them.
+    """
+
+    city_weight = 0.25  # Share of the name score a hit from another city loses
+
+    def __init__(self, first_name, last_name, city, threshold=0.75):
+        self.first_tokens = name_tokens(first_name)
+        # A lone letter in a surname is a particle ('D'Argent'), not an initial
+        self.last_tokens = [token for token in name_tokens(last_name) if len(token) > 1] or name_tokens(last_name)
+        self.city = " ".join(name_tokens(city))
+        self.threshold = threshold
+
+    def name_score(self, tokens):
+        if not tokens or not self.last_tokens:
+            return 0.0
+        # One part of a hyphenated surname is enough ('Dupont-Martin' is listed as 'Dupont')
+        last = max(token_similarity(token, tokens) for token in self.last_tokens)
+        if not self.first_tokens:
+            return last
+        first = sum(token_similarity(token, tokens) for token in self.first_tokens) / len(self.first_tokens)
+        return 0.6 * last + 0.4 * first
+
+    def city_score(self, other_city):
+        if not self.city:
+            return 1.0
+        if f" {self.city} " in f" {other_city} ":  # 'dijon' in 'barreau de dijon'
+            return 1.0
+        return trigram_similarity(self.city, other_city)
+
+    def score(self, hit):
+        """Confidence from 0 to 1 that `hit` is this lead, or None if the hit carries no name"""
+        tokens = name_tokens(hit_name(hit))
+        if not tokens:
+            return None
+        name = self.name_score(tokens)
+        other_city = hit_city(hit)
+        if not other_city:
+            return name
+        # The city can only lower a name's score, never make up for a wrong name
+        return name * (1 - self.city_weight + self.city_weight * self.city_score(other_city))
+
+    def best(self, hits):
+        """
+        Return the best hit at or above the threshold, or None. Hits without
+        any name field cannot be checked, so when no hit has one the first
+        hit is returned as before.
+        """
+        best_hit, best_score = None, None
+        for hit in hits:
+            score = self.score(hit)
+            if score is not None and (best_score is None or score > best_score):
+                best_hit, best_score = hit, score
+        if best_score is None:
+            return hits[0] if hits else None
+        return best_hit if best_score >= self.threshold else None
@@ -0,0 +1,199 @@
+from array import array
+from functools import lru_cache
+from lookup_cache import identity_key
+
+# Columns the bot reads from a lead row; the others stay in the sheet
+LEAD_COLUMNS = ("First Name", "Last Name", "CITY", "NomBarreau", "doctrineURL", "Serment")
+# Columns with few distinct values: each distinct value is stored once per table
+INTERNED_COLUMNS = ("CITY", "NomBarreau")
+
+
+class ColumnMap(dict):
+    """
+    Header name -> position in one header row, like headers.index() but
+    computed once: the first column of a name wins, and a missing name
+    raises ValueError.
+    """
+
+    def __init__(self, headers):
+        super().__init__()
+        for i, name in enumerate(headers):
+            self.setdefault(name, i)
+        self.headers = tuple(headers)
+
+    def __missing__(self, name):
+        raise ValueError(f"'{name}' is not in the header row")
+
+    # Positions of the columns read on every row
+    @property
+    def first_name(self):
+        return self["First Name"]
+
+    @property
+    def last_name(self):
+        return self["Last Name"]
+
+    @property
+    def city(self):
+        return self["CITY"]
+
+    @property
+    def url(self):
+        return self["doctrineURL"]
+
+    @property
+    def serment(self):
+        return self["Serment"]
+
+
+@lru_cache(maxsize=32)
+def _column_map(headers):
+    return ColumnMap(headers)
+
+
+_last_map = (None, None)  # (header list, its ColumnMap) of the last call
+
+
+def column_map(headers):
+    """The ColumnMap of a header row, built once per header version"""
+    global _last_map
+    last_headers, columns = _last_map
+    if last_headers is not headers:
+        columns = _column_map(tuple(headers))
+        _last_map = (headers, columns)
+    return columns
+
+
+class _EmptyColumn:
+    """Stands in for a column a LeadTable does not keep"""
+
+    def __getitem__(self, offset):
+        return ""
+
+
+_EMPTY = _EmptyColumn()
+
+
+def normalize(value):
+    return "" if value is None else str(value).strip()
+
+
+class LeadRow:
+    """
+    View of one row of a LeadTable that reads like a full sheet row: row[i]
+    is the cell under headers[i], empty for columns the table does not keep.
+    """
+
+    __slots__ = ("table", "cells", "offset")
+
+    def __init__(self, table, offset):
+        self.table = table
+        self.cells = table.cells
+        self.offset = offset
+
+    def __getitem__(self, idx):
+        try:
+            return self.cells[idx][self.offset]
+        except TypeError:
+            if isinstance(idx, slice):
+                return list(self)[idx]
+            raise
+
+    def __len__(self):
+        return len(self.table.headers)
+
+    def __iter__(self):
+        offset = self.offset
+        for column in self.cells:
+            yield column[offset]
+
+    def get(self, name, default=""):
+        idx = self.table.map.get(name)
+        return default if idx is None else self[idx]
+
+    def full(self):
+        """The whole source row if the table kept it, else None"""
+        rows = self.table.rows
+        return None if rows is None else rows[self.offset]
+
+    def __repr__(self):
+        return f"LeadRow({self.table.row_numbers[self.offset]}, {list(self)!r})"
+
+
+class LeadTable:
+    """
+    The lead columns of a sheet, stored column by column with every cell
+    stripped once and the repetitive CITY and NomBarreau values shared.
+    Iterating yields (row_idx, LeadRow) pairs, like the list of rows it
+    replaces, and pending() iterates only rows still worth looking at.
+    """
+
+    def __init__(self, headers, columns=LEAD_COLUMNS):
+        self.headers = list(headers)
+        self.map = column_map(self.headers)
+        self.names = [name for name in columns if name in self.map]  # Columns kept, in slot order
+        self.columns = [[] for _ in self.names]
+        # Header index -> its column's cells, or a column that reads empty at every row
+        self.cells = [_EMPTY] * len(self.headers)
+        for name, column in zip(self.names, self.columns):
+            self.cells[self.map[name]] = column
+        self.shared = [{} if name in INTERNED_COLUMNS else None for name in self.names]  # value -> its one copy
+        self.row_numbers = array("l")  # Row index of each row (1 = first row under the header)
+        self.rows = None  # Full source rows by offset, when kept so moves need not read them back
+
+    @classmethod
+    def from_values(cls, headers, rows, start=1, columns=LEAD_COLUMNS, keep_rows=False):
+        """
+        Build a table from full rows (as get_all_values returns them, without
+        the header row). With keep_rows, LeadRow.full() returns the source rows.
+        """
+        table = cls(headers, columns)
+        indices = [table.map[name] for name in table.names]
+        for row_idx, row in enumerate(rows, start=start):
+            table.add(row_idx, [normalize(row[i]) if i < len(row) else "" for i in indices])
+        if keep_rows:
+            table.rows = rows
+        return table
+
+    def add(self, row_idx, cells):
+        """Append a row given its normalized cells in the order of self.names"""
+        for column, shared, value in zip(self.columns, self.shared, cells):
+            if shared is not None:
+                value = shared.setdefault(value, value)
+            column.append(value)
+        self.row_numbers.append(row_idx)
+
+    def __len__(self):
+        return len(self.row_numbers)
+
+    def __getitem__(self, offset):
+        if isinstance(offset, slice):
+            return [self[i] for i in range(*offset.indices(len(self)))]
+        if offset < 0:
+            offset += len(self)
+        return self.row_numbers[offset], LeadRow(self, offset)
+
+    def __iter__(self):
+        for offset, row_idx in enumerate(self.row_numbers):
+            yield row_idx, LeadRow(self, offset)
+
+    def column(self, name):
+        """The stored cells of one column (empty cells if the table does not keep it)"""
+        if name in self.names:
+            return self.columns[self.names.index(name)]
+        return [""] * len(self)
+
+    def pending(self, skip_url=None, skip_keys=None):
+        """
+        Yield (row_idx, LeadRow) for rows still to process: not those whose
+        doctrine URL makes skip_url(url) true, nor those whose lead identity
+        key is in skip_keys. Skipped rows never get a view.
+        """
+        urls = self.column("doctrineURL")
+        names = (self.column("First Name"), self.column("Last Name"), self.column("CITY"))
+        for offset, row_idx in enumerate(self.row_numbers):
+            if skip_url and urls[offset] and skip_url(urls[offset]):
+                continue
+            if skip_keys and identity_key(*(column[offset] for column in names)) in skip_keys:
+                continue
+            yield row_idx, LeadRow(self, offset)
@@ -0,0 +1,286 @@
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LeaseStore:
+    """
+    Interface shared by the lease backends. Workers claim leads by key for a
+    limited time; a lease that is not released before it expires can be
+    claimed by another worker, so a crashed worker never strands its rows.
+    """
+
+    def claim(self, keys, owner, ttl=600, limit=None):
+        """Claim up to `limit` of `keys` for `owner` and return the claimed keys"""
+        raise NotImplementedError
+
+    def renew(self, keys, owner, ttl=600):
+        raise NotImplementedError
+
+    def release(self, keys, owner, done=False, done_ttl=86400):
+        """Give leases back; `done` keys stay unclaimable for `done_ttl` seconds"""
+        raise NotImplementedError
+
+    def take_token(self, bucket, rate, burst=1, successes=0, increase=0.0, max_rate=None):
+        """
+        Take a token from a shared bucket. `rate` starts a new bucket; after
+        that the bucket's own rate is used, raised by `increase` for each of
+        the `successes` reported since the last call, up to `max_rate`.
+        Returns (0 if granted, else seconds to wait; the bucket's rate).
+        """
+        raise NotImplementedError
+
+    def throttle(self, bucket, rate, cooldown):
+        """Lower a shared bucket's rate to `rate` and hold every worker's tokens for `cooldown` seconds"""
+        raise NotImplementedError
+
+    def acquire_lock(self, name, owner, ttl=120, poll=0.5):
+        """Block until `owner` holds the named lock"""
+        while not self.claim([f"lock:{name}"], owner, ttl):
+            time.sleep(poll)
+
+    def release_lock(self, name, owner):
+        self.release([f"lock:{name}"], owner)
+
+
+class SQLiteLeaseStore(LeaseStore):
+    """Lease backend for workers on one host, sharing a local SQLite file"""
+
+    def __init__(self, path="leases.sqlite3"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT,
+                expires_at REAL NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                rate REAL,
+                paused_until REAL NOT NULL DEFAULT 0
+            )
+        """)
+        # Files from before the rate and cooldown were shared
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(buckets)")}
+        if "rate" not in columns:
+            self.conn.execute("ALTER TABLE buckets ADD COLUMN rate REAL")
+            self.conn.execute("ALTER TABLE buckets ADD COLUMN paused_until REAL NOT NULL DEFAULT 0")
+
+    def _transaction(self, func):
+        # BEGIN IMMEDIATE takes the write lock up front so claims never interleave
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(time.time())
+                self.conn.execute("COMMIT")
+                return result
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, keys, owner, ttl=600, limit=None):
+        def run(now):
+            claimed = []
+            for key in keys:
+                if limit is not None and len(claimed) >= limit:
+                    break
+                row = self.conn.execute(
+                    "SELECT owner, expires_at FROM leases WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now and row[0] != owner:
+                    continue
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO leases (key, owner, expires_at, done) VALUES (?, ?, ?, 0)",
+                    (key, owner, now + ttl)
+                )
+                claimed.append(key)
+            return claimed
+        return self._transaction(run)
+
+    def renew(self, keys, owner, ttl=600):
+        def run(now):
+            self.conn.executemany(
+                "UPDATE leases SET expires_at = ? WHERE key = ? AND owner = ?",
+                [(now + ttl, key, owner) for key in keys]
+            )
+        self._transaction(run)
+
+    def release(self, keys, owner, done=False, done_ttl=86400):
+        def run(now):
+            if done:
+                self.conn.executemany(
+                    "UPDATE leases SET owner = NULL, done = 1, expires_at = ? WHERE key = ? AND owner = ?",
+                    [(now + done_ttl, key, owner) for key in keys]
+                )
+            else:
+                self.conn.executemany(
+                    "DELETE FROM leases WHERE key = ? AND owner = ?", [(key, owner) for key in keys]
+                )
+        self._transaction(run)
+
+    def _bucket(self, bucket, rate, burst, now):
+        """(tokens, rate, paused_until) of a bucket, refilled up to now"""
+        row = self.conn.execute(
+            "SELECT tokens, updated_at, rate, paused_until FROM buckets WHERE name = ?", (bucket,)
+        ).fetchone()
+        if not row:
+            return float(burst), float(rate), 0.0
+        tokens, updated_at, shared_rate, paused_until = row
+        shared_rate = shared_rate or float(rate)
+        # Nothing refills during a cooldown
+        elapsed = max(0.0, now - max(updated_at, paused_until))
+        return min(burst, tokens + elapsed * shared_rate), shared_rate, paused_until
+
+    def _save_bucket(self, bucket, tokens, rate, paused_until, now):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO buckets (name, tokens, updated_at, rate, paused_until) VALUES (?, ?, ?, ?, ?)",
+            (bucket, tokens, now, rate, paused_until)
+        )
+
+    def take_token(self, bucket, rate, burst=1, successes=0, increase=0.0, max_rate=None):
+        def run(now):
+            tokens, shared_rate, paused_until = self._bucket(bucket, rate, burst, now)
+            if successes:
+                shared_rate += successes * increase
+                if max_rate is not None:
+                    shared_rate = min(float(max_rate), shared_rate)
+            if paused_until > now:
+                wait = paused_until - now
+            elif tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / shared_rate
+            self._save_bucket(bucket, tokens, shared_rate, paused_until, now)
+            return wait, shared_rate
+        return self._transaction(run)
+
+    def throttle(self, bucket, rate, cooldown):
+        def run(now):
+            _, shared_rate, paused_until = self._bucket(bucket, rate, 1, now)
+            self._save_bucket(bucket, 0.0, min(shared_rate, float(rate)), max(paused_until, now + cooldown), now)
+        self._transaction(run)
+
+    def purge(self):
+        """Delete expired leases"""
+        self._transaction(lambda now: self.conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,)))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CoordinatorLeaseStore(LeaseStore):
+    """Lease backend for workers on several hosts, talking to a coordinator service"""
+
+    def __init__(self, url, timeout=10):
+        import requests
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _call(self, method, **params):
+        response = self.session.post(f"{self.url}/{method}", json=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["result"]
+
+    def claim(self, keys, owner, ttl=600, limit=None):
+        return self._call("claim", keys=list(keys), owner=owner, ttl=ttl, limit=limit)
+
+    def renew(self, keys, owner, ttl=600):
+        self._call("renew", keys=list(keys), owner=owner, ttl=ttl)
+
+    def release(self, keys, owner, done=False, done_ttl=86400):
+        self._call("release", keys=list(keys), owner=owner, done=done, done_ttl=done_ttl)
+
+    def take_token(self, bucket, rate, burst=1, successes=0, increase=0.0, max_rate=None):
+        wait, shared_rate = self._call(
+            "take_token", bucket=bucket, rate=rate, burst=burst,
+            successes=successes, increase=increase, max_rate=max_rate
+        )
+        return wait, shared_rate
+
+    def throttle(self, bucket, rate, cooldown):
+        self._call("throttle", bucket=bucket, rate=rate, cooldown=cooldown)
+
+    def close(self):
+        self.session.close()
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    """JSON-over-HTTP front end for a SQLiteLeaseStore"""
+
+    store = None
+    methods = ("claim", "renew", "release", "take_token", "throttle")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        method = self.path.strip("/")
+        if method not in self.methods:
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+            body = json.dumps({"result": getattr(self.store, method)(**params)}).encode("utf-8")
+        except Exception as e:
+            self.send_error(400, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_coordinator(host="127.0.0.1", port=8765, path="leases.sqlite3"):
+    """Start the coordinator service in a background thread and return the server"""
+    handler = type("Handler", (CoordinatorHandler,), {"store": SQLiteLeaseStore(path)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def open_store(spec):
+    """Open a lease store from 'sqlite:<path>' or 'http://host:port'"""
+    if spec.startswith("http://") or spec.startswith("https://"):
+        return CoordinatorLeaseStore(spec)
+    if spec.startswith("sqlite:"):
+        spec = spec[len("sqlite:"):]
+    return SQLiteLeaseStore(spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the lease coordinator service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="leases.sqlite3")
+    args = parser.parse_args()
+
+    server = start_coordinator(args.host, args.port, args.db)
+    print(f"Lease coordinator listening on http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\nStopping the coordinator...")
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
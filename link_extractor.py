@@ -1,61 +1,219 @@
-from requests_html import HTMLSession
-import os
-import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+import lxml.html
+import metrics
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"
+
+# Tried in order; a pattern is only used when the ones before it found nothing
+LINK_XPATHS = (
+    # Pattern 1: Standard Bing search results
+    "//div[@class='b_tpcn']//a[@class='tilk']/@href",
+    # Pattern 2: Alternative Bing search results
+    "//li[@class='b_algo']//a/@href",
+    # Pattern 3: More generic approach
+    "//a[contains(@href, 'doctrine.fr')]/@href",
+)
+
+
+def find_profile_link(html):
+    """Return the first doctrine.fr lawyer profile link in a Bing result page, or None"""
+    if not html:
+        return None
+    try:
+        tree = lxml.html.fromstring(html)
+    except Exception:
+        return None
+
+    links = []
+    for xpath in LINK_XPATHS:
+        links.extend(tree.xpath(xpath))
+        if links:
+            break
+
+    # Check for doctrine.fr links that are lawyer profiles
+    for link in links:
+        if "https://www.doctrine.fr/" in link and "/p/avocat/" in link:
+            return link
+    return None
+
+
+class PageRenderer:
+    """
+    One long-lived headless Chromium (pyppeteer, as used by requests-html)
+    with a small pool of open tabs, reused across calls from any thread. The
+    browser runs on its own event loop thread and is only launched the first
+    time a page actually needs rendering.
+    """
+
+    def __init__(self, pages=2, timeout=30):
+        self.pages = pages  # Tabs kept open, i.e. pages rendered at the same time
+        self.timeout = timeout  # Seconds allowed for a page to load
+        self.lock = threading.Lock()
+        self.loop = None
+        self.browser = None
+        self.idle = None  # Queue of tabs not rendering anything
+        self.launch_error = None  # Why the browser could not start; not retried
+
+    def start(self):
+        with self.lock:
+            if self.loop:
+                return
+            if self.launch_error:
+                raise RuntimeError(f"browser unavailable: {self.launch_error}")
+            try:
+                from pyppeteer import launch  # Imported here so runs that never render skip it
+            except ImportError as e:
+                self.launch_error = e
+                raise
+
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True).start()
+
+            async def open_browser():
+                # Signal handlers can only be installed from the main thread
+                browser = await launch(
+                    headless=True, args=["--no-sandbox"],
+                    handleSIGINT=False, handleSIGTERM=False, handleSIGHUP=False
+                )
+                idle = asyncio.Queue()
+                for _ in range(self.pages):
+                    idle.put_nowait(await browser.newPage())
+                return browser, idle
+
+            try:
+                self.browser, self.idle = asyncio.run_coroutine_threadsafe(open_browser(), loop).result()
+            except Exception as e:
+                self.launch_error = e
+                loop.call_soon_threadsafe(loop.stop)
+                raise
+            self.loop = loop
+            print(f"Browser started with {self.pages} pages")
+
+    async def _render(self, url):
+        page = await self.idle.get()
+        try:
+            await page.goto(url, timeout=self.timeout * 1000)
+            return await page.content()
+        except Exception:
+            # The tab may be left mid-navigation; swap it for a fresh one
+            try:
+                await page.close()
+            except Exception:
+                pass
+            page = await self.browser.newPage()
+            raise
+        finally:
+            self.idle.put_nowait(page)
+
+    def render(self, url):
+        """Load url in a pooled tab and return the rendered HTML"""
+        self.start()
+        with metrics.span("link_render"):
+            future = asyncio.run_coroutine_threadsafe(self._render(url), self.loop)
+            return future.result(self.timeout + 5)
+
+    def close(self):
+        with self.lock:
+            if not self.loop:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self.browser.close(), self.loop).result(10)
+            except Exception as e:
+                print(f"Error closing browser: {str(e)}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = self.browser = self.idle = None
+
+
+class LinkExtractor:
+    """
+    Find doctrine.fr profile links on Bing result pages. The raw HTML is
+    searched first; the page is only rendered in the shared browser when the
+    raw HTML has no profile link, as the links are usually in it already.
+    """
+
+    def __init__(self, pool_size=8, render_pages=2, render_timeout=30, render=True):
+        self.render_enabled = render  # False never starts a browser
+        self.renderer = PageRenderer(pages=render_pages, timeout=render_timeout)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = render_timeout
+
+    def extract(self, url):
+        """Return the first doctrine.fr lawyer profile link on the page at url, or None"""
+        try:
+            with metrics.span("link_fetch"):
+                response = self.session.get(url, timeout=self.timeout)
+            link = find_profile_link(response.text)
+            if link:
+                metrics.inc("link_extract_total", path="raw")
+                return link
+            if not self.render_enabled:
+                metrics.inc("link_extract_total", path="none")
+                return None
+
+            # Try to render the JavaScript content
+            try:
+                link = find_profile_link(self.renderer.render(url))
+            except Exception as e:
+                print(f"Error rendering page: {str(e)}")
+                link = None
+            metrics.inc("link_extract_total", path="rendered" if link else "none")
+            return link
+
+        except Exception as e:
+            print(f"Error extracting links: {str(e)}")
+            return None
+
+    def extract_many(self, urls, max_concurrency=8):
+        """Extract links from several pages at once; results are in the order of urls"""
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            return list(executor.map(self.extract, urls))
+
+    def close(self):
+        self.renderer.close()
+        self.session.close()
+
+
+_default_extractor = None
+_default_lock = threading.Lock()
+
+def get_extractor():
+    """Return the process-wide LinkExtractor, creating it on first use"""
+    global _default_extractor
+    with _default_lock:
+        if _default_extractor is None:
+            _default_extractor = LinkExtractor()
+        return _default_extractor
 
 def extract_and_check_links(url):
     """
     Extract links from a Bing search result and find the first doctrine.fr link
-    
+
     Args:
         url (str): The Bing search URL
-        
+
     Returns:
         str or None: The first doctrine.fr link found, or None if no link is found
     """
-    try:
-        session = HTMLSession()
-        response = session.get(url)
-        
-        # Try to render the JavaScript content
-        try:
-            response.html.render(timeout=30)
-        except Exception as e:
-            print(f"Error rendering page: {str(e)}")
-            # Continue with the HTML we have
-        
-        # Try different XPath patterns to find links
-        links = []
-        
-        # Pattern 1: Standard Bing search results
-        links.extend(response.html.xpath("//div[@class='b_tpcn']//a[@class='tilk']/@href"))
-        
-        # Pattern 2: Alternative Bing search results
-        if not links:
-            links.extend(response.html.xpath("//li[@class='b_algo']//a/@href"))
-            
-        # Pattern 3: More generic approach
-        if not links:
-            links.extend(response.html.xpath("//a[contains(@href, 'doctrine.fr')]/@href"))
-        
-        # Check for doctrine.fr links
-        for link in links:
-            if "https://www.doctrine.fr/" in link:
-                # Check if it's a lawyer profile
-                if "/p/avocat/" in link:
-                    return link
-        
-        # If no lawyer profile found, return any doctrine.fr link
-        # for link in links:
-        #     if "https://www.doctrine.fr/" in link:
-        #         return link
-                
-        return None
-        
-    except Exception as e:
-        print(f"Error extracting links: {str(e)}")
-        return None
-    finally:
-        session.close()
+    return get_extractor().extract(url)
+
+def extract_and_check_links_many(urls, max_concurrency=8):
+    """
+    Like extract_and_check_links for a list of Bing search URLs, looked up
+    concurrently through one pooled session and browser
+
+    Returns:
+        list: The link found for each URL, or None, in the order of urls
+    """
+    return get_extractor().extract_many(urls, max_concurrency)
+
 if __name__ == "__main__":
     # Example usage
     url_to_check = "https://www.bing.com/search?q=Aur%C3%A9lia+BADY+AGEN+doctrine.fr"
@@ -63,4 +221,5 @@ if __name__ == "__main__":
     if matching_link:
         print("Matching link found:", matching_link)
     else:
-        print("No matching link found.")
\ No newline at end of file
+        print("No matching link found.")
+    get_extractor().close()
@@ -0,0 +1,120 @@
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+
+
+def normalize_name(value):
+    """Fold accents and case and collapse whitespace: 'Aurélia  Bady' -> 'aurelia bady'"""
+    value = unicodedata.normalize("NFKD", str(value or ""))
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return " ".join(value.casefold().split())
+
+
+def identity_key(first_name, last_name, city):
+    return "|".join(normalize_name(part) for part in (first_name, last_name, city))
+
+
+class LookupCache:
+    """
+    On-disk cache of doctrine.fr lookups keyed by normalized (first, last, city).
+    Found lawyers are kept for `ttl` seconds, "Not found" answers for the
+    shorter `negative_ttl`.
+    """
+
+    def __init__(self, path="lookup_cache.sqlite3", ttl=30 * 24 * 3600, negative_ttl=3 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS lookups (
+                key TEXT PRIMARY KEY,
+                lawyer_id TEXT,
+                oath_date TEXT,
+                specialties TEXT,
+                url TEXT,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS read_keys (
+                lawyer_id TEXT PRIMARY KEY,
+                read_key TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, first_name, last_name, city):
+        """Return a cached (specialties, oath_date, url) result, or None if missing or expired"""
+        key = identity_key(first_name, last_name, city)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT oath_date, specialties, url, fetched_at FROM lookups WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                oath_date, specialties, url, fetched_at = row
+                ttl = self.ttl if url else self.negative_ttl
+                if time.time() - fetched_at < ttl:
+                    self.hits += 1
+                    return json.loads(specialties), oath_date, url
+            self.misses += 1
+            return None
+
+    def put(self, first_name, last_name, city, result):
+        specialties, oath_date, url = result
+        lawyer_id = url.rstrip("/").rsplit("/", 1)[-1] if url else None
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO lookups (key, lawyer_id, oath_date, specialties, url, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (identity_key(first_name, last_name, city), lawyer_id, oath_date,
+                 json.dumps(list(specialties or [])), url, time.time())
+            )
+            self.conn.commit()
+
+    def get_read_key(self, lawyer_id):
+        """Return the stored readKey for a lawyer's /decisions endpoint, if any"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT read_key FROM read_keys WHERE lawyer_id = ?", (lawyer_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_read_key(self, lawyer_id, read_key):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO read_keys (lawyer_id, read_key, fetched_at) VALUES (?, ?, ?)",
+                (lawyer_id, read_key, time.time())
+            )
+            self.conn.commit()
+
+    def drop_read_key(self, lawyer_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM read_keys WHERE lawyer_id = ?", (lawyer_id,))
+            self.conn.commit()
+
+    def purge_expired(self):
+        """Delete entries past their TTL"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM lookups WHERE (url IS NOT NULL AND fetched_at < ?) "
+                "OR (url IS NULL AND fetched_at < ?)",
+                (now - self.ttl, now - self.negative_ttl)
+            )
+            self.conn.commit()
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        return f"lookup cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate)"
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
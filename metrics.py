@@ -0,0 +1,244 @@
+import json
+import time
+import bisect
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds; requests range from a cache hit to a Retry-After pause
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    """Thread-safe counters and latency histograms, keyed by name and labels"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.gauges = {}  # (name, labels) -> last value set
+        self.started_at = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time the block into the `<name>_seconds` histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def render(self):
+        """Prometheus text exposition of every counter and histogram"""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (other, labels), value in sorted(self.counters.items()):
+                    if other == name:
+                        lines.append(f"{name}{label_text(labels)} {value}")
+            for name in sorted({name for name, _ in self.gauges}):
+                lines.append(f"# TYPE {name} gauge")
+                for (other, labels), value in sorted(self.gauges.items()):
+                    if other == name:
+                        lines.append(f"{name}{label_text(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (other, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if other != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{label_text(labels)} {histogram.total:.6f}")
+                    lines.append(f"{name}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Plain dict of the current values, with p50/p95 per histogram"""
+        def key_text(name, labels):
+            return name + "".join(f",{k}={v}" for k, v in labels)
+
+        with self.lock:
+            return {
+                "time": time.time(),
+                "uptime": time.time() - self.started_at,
+                "counters": {key_text(*key): value for key, value in self.counters.items()},
+                "gauges": {key_text(*key): value for key, value in self.gauges.items()},
+                "histograms": {
+                    key_text(*key): {
+                        "count": h.count, "sum": round(h.total, 6),
+                        "p50": h.quantile(0.5), "p95": h.quantile(0.95),
+                    }
+                    for key, h in self.histograms.items()
+                },
+            }
+
+
+registry = Registry()
+inc = registry.inc
+set_gauge = registry.set
+observe = registry.observe
+span = registry.span
+
+
+class LeadProfiler:
+    """
+    Profile the next N leads with cProfile when requested. Each profiled call
+    gets its own profiler so calls on worker threads are covered; only one
+    runs at a time (newer Pythons allow a single active profiler), so calls
+    overlapping it run unprofiled and leads are sampled one after another.
+    The stats are merged and written to `path` once N leads were profiled.
+    """
+
+    def __init__(self, path="profile.pstats"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.run_lock = threading.Lock()  # Held by the call being profiled
+        self.remaining = 0
+        self.stats = None
+
+    def request(self, leads):
+        with self.lock:
+            self.remaining = leads
+            self.stats = None
+        print(f"Profiling the next {leads} leads")
+
+    def active(self):
+        return self.remaining > 0
+
+    def run(self, func, *args, **kwargs):
+        """Call func, profiling it if profiling was requested and no other call is being profiled"""
+        return self._run(False, func, args, kwargs)
+
+    def run_lead(self, func, *args, **kwargs):
+        """Like run(), counting a profiled call as one of the N leads"""
+        return self._run(True, func, args, kwargs)
+
+    def _run(self, counts, func, args, kwargs):
+        if not self.active() or not self.run_lock.acquire(blocking=False):
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            self.run_lock.release()
+            self._add(profile, counts)
+
+    def _add(self, profile, counts):
+        with self.lock:
+            if self.remaining <= 0:
+                return
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+            if counts:
+                self.remaining -= 1
+            if self.remaining:
+                return
+            stats, self.stats = self.stats, None
+        stats.dump_stats(self.path)
+        print(f"Profile written to {self.path}; top functions by cumulative time:")
+        stats.sort_stats("cumulative").print_stats(20)
+
+
+profiler = LeadProfiler()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics for Prometheus text, GET /profile?leads=N to profile the next N leads"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            body = registry.render()
+        elif url.path == "/profile":
+            leads = int(parse_qs(url.query).get("leads", ["50"])[0])
+            profiler.request(leads)
+            body = f"profiling the next {leads} leads into {profiler.path}\n"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(port=9108, host="127.0.0.1"):
+    """Serve /metrics and /profile from a background thread and return the server"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def start_snapshots(path="metrics.jsonl", interval=60):
+    """Append a JSON snapshot of every metric to `path` every `interval` seconds"""
+    stopped = threading.Event()
+
+    def write():
+        while not stopped.wait(interval):
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registry.snapshot()) + "\n")
+
+    threading.Thread(target=write, daemon=True).start()
+    return stopped
@@ -0,0 +1,123 @@
+import time
+import queue
+import threading
+import metrics
+
+DONE = object()  # End-of-input marker passed down the stages
+
+
+class Stage:
+    """One step of a Pipeline: `workers` threads applying `func` to items from a bounded queue"""
+
+    def __init__(self, name, func, workers=1, queue_size=32):
+        self.name = name
+        self.func = func  # item -> item for the next stage, or None to drop it
+        self.workers = workers
+        self.inbox = queue.Queue(maxsize=queue_size)  # Full inbox blocks the stage before it
+        self.next = None
+        self.threads = []
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.busy = 0.0  # Seconds spent inside func, summed over workers
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        self.started_at = time.time()
+        self.threads = [
+            threading.Thread(target=self.run, name=f"{self.name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            metrics.set_gauge("pipeline_queue_depth", self.inbox.qsize(), stage=self.name)
+            if item is DONE:
+                return
+            start = time.perf_counter()
+            try:
+                result = self.func(item)
+            except Exception as e:
+                # Stage functions handle their own errors; this only keeps the thread alive
+                print(f"⚠️ {self.name} stage error: {str(e)}")
+                result = None
+            elapsed = time.perf_counter() - start
+            metrics.observe("pipeline_stage_seconds", elapsed, stage=self.name)
+            with self.lock:
+                self.processed += 1
+                self.busy += elapsed
+            if result is not None and self.next:
+                self.next.inbox.put(result)
+
+    def finish(self):
+        """Stop the workers once every queued item has been handled"""
+        for _ in self.threads:
+            self.inbox.put(DONE)
+        for thread in self.threads:
+            thread.join()
+        self.finished_at = time.time()
+
+    def throughput(self):
+        elapsed = (self.finished_at or time.time()) - (self.started_at or time.time())
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        return (f"{self.name}: {self.processed} items, {self.throughput():.2f}/s, "
+                f"queue {self.inbox.qsize()}/{self.inbox.maxsize}, busy {self.busy:.1f}s")
+
+
+class Pipeline:
+    """
+    Stages connected by bounded queues, each running in its own threads, so
+    slow steps overlap instead of waiting on each other. A full queue blocks
+    the stage feeding it, which keeps a slow stage from being buried in work.
+    """
+
+    def __init__(self, queue_size=32):
+        self.queue_size = queue_size
+        self.stages = []
+
+    def add_stage(self, name, func, workers=1):
+        stage = Stage(name, func, workers=workers, queue_size=self.queue_size)
+        if self.stages:
+            self.stages[-1].next = stage
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, item):
+        """Feed an item to the first stage, blocking while its queue is full"""
+        self.stages[0].inbox.put(item)
+
+    def finish(self):
+        """Drain the stages in order and stop their threads"""
+        for stage in self.stages:
+            stage.finish()
+
+    def run(self, items, report_every=None):
+        """Feed `items` through every stage and wait for them; print progress every `report_every` seconds"""
+        stopped = threading.Event()
+        if report_every:
+            def monitor():
+                while not stopped.wait(report_every):
+                    print(f"Pipeline: {self.report()}")
+            threading.Thread(target=monitor, daemon=True).start()
+        self.start()
+        try:
+            for item in items:
+                self.put(item)
+        finally:
+            self.finish()
+            stopped.set()
+
+    def depths(self):
+        return {stage.name: stage.inbox.qsize() for stage in self.stages}
+
+    def report(self):
+        return "; ".join(stage.report() for stage in self.stages)
@@ -0,0 +1,264 @@
+import time
+import heapq
+import itertools
+import threading
+import metrics
+from email.utils import parsedate_to_datetime
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket shared by everything that talks to one service.
+    `rate` is the sustained number of requests per second and `burst` the
+    number that may be sent back to back after an idle period.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def parse_retry_after(value):
+    """Return the delay in seconds from a Retry-After header, or None"""
+    if not value:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttle_error(error):
+    """True if an exception from an API client means the request was rate limited"""
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return "Quota exceeded" in str(error) or "429" in str(error)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    Token bucket whose rate adapts to the service: every successful request
+    adds `increase` requests/s up to `max_rate` (additive increase) and every
+    throttled one multiplies the rate by `decrease` (multiplicative decrease)
+    and pauses all callers for Retry-After, or for an exponential cooldown
+    when the service gives no hint.
+    """
+
+    def __init__(self, rate, min_rate=0.05, max_rate=None, increase=0.05, decrease=0.5,
+                 burst=1, base_cooldown=5, max_cooldown=300, max_retries=5, name="service"):
+        super().__init__(rate, burst)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate if max_rate is not None else rate)
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self.base_cooldown = float(base_cooldown)
+        self.max_cooldown = float(max_cooldown)
+        self.max_retries = max_retries
+        self.name = name
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self.throttle_count = 0
+        self.success_count = 0
+
+    def acquire(self):
+        """Block until any cooldown is over and a request may be sent"""
+        with metrics.span("rate_limit_wait", service=self.name):
+            while True:
+                with self.lock:
+                    wait = self.paused_until - time.monotonic()
+                if wait <= 0:
+                    break
+                time.sleep(wait)
+            super().acquire()
+
+    def on_success(self):
+        with self.lock:
+            self.success_count += 1
+            self.consecutive_throttles = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        """Slow down after a rate-limited request and return the cooldown in seconds"""
+        with self.lock:
+            self.throttle_count += 1
+            self.consecutive_throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            if retry_after is None:
+                cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** (self.consecutive_throttles - 1))
+            else:
+                cooldown = min(self.max_cooldown, retry_after)
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + cooldown)
+            self.tokens = 0.0
+            self.updated_at = now
+        metrics.inc("throttled_total", service=self.name)
+        metrics.observe("cooldown_seconds", cooldown, service=self.name)
+        print(f"\n⚠️ {self.name} rate limit hit! Pausing {cooldown:.1f} seconds, rate now {self.rate:.2f} requests/s")
+        return cooldown
+
+    def current_rate(self):
+        return self.rate
+
+    def report(self):
+        return (f"{self.name}: {self.rate:.2f} requests/s "
+                f"({self.success_count} ok, {self.throttle_count} rate limited)")
+
+    def call(self, description, func, *args, **kwargs):
+        """Run an API call within the budget, retrying when it is rate limited"""
+        retry_count = 0
+        while True:
+            self.acquire()
+            try:
+                with metrics.span("api_call", service=self.name, op=description):
+                    result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_throttle_error(e):
+                    raise e
+                retry_count += 1
+                metrics.inc("retries_total", service=self.name)
+                response = getattr(e, "response", None)
+                headers = getattr(response, "headers", None) or {}
+                self.on_throttle(parse_retry_after(headers.get("Retry-After")))
+                if retry_count >= self.max_retries:
+                    raise Exception(f"Max retries ({self.max_retries}) exceeded for API quota limit while {description}")
+                print(f"Retrying {description} ({retry_count}/{self.max_retries})")
+                continue
+            self.on_success()
+            return result
+
+
+class SharedRateLimiter(AdaptiveRateLimiter):
+    """
+    Adaptive limiter whose budget is shared by several worker processes
+    through a lease store's token bucket, so adding workers does not
+    multiply the request rate. The rate and any cooldown live in the
+    bucket too: a worker that is throttled slows every worker down and
+    pauses them all for the Retry-After.
+    """
+
+    def __init__(self, store, bucket, rate, **kwargs):
+        super().__init__(rate, **kwargs)
+        self.store = store
+        self.bucket = bucket
+        self.successes = 0  # Successes not yet added to the shared rate
+
+    def acquire(self):
+        super().acquire()
+        with metrics.span("shared_bucket_wait", service=self.name):
+            while True:
+                with self.lock:
+                    successes, self.successes = self.successes, 0
+                wait, rate = self.store.take_token(
+                    self.bucket, self.rate, self.burst,
+                    successes=successes, increase=self.increase, max_rate=self.max_rate
+                )
+                with self.lock:
+                    self.rate = rate
+                if wait <= 0:
+                    return
+                time.sleep(wait)
+
+    def on_success(self):
+        super().on_success()
+        with self.lock:
+            self.successes += 1
+
+    def on_throttle(self, retry_after=None):
+        cooldown = super().on_throttle(retry_after)
+        self.store.throttle(self.bucket, self.rate, cooldown)
+        return cooldown
+
+
+class FairQueue:
+    """
+    Weighted fair queuing in front of one shared limiter. Requests from
+    several flows (one per sheet) wait in a single queue ordered by virtual
+    finish time, so while flows have requests waiting each gets a share of
+    the limiter's rate in proportion to its weight, and the share of an idle
+    flow goes to the others.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.condition = threading.Condition()
+        self.virtual_time = 0.0  # Finish tag of the request last let through
+        self.finish = {}  # flow -> finish tag of its latest request
+        self.waiting = []  # Heap of (finish tag, sequence, flow)
+        self.sequence = itertools.count()
+        self.busy = False  # A request is waiting on the limiter
+        self.granted = {}  # flow -> requests let through
+
+    def acquire(self, flow, weight=1.0):
+        """Block until it is this flow's turn and the shared limiter lets a request through"""
+        with self.condition:
+            tag = max(self.virtual_time, self.finish.get(flow, 0.0)) + 1.0 / weight
+            self.finish[flow] = tag
+            entry = (tag, next(self.sequence), flow)
+            heapq.heappush(self.waiting, entry)
+            while self.busy or self.waiting[0] is not entry:
+                self.condition.wait()
+            heapq.heappop(self.waiting)
+            self.busy = True
+            self.virtual_time = tag
+        try:
+            self.limiter.acquire()
+        finally:
+            with self.condition:
+                self.busy = False
+                self.granted[flow] = self.granted.get(flow, 0) + 1
+                self.condition.notify_all()
+
+    def share(self, flow):
+        """Fraction of the requests let through so far that went to flow"""
+        with self.condition:
+            total = sum(self.granted.values())
+            return self.granted.get(flow, 0) / total if total else 0.0
+
+
+class FairShareLimiter:
+    """
+    One flow's view of a FairQueue: acquire() waits for the flow's turn,
+    everything else (AIMD feedback, cooldowns, counters) is the shared
+    limiter's, so a 429 seen by one sheet slows every sheet down.
+    """
+
+    def __init__(self, queue, flow, weight=1.0):
+        self.queue = queue
+        self.flow = flow
+        self.weight = float(weight)
+
+    def __getattr__(self, name):
+        return getattr(self.queue.limiter, name)
+
+    def acquire(self):
+        self.queue.acquire(self.flow, self.weight)
+
+    def call(self, description, func, *args, **kwargs):
+        return AdaptiveRateLimiter.call(self, description, func, *args, **kwargs)
+
+    def report(self):
+        return (f"{self.queue.limiter.report()}; {self.flow}: weight {self.weight:g}, "
+                f"{self.queue.share(self.flow):.0%} of requests")
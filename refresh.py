@@ -0,0 +1,337 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import Counter
+from sheet_writer import SheetWriteBuffer
+from specialty_extractor import read_next_data, iter_subcategories, top_specialties, search_params, USER_AGENT, READ_KEY_REJECTED
+from lead_matcher import LeadMatcher
+import metrics
+
+SPECIALTY_HEADERS = [f"speciality {i}" for i in range(1, 6)]
+REFRESH_HEADERS = ["First Name", "Last Name", "CITY", "doctrineURL"] + SPECIALTY_HEADERS + ["Serment"]
+# What a full reprocess requests for every lawyer
+FULL_REQUESTS = ("search", "page", "decisions")
+
+
+def content_hash(decisions_data):
+    """Hash of the (category, count) aggregate a /decisions payload is reduced to"""
+    aggregate = sorted(iter_subcategories(decisions_data))
+    return hashlib.sha1(json.dumps(aggregate, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def lawyer_id_from_url(url):
+    """The lawyer ID of a doctrine.fr profile URL (/p/avocat/<id>), or None"""
+    url = (url or "").strip()
+    if "/p/avocat/" not in url:
+        return None
+    return url.rstrip("/").rsplit("/", 1)[-1] or None
+
+
+class RefreshState:
+    """
+    SQLite record of each processed lawyer's last re-check: the validators
+    /decisions answered with (ETag, Last-Modified), the content hash of its
+    aggregate and when it was checked. Also keeps the size of full responses
+    per endpoint, to compare with a full reprocess across runs.
+    """
+
+    def __init__(self, path="refresh_state.sqlite3"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS checks (
+                lawyer_id TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                checked_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sizes (
+                endpoint TEXT PRIMARY KEY,
+                bytes INTEGER NOT NULL,
+                responses INTEGER NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, lawyer_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, content_hash FROM checks WHERE lawyer_id = ?", (lawyer_id,)
+            ).fetchone()
+        if not row:
+            return {}
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2]}
+
+    def checked_at(self):
+        """lawyer ID -> time of the last check, for every lawyer checked so far"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT lawyer_id, checked_at FROM checks"))
+
+    def put(self, lawyer_id, etag, last_modified, content_hash):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checks (lawyer_id, etag, last_modified, content_hash, checked_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (lawyer_id, etag, last_modified, content_hash, time.time())
+            )
+            self.conn.commit()
+
+    def add_size(self, endpoint, size):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO sizes (endpoint, bytes, responses) VALUES (?, ?, 1) "
+                "ON CONFLICT(endpoint) DO UPDATE SET bytes = bytes + excluded.bytes, responses = responses + 1",
+                (endpoint, size)
+            )
+            self.conn.commit()
+
+    def average_sizes(self):
+        """endpoint -> average bytes of a full response"""
+        with self.lock:
+            return {endpoint: total / responses for endpoint, total, responses
+                    in self.conn.execute("SELECT endpoint, bytes, responses FROM sizes") if responses}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class Refresher:
+    """
+    Re-check processed lawyers a batch at a time, oldest check first. Each
+    check is one /decisions request, made conditional with the validators of
+    the previous check; when the endpoint ignores them, the content hash of
+    the aggregate tells whether anything changed. The profile page is only
+    fetched when no readKey is stored, and the search only for rows without
+    an oath date. Rows whose top-5 specialties or Serment changed are
+    rewritten in one batched update.
+    """
+
+    def __init__(self, client, processed_sheet, state, rate_limiter=None, batch_size=50,
+                 max_age=30 * 24 * 3600):
+        self.client = client  # DoctrineClient whose session, readKeys and budget are used
+        self.processed_sheet = processed_sheet
+        self.state = state
+        self.rate_limiter = rate_limiter  # Shared Sheets budget
+        self.batch_size = batch_size  # Lawyers checked per batch
+        self.max_age = max_age  # Seconds before a checked lawyer is due again
+        self.counts = Counter()  # Outcomes, requests and bytes of this run
+
+    def _call(self, description, func, *args, **kwargs):
+        if self.rate_limiter:
+            return self.rate_limiter.call(description, func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def read_rows(self):
+        """Return (headers, rows) of the processed sheet, with only REFRESH_HEADERS filled in"""
+        from gspread.utils import rowcol_to_a1
+
+        headers = [h.strip() for h in self._call("reading processed headers", self.processed_sheet.row_values, 1)]
+        indices = [headers.index(name) for name in REFRESH_HEADERS]
+        ranges = []
+        for idx in indices:
+            letter = rowcol_to_a1(1, idx + 1).rstrip("0123456789")
+            ranges.append(f"{letter}2:{letter}")
+        results = self._call(
+            "reading processed rows", self.processed_sheet.batch_get, ranges, major_dimension="COLUMNS"
+        )
+        columns = [list(result[0]) if result else [] for result in results]
+        rows = []
+        for offset in range(max((len(col) for col in columns), default=0)):
+            row = [""] * len(headers)
+            for idx, col in zip(indices, columns):
+                if offset < len(col) and col[offset] is not None:
+                    row[idx] = str(col[offset])
+            rows.append((offset + 1, row))
+        return headers, rows
+
+    def record(self, endpoint, response, size=None):
+        """Count a request and its body bytes"""
+        if size is None:
+            size = len(response.content)
+        self.counts["requests"] += 1
+        self.counts["bytes"] += size
+        metrics.inc("refresh_requests_total", endpoint=endpoint, status=response.status_code)
+        if response.status_code == 200:
+            self.state.add_size(endpoint, size)
+
+    def fetch_read_key(self, lawyer_id, url):
+        headers = {
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "User-Agent": USER_AGENT,
+            "Referer": self.client.site_url,
+        }
+        response = self.client.get(url, headers=headers, stream=True)
+        length = int(response.headers.get("Content-Length") or 0)
+        json_data = read_next_data(response) if response.status_code == 200 else None
+        response.close()
+        self.record("page", response, length or len(json_data or ""))
+        if not json_data:
+            return None
+        try:
+            read_key = json.loads(json_data)["props"]["pageProps"]["readKey"]
+        except (KeyError, ValueError):
+            # A CAPTCHA page; the lawyer is tried again in the next batch
+            return None
+        self.client.store_read_key(lawyer_id, read_key)
+        return read_key
+
+    def fetch_decisions(self, lawyer_id, url, previous):
+        """
+        Return (decisions data, or None when not modified, response headers).
+        A rejected readKey (not a throttled one) is replaced from the profile
+        page once.
+        """
+        validators = {}
+        if previous.get("etag"):
+            validators["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            validators["If-Modified-Since"] = previous["last_modified"]
+        response = None
+        for _ in range(2):
+            read_key = self.client.get_read_key(lawyer_id) or self.fetch_read_key(lawyer_id, url)
+            if not read_key:
+                raise RuntimeError("no readKey on the profile page")
+            response = self.client.get_decisions(
+                lawyer_id, read_key, url, throttle_statuses=(429,), validators=validators
+            )
+            self.record("decisions", response)
+            if response.status_code == 304:
+                return None, response.headers
+            if response.status_code == 200:
+                return response.json(), response.headers
+            if response.status_code not in READ_KEY_REJECTED:
+                break
+            self.client.drop_read_key(lawyer_id)
+        raise RuntimeError(f"decisions request failed with status {response.status_code}")
+
+    def find_oath_date(self, lawyer_id, first_name, last_name, city):
+        """Search the lawyer again for an oath date that was missing; None if there still is none"""
+        response = self.client.get(
+            f"{self.client.site_url}/api/v2/search",
+            params=search_params(f"{first_name} {last_name} {city}"),
+            headers={"Accept": "application/json", "User-Agent": USER_AGENT}
+        )
+        self.record("search", response)
+        if response.status_code != 200:
+            return None
+        hit = LeadMatcher(first_name, last_name, city).best(response.json().get("hits", []))
+        if not hit or hit.get("id") != lawyer_id:
+            return None
+        oath_date = hit.get("sermentDate")
+        return oath_date if oath_date and oath_date != "Not found" else None
+
+    def check(self, lawyer_id, row, headers):
+        """
+        Re-check one lawyer. Returns (the cells of their rows that changed,
+        empty if none; the (etag, last_modified, content_hash) to save once
+        those cells are written).
+        """
+        url = f"{self.client.site_url}/p/avocat/{lawyer_id}"
+        previous = self.state.get(lawyer_id)
+        data, response_headers = self.fetch_decisions(lawyer_id, url, previous)
+        changed = {}
+        digest = previous.get("content_hash")
+        if data is None:
+            self.counts["not_modified"] += 1
+        else:
+            digest = content_hash(data)
+            if digest == previous.get("content_hash"):
+                self.counts["same_hash"] += 1
+            else:
+                specialties = (top_specialties(data) + ["None"] * 5)[:5]
+                current = [row[headers.index(name)].strip() for name in SPECIALTY_HEADERS]
+                if specialties != current:
+                    changed.update(zip(SPECIALTY_HEADERS, specialties))
+
+        if row[headers.index("Serment")].strip() in ("", "Not found"):
+            oath_date = self.find_oath_date(
+                lawyer_id, *(row[headers.index(name)].strip() for name in ("First Name", "Last Name", "CITY"))
+            )
+            if oath_date:
+                changed["Serment"] = oath_date
+        seen = (
+            response_headers.get("ETag") or previous.get("etag"),
+            response_headers.get("Last-Modified") or previous.get("last_modified"), digest
+        )
+        return changed, seen
+
+    def run_batch(self):
+        """Re-check up to batch_size lawyers that are due and rewrite the rows that changed"""
+        headers, rows = self.read_rows()
+        by_lawyer = {}
+        for row_idx, row in rows:
+            lawyer_id = lawyer_id_from_url(row[headers.index("doctrineURL")])
+            if lawyer_id:
+                by_lawyer.setdefault(lawyer_id, []).append((row_idx, row))
+        checked_at = self.state.checked_at()
+        now = time.time()
+        due = sorted(
+            (checked_at.get(lawyer_id, 0.0), lawyer_id) for lawyer_id in by_lawyer
+            if now - checked_at.get(lawyer_id, 0.0) >= self.max_age
+        )[:self.batch_size]
+        if not due:
+            print(f"Refresh: none of the {len(by_lawyer)} processed lawyers is due")
+            return
+
+        writer = SheetWriteBuffer(
+            self.processed_sheet, self.processed_sheet, max_pending=float("inf"), max_age=float("inf"),
+            rate_limiter=self.rate_limiter
+        )
+        # What was seen of changed lawyers is only saved once their rows are written,
+        # so a failed write leaves them looking changed to the next batch
+        written = []
+        for _, lawyer_id in due:
+            lawyer_rows = by_lawyer[lawyer_id]
+            self.counts["checked"] += 1
+            try:
+                changed, seen = self.check(lawyer_id, lawyer_rows[0][1], headers)
+            except Exception as e:
+                self.counts["failed"] += 1
+                metrics.inc("refresh_total", outcome="failed")
+                print(f"Refresh of {lawyer_id} failed: {str(e)}")
+                continue
+            metrics.inc("refresh_total", outcome="changed" if changed else "unchanged")
+            if not changed:
+                self.state.put(lawyer_id, *seen)
+            else:
+                written.append((lawyer_id, seen))
+                self.counts["changed"] += 1
+                print(f"Refreshed {lawyer_id}: {', '.join(changed)} changed")
+                for row_idx, row in lawyer_rows:
+                    writer.queue_update(row_idx, row, headers, changed)
+                    self.counts["rewritten"] += 1
+        writer.flush()
+        for lawyer_id, seen in written:
+            self.state.put(lawyer_id, *seen)
+        print(f"Refresh: {self.report()}")
+
+    def full_cost(self):
+        """(requests, bytes) a full reprocess of the lawyers checked so far would take"""
+        checked = self.counts["checked"]
+        sizes = self.state.average_sizes()
+        size = sum(sizes.get(endpoint, 0) for endpoint in FULL_REQUESTS)
+        return checked * len(FULL_REQUESTS), int(checked * size)
+
+    def report(self):
+        counts = self.counts
+        full_requests, full_bytes = self.full_cost()
+        saved = 1 - counts["requests"] / full_requests if full_requests else 0.0
+        sizes = self.state.average_sizes()
+        unsampled = [endpoint for endpoint in FULL_REQUESTS if endpoint not in sizes]
+        note = f" (no {' or '.join(unsampled)} response sized yet)" if unsampled else ""
+        return (f"{counts['checked']} lawyers checked, {counts['not_modified']} not modified, "
+                f"{counts['same_hash']} unchanged by content hash, {counts['changed']} changed "
+                f"({counts['rewritten']} rows rewritten), {counts['failed']} failed; "
+                f"{counts['requests']} requests and {counts['bytes'] / 1024:.0f} KB instead of "
+                f"{full_requests} requests and {full_bytes / 1024:.0f} KB{note} for a full reprocess, "
+                f"{saved:.0%} fewer requests")
+
+    def close(self):
+        self.state.close()
@@ -0,0 +1,147 @@
+import time
+import heapq
+import random
+import sqlite3
+import threading
+from collections import Counter
+
+# Why a lead has to be retried
+NETWORK_ERROR = "network"
+RATE_LIMITED = "rate_limit"
+NOT_FOUND = "not_found"
+CAPTCHA = "captcha"
+
+# (first delay, longest delay) in seconds; the delay doubles with each attempt
+DELAYS = {
+    NETWORK_ERROR: (60, 3600),
+    RATE_LIMITED: (300, 2 * 3600),
+    NOT_FOUND: (24 * 3600, 30 * 24 * 3600),
+    CAPTCHA: (600, 6 * 3600),
+}
+
+
+class RetryScheduler:
+    """
+    Delay queue of leads waiting to be retried, ordered by the time they are
+    next due. Each failure pushes the lead back by a delay that doubles per
+    attempt, starting and capped per failure type. The schedule is kept in
+    SQLite so it survives restarts; a heap keeps finding due leads cheap.
+    With shared=True, other processes (coordinated workers) schedule in the
+    same file, so a lead's due time is read from it rather than from memory.
+    """
+
+    def __init__(self, path="retry_schedule.sqlite3", delays=None, jitter=0.1, shared=False):
+        self.path = path
+        self.delays = dict(DELAYS, **(delays or {}))
+        self.jitter = jitter  # Random share added to each delay so retries spread out
+        self.shared = shared  # Other processes write the same schedule
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS retries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                due_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.due_at = {}  # key -> due time of leads still waiting
+        self.heap = []  # (due_at, key); entries no longer matching due_at are skipped
+        for key, due_at in self.conn.execute("SELECT key, due_at FROM retries"):
+            self.due_at[key] = due_at
+            self.heap.append((due_at, key))
+        heapq.heapify(self.heap)
+
+    def schedule(self, key, kind):
+        """Push a failed lead back by its next delay and return the time it is due"""
+        with self.lock:
+            # Read and write in one transaction so two workers cannot both count an attempt
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute(
+                "SELECT kind, attempts, due_at FROM retries WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[0] == kind and row[2] > time.time():
+                # Already pushed back for this failure, by another worker or an earlier row
+                self.conn.commit()
+                self._remember(key, row[2])
+                return row[2]
+            # A different failure starts its own backoff from the first delay
+            attempts = row[1] + 1 if row and row[0] == kind else 1
+            first, longest = self.delays[kind]
+            delay = min(longest, first * 2 ** (attempts - 1))
+            due_at = time.time() + delay * (1 + random.uniform(0, self.jitter))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO retries (key, kind, attempts, due_at) VALUES (?, ?, ?, ?)",
+                (key, kind, attempts, due_at)
+            )
+            self.conn.commit()
+            self._remember(key, due_at)
+        return due_at
+
+    def _remember(self, key, due_at):
+        """Keep a due time read or written in the file in memory (lock held)"""
+        if due_at is None:
+            self.due_at.pop(key, None)
+        elif self.due_at.get(key) != due_at:
+            self.due_at[key] = due_at
+            heapq.heappush(self.heap, (due_at, key))
+
+    def get_due_at(self, key):
+        """When a lead is next due, or None if it is not scheduled"""
+        if not self.shared:
+            return self.due_at.get(key)
+        with self.lock:
+            row = self.conn.execute("SELECT due_at FROM retries WHERE key = ?", (key,)).fetchone()
+            due_at = row[0] if row else None
+            self._remember(key, due_at)
+        return due_at
+
+    def clear(self, key):
+        """Forget a lead that succeeded"""
+        with self.lock:
+            self.conn.execute("DELETE FROM retries WHERE key = ?", (key,))
+            self.conn.commit()
+            self.due_at.pop(key, None)
+
+    def is_known(self, key):
+        return self.get_due_at(key) is not None
+
+    def waiting(self, key, now=None):
+        """True while a lead's retry is not yet due"""
+        due_at = self.get_due_at(key)
+        return due_at is not None and due_at > (now or time.time())
+
+    def pop_due(self, now=None):
+        """Return the keys of leads whose retry is due, in due order"""
+        now = now or time.time()
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due_at, key = heapq.heappop(self.heap)
+                if self.due_at.get(key) == due_at:
+                    due.append(key)
+        return due
+
+    def requeue(self, keys):
+        """Put popped keys that were not handled back in the queue at their due time"""
+        with self.lock:
+            for key in keys:
+                due_at = self.due_at.get(key)
+                if due_at is not None:
+                    heapq.heappush(self.heap, (due_at, key))
+
+    def summary(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT kind, COUNT(*) FROM retries GROUP BY kind").fetchall()
+        return Counter(dict(rows))
+
+    def report(self):
+        counts = self.summary()
+        if not counts:
+            return "retries: none scheduled"
+        return "retries: " + ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items()))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,42 +1,72 @@
 import time
 import sys
-import gspread
-from google.oauth2.service_account import Credentials
 import specialty_extractor
 import re
-from time import sleep
-import random
 import os
-from seleniumbase import SB
+import socket
+import contextlib
+from sheet_writer import SheetWriteBuffer
+from sheet_scanner import SheetScanner
+from rate_limiter import AdaptiveRateLimiter, SharedRateLimiter, FairShareLimiter
+from async_extractor import AsyncLookupEngine
+from lookup_cache import LookupCache, identity_key
+from journal import LeadJournal, QUEUED, FETCHED, FAILED
+from city_index import CityIndex
+from pipeline import Pipeline
+from retry_scheduler import RetryScheduler
+from bulk_store import ResultStore, BulkWriteBuffer, read_table
+from refresh import Refresher, RefreshState
+from lead_table import LeadTable, LeadRow, column_map
+import retry_scheduler
+import metrics
+from browser_session import get_browser
+
+def authorize_sheets(credentials_file):
+    """Return a gspread client for a service account credentials file"""
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    scope = [
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive"
+    ]
+    creds = Credentials.from_service_account_file(credentials_file, scopes=scope)
+    return gspread.authorize(creds)
+
 
 def login():
-    user_data_dir = os.path.join(os.getcwd(), 'user_data')
-    extension_dir = os.path.join(os.getcwd(), 'extension')
-    
-    # Using the SeleniumBase context manager
-    with SB(user_data_dir=user_data_dir, extension_dir=extension_dir) as sb:
-        sb.open("https://www.doctrine.fr/inscription")
-        input("Press Enter After login")
+    # The browser stays open afterwards for the session check and CAPTCHAs
+    get_browser().login()
 
 
 def again_checker():
-    user_data_dir = os.path.join(os.getcwd(), 'user_data')
-    extension_dir = os.path.join(os.getcwd(), 'extension')
-    
-    # Using the SeleniumBase context manager
-    with SB(user_data_dir=user_data_dir, extension_dir=extension_dir) as sb:
-        sb.open("https://www.doctrine.fr/dashboard")
-        input("Press Enter After login")
+    get_browser().check_login()
+
+
+def ensure_session(client, allow_browser=True):
+    """
+    Check the saved doctrine.fr session with one request and only open the
+    browser to log in when it is no longer valid. Returns True once logged in.
+    """
+    if client.check_session():
+        print("Saved doctrine.fr session is valid")
+        return True
+    if not allow_browser:
+        print("⚠️ The saved doctrine.fr session is not valid; log in with run_bot.py first")
+        return False
+    login()
+    print("Checking again if session is saved")
+    again_checker()
+    return client.check_session()
 
 
 class LeadProcessor:
-    def __init__(self, sheet_id, sheet_name, delay=60):
+    def __init__(self, sheet_id, sheet_name, delay=60, lease_store=None, worker_id=None, shared=None, weight=1.0):
         self.credentials_file = 'credentials.json'
         self.sheet_id = sheet_id
         self.sheet_name = sheet_name
         self.delay = float(delay)
         self.should_stop = False
-        self.base_delay = 80
         self.max_retries = 5
         self.processed_sheet_name = "processed_lawyers"
         self.connection_retry_delay = 300
@@ -44,15 +74,105 @@ class LeadProcessor:
         self.processed_urls = set()  # Successfully processed URLs
         self.failed_urls = {}  # Track failed URLs and their attempt counts
         self.max_url_attempts = 3  # Maximum attempts per URL before skipping
+        self.write_batch_size = 50  # Rows buffered before writing back to the sheet
+        self.write_batch_age = 30  # Seconds a buffered row may wait before writing back
+        self.writer = None
+        self.request_rate = 2.0  # Starting doctrine.fr requests per second, shared by all lookups
+        self.max_request_rate = 5.0  # Ceiling the adaptive rate may climb to
+        self.lookup_concurrency = 4  # Leads looked up at the same time (1 = one by one)
+        # Coordinated mode: several workers lease rows from a shared store
+        self.lease_store = lease_store
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_batch_size = 20  # Leads claimed at a time
+        self.lease_ttl = 600  # Seconds before an unreleased lease can be claimed by another worker
+        self.moved_keys = set()  # Leads queued for the processed sheet since the last release
+        # Scheduled mode: several sheets in one process share a client, cache and budgets
+        self.shared = shared
+        self.weight = float(weight)  # This sheet's share of the budgets against the other sheets
+        if shared:
+            flow = f"{sheet_name} ({sheet_id})"
+            self.doctrine_limiter = FairShareLimiter(shared.doctrine_queue, flow, self.weight)
+            self.sheets_limiter = FairShareLimiter(shared.sheets_queue, flow, self.weight)
+        elif lease_store:
+            # The budget lives in the lease store, so it is shared by all workers
+            self.doctrine_limiter = SharedRateLimiter(
+                lease_store, "doctrine.fr", self.request_rate, max_rate=self.max_request_rate,
+                max_retries=self.max_retries, name="doctrine.fr"
+            )
+            self.sheets_limiter = SharedRateLimiter(
+                lease_store, "sheets", 1.0, max_rate=5.0, base_cooldown=30,
+                max_retries=self.max_retries, name="Google Sheets"
+            )
+        else:
+            self.doctrine_limiter = AdaptiveRateLimiter(
+                self.request_rate, max_rate=self.max_request_rate,
+                max_retries=self.max_retries, name="doctrine.fr"
+            )
+            self.sheets_limiter = AdaptiveRateLimiter(
+                1.0, max_rate=5.0, base_cooldown=30,
+                max_retries=self.max_retries, name="Google Sheets"
+            )
+        self.cache = shared.cache if shared else LookupCache("lookup_cache.sqlite3")  # Survives restarts
+        # Where each lead is in its lifecycle, and when failed and not-found leads are retried
+        self.journal = LeadJournal(self.state_path("lead_journal.sqlite3"))
+        self.retries = RetryScheduler(self.state_path("retry_schedule.sqlite3"), shared=bool(lease_store))
+        self.retrying = set()  # Keys of leads whose retry is due this cycle; they skip the lookup cache
+        if shared:
+            self.client = shared.client.view(self.doctrine_limiter)
+        else:
+            self.client = specialty_extractor.DoctrineClient(
+                rate_limiter=self.doctrine_limiter, cache=self.cache
+            )
+        # Leads of dense cities are resolved from one paged search per city
+        self.client.city_index = CityIndex(self.client)
+        # Login and CAPTCHA steps share one browser, which hands its cookies to the client
+        self.browser = get_browser()
+        self.browser.attach(self.client)
+        self.client.browser = self.browser
+        self.engine = AsyncLookupEngine(self.client, max_concurrency=self.lookup_concurrency)
+        # Lookups and sheet writes run in overlapping stages; False processes batch by batch
+        self.pipelined = True
+        self.pipeline_queue_size = 32  # Items each stage may queue before the one feeding it waits
+        self.pipeline = None  # Pipeline of the current cycle, for its depth and throughput
+        self.pipeline_report_interval = 60  # Seconds between stage depth/throughput reports
+        self.metrics_port = None  # Serve Prometheus metrics on localhost:<port> when set
+        self.metrics_file = None  # Append JSON metric snapshots to this file when set
+        self.metrics_interval = 60  # Seconds between snapshots
+        self.profile_leads = 0  # Profile this many leads with cProfile at startup (0 = off)
+        # Only fetch key columns and process new or changed rows (always on in coordinated mode)
+        self.incremental_scan = True
+        self.scanner = None
+        # Bulk mode: one pass over a CSV/Parquet export (or "sheet" to read the sheet once), with
+        # results kept in a local store and uploaded to the sheets in a few large writes
+        self.bulk_source = None
+        self.bulk_store = self.state_path("bulk_results.jsonl")
+        self.bulk_upload = True  # False keeps the results in the local store only
+        self.bulk_upload_interval = None  # Seconds between uploads (None = once, at the end of the pass)
+        self.bulk_chunk_rows = 10000  # Stored results sent per batched Sheets write
+        # Refresh: re-check processed lawyers a batch at a time and rewrite only what changed
+        self.refresh_interval = None  # Seconds between refresh batches (None = never refresh)
+        self.refresh_batch_size = 50  # Lawyers re-checked per batch
+        self.refresh_age = 30 * 24 * 3600  # Seconds before a processed lawyer is due for a re-check
+        self.refresher = None
+        self.last_refresh = 0.0
+
+    def state_path(self, filename):
+        """Where a per-sheet state file lives: the working directory, or the sheet's own state directory"""
+        if not self.shared:
+            return filename
+        return self.shared.state_path(self.sheet_id, self.sheet_name, filename)
+
+    def processed_lock(self):
+        """Lock of the processed sheet when other sheets in this process use it too, else None"""
+        if not self.shared:
+            return None
+        return self.shared.processed_lock(self.sheet_id, self.processed_sheet_name)
 
     def setup_google_sheets(self):
-        scope = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
+        import gspread
+
         try:
-            creds = Credentials.from_service_account_file(self.credentials_file, scopes=scope)
-            client = gspread.authorize(creds)
+            client = self.shared.sheets_client() if self.shared else authorize_sheets(self.credentials_file)
             spreadsheet = client.open_by_key(self.sheet_id)
             
             # Get the main sheet
@@ -63,18 +183,20 @@ class LeadProcessor:
                 return None, None
 
             # Check if processed_lawyers sheet exists, if not create it
-            try:
-                processed_sheet = spreadsheet.worksheet(self.processed_sheet_name)
-            except gspread.exceptions.WorksheetNotFound:
-                print(f"Creating new sheet '{self.processed_sheet_name}'...")
-                processed_sheet = spreadsheet.add_worksheet(
-                    title=self.processed_sheet_name,
-                    rows=1000,
-                    cols=20
-                )
-                # Copy headers from main sheet
-                headers = leads_sheet.row_values(1)
-                processed_sheet.update('A1', [headers])
+            # (once, when other sheets of the spreadsheet are set up at the same time)
+            with self.processed_lock() or contextlib.nullcontext():
+                try:
+                    processed_sheet = spreadsheet.worksheet(self.processed_sheet_name)
+                except gspread.exceptions.WorksheetNotFound:
+                    print(f"Creating new sheet '{self.processed_sheet_name}'...")
+                    processed_sheet = spreadsheet.add_worksheet(
+                        title=self.processed_sheet_name,
+                        rows=1000,
+                        cols=20
+                    )
+                    # Copy headers from main sheet
+                    headers = leads_sheet.row_values(1)
+                    processed_sheet.update('A1', [headers])
                 
             return leads_sheet, processed_sheet
             
@@ -82,204 +204,611 @@ class LeadProcessor:
             print(f"Error setting up Google Sheets: {str(e)}")
             return None, None
 
-    def update_sheet_with_backoff(self, leads_sheet, update_cells):
+    def flush_writes(self, final=False):
+        """Write buffered results back to the sheets"""
+        try:
+            with metrics.span("sheets_flush", final=final):
+                if self.lease_store:
+                    self.flush_shared()
+                else:
+                    self.writer.flush(final=final)
+        except Exception as e:
+            metrics.inc("flush_errors_total")
+            print(f"Error writing results to sheet: {str(e)}")
+
+    def flush_shared(self):
         """
-        Update sheet with exponential backoff retry mechanism
+        Write back while holding the sheet lock. Other workers may have deleted
+        rows since our scan, so pending rows are re-located by lead identity
+        first, and moved rows are deleted before the lock is released.
         """
-        retry_count = 0
-        while retry_count < self.max_retries:
-            try:
-                leads_sheet.update_cells(update_cells)
-                return True
-            except Exception as e:
-                if "Quota exceeded" in str(e) or "429" in str(e):
-                    retry_count += 1
-                    if retry_count == self.max_retries:
-                        raise Exception(f"Max retries ({self.max_retries}) exceeded for API quota limit")
-                    
-                    # Calculate delay with exponential backoff and jitters
-                    delay = min(300, self.base_delay * (2 ** retry_count) + random.uniform(0, 10))
-                    print(f"\n⚠️ Rate limit hit! Waiting {delay:.1f} seconds before retry {retry_count}/{self.max_retries}")
-                    sleep(delay)
-                else:
-                    raise e
-        return False
+        if not self.writer.pending_count() and not self.writer.pending_deletes:
+            return
+        with metrics.span("sheet_lock_wait"):
+            self.lease_store.acquire_lock("sheet", self.worker_id, ttl=self.lease_ttl)
+        try:
+            self.writer.relocate(self.scanner.locate())
+            self.writer.flush(final=True)
+        finally:
+            self.lease_store.release_lock("sheet", self.worker_id)
 
-    def move_to_processed(self, leads_sheet, processed_sheet, row_idx, row_data):
-        """Move a row to the processed sheet with exponential backoff"""
-        retry_count = 0
-        while retry_count < self.max_retries:
-            try:
-                # Get the next empty row in processed sheet
-                processed_values = processed_sheet.get_all_values()
-                next_row = len(processed_values) + 1
-
-                # Add row to processed sheet
-                processed_sheet.insert_row(row_data, next_row)
-                print(f"Successfully moved row {row_idx+1} to processed sheet")
-                return True
-                
-            except Exception as e:
-                if "Quota exceeded" in str(e) or "429" in str(e):
-                    retry_count += 1
-                    if retry_count == self.max_retries:
-                        print(f"Max retries ({self.max_retries}) exceeded for moving row to processed sheet")
-                        return False
-                    
-                    # Calculate delay with exponential backoff and jitter
-                    delay = min(300, self.base_delay * (2 ** retry_count) + random.uniform(0, 10))
-                    print(f"\n⚠️ Rate limit hit while moving to processed sheet! Waiting {delay:.1f} seconds before retry {retry_count}/{self.max_retries}")
-                    sleep(delay)
-                else:
-                    print(f"Error moving row to processed sheet: {str(e)}")
-                    return False
+    def claim_rows(self, rows, headers):
+        """Lease the leads of up to lease_batch_size rows and return the rows this worker now owns"""
+        columns = column_map(headers)
+        keys = [identity_key(row[columns.first_name], row[columns.last_name], row[columns.city]) for _, row in rows]
+        claimed = set(self.lease_store.claim(
+            list(dict.fromkeys(keys)), self.worker_id, ttl=self.lease_ttl, limit=self.lease_batch_size
+        ))
+        # Another worker may have pushed a lead back since this one scanned it
+        waiting = [key for key in claimed if self.retries.waiting(key)]
+        if waiting:
+            self.lease_store.release(waiting, self.worker_id)
+            claimed.difference_update(waiting)
+        owned = []
+        for (row_idx, row), key in zip(rows, keys):
+            if key in claimed:
+                owned.append((row_idx, row, key))
+            elif self.scanner:
+                # Another worker holds it; look at it again next cycle in case that worker dies
+                self.scanner.forget(row)
+        return owned, claimed
+
+    def release_claims(self, claimed):
+        done = [key for key in claimed if key in self.moved_keys]
+        retry = [key for key in claimed if key not in self.moved_keys]
+        if done:
+            self.lease_store.release(done, self.worker_id, done=True)
+        if retry:
+            self.lease_store.release(retry, self.worker_id)
+        self.moved_keys.difference_update(done)
+
+    def prepare_lead(self, row_idx, row, headers):
+        """Return (first_name, last_name, city, current_url) if the row needs a lookup, else None"""
+        # Column positions are computed once per header row
+        columns = column_map(headers)
         
-        return False
+        # Extract data (LeadTable cells are already stripped)
+        first_name = row[columns.first_name]
+        last_name = row[columns.last_name]
+        city = row[columns.city]
+        current_url = row[columns.url]
+
+        # Check if URL is already processed or has failed too many times
+        if current_url and "doctrine.fr/p/avocat" in current_url:
+            if current_url in self.processed_urls:
+                print(f"Skipping already processed: {first_name} {last_name} ({current_url})")
+                return None
+            if current_url in self.failed_urls:
+                attempts = self.failed_urls[current_url]
+                if attempts >= self.max_url_attempts:
+                    print(f"Skipping {current_url} after {attempts} failed attempts")
+                    return None
+                print(f"Retrying {current_url} (attempt {attempts + 1}/{self.max_url_attempts})")
+            print(f"Starting new: {first_name} {last_name} ({current_url})")
+
+        if not first_name or not last_name or not city:
+            print(f"Missing required data for row {row_idx+1}")
+            return None
+
+        print(f"Processing: {first_name} {last_name} in {city}")
+        return first_name, last_name, city, current_url
+
+    def check_result(self, result):
+        """Return (values, missing): the cells to write for a lookup result and what it lacks to be moved"""
+        specialties, oath_date, lawyer_url = result
+
+        # Build the new cell values
+        values = {}
+        for i in range(1, 6):
+            specialty_value = "None"
+            if specialties and i <= len(specialties):
+                specialty_value = specialties[i - 1]
+            values[f"speciality {i}"] = specialty_value
+        values["Serment"] = oath_date
+        values["doctrineURL"] = lawyer_url
+
+        # Check the row as it will look once written
+        url_value = str(lawyer_url or "").strip()
+        oath_date_value = str(oath_date or "").strip()
+        missing_items = []
+        if not url_value or url_value in ["None", "Not found"]:
+            missing_items.append("URL")
+        if not oath_date_value or oath_date_value == "Not found":
+            missing_items.append("oath date")
+        return values, missing_items
+
+    def apply_result(self, row_idx, row, headers, lead, result, checked=None):
+        """Queue the sheet updates for a looked-up lead"""
+        first_name, last_name, city, current_url = lead
+        lawyer_url = result[2]
+        values, missing_items = checked or self.check_result(result)
+
+        # A LeadRow only holds the lead columns; a move copies its source row when the table kept it
+        full_row = row.full() if isinstance(row, LeadRow) else row
+
+        # Queue the update
+        with metrics.span("queue_result"):
+            updated_row = metrics.profiler.run(
+                self.writer.queue_update,
+                row_idx, row if full_row is None else full_row, headers, values,
+                journal_key=identity_key(first_name, last_name, city)
+            )
+        if self.scanner:
+            self.scanner.replace(row, updated_row)
+
+        if not missing_items:
+            # Move to processed sheet and delete on the next flush
+            self.writer.queue_move(
+                row_idx, updated_row, key=str(lawyer_url).strip(), partial=full_row is None
+            )
+            print(f"Row {row_idx+1} queued for move to processed sheet")
+            key = identity_key(first_name, last_name, city)
+            self.moved_keys.add(key)
+            if self.retries.is_known(key):
+                self.retries.clear(key)
+        else:
+            print(f"Row {row_idx+1} kept for retry: Missing {' and '.join(missing_items)}")
+            # A lookup that answered but lacks a field counts as not found
+            failure = self.client.last_failure(first_name, last_name, city) or retry_scheduler.NOT_FOUND
+            self.schedule_retry(identity_key(first_name, last_name, city), failure)
+
+        if self.writer.should_flush():
+            metrics.profiler.run(self.flush_writes)
+        
+        metrics.inc("leads_total", outcome="moved" if not missing_items else "kept")
+        print(f"Successfully processed {first_name} {last_name}")
+        
+        # Add URL to processed set if successful
+        if lawyer_url:
+            self.processed_urls.add(lawyer_url)
+            if lawyer_url in self.failed_urls:
+                del self.failed_urls[lawyer_url]  # Remove from failed URLs if successful
+            print(f"Added to processed: {lawyer_url}")
+
+    def lookup_lead(self, lead):
+        """Return the journaled result of a lead fetched before a restart, or look it up"""
+        key = identity_key(*lead[:3])
+        result = self.journal.pending_result(key)
+        if result:
+            metrics.inc("journal_resumed_total")
+            print(f"Resuming from journal: {lead[0]} {lead[1]} in {lead[2]}")
+            return result
+        self.journal.mark(key, QUEUED)
+        result = metrics.profiler.run_lead(self.client.lookup, *lead[:3], fresh=key in self.retrying)
+        self.journal.mark(key, FETCHED, result)
+        return result
+
+    def schedule_retry(self, key, failure):
+        """Push a lead back in the retry queue, once per cycle even if it has duplicate rows"""
+        if self.retries.waiting(key):
+            return
+        due_at = self.retries.schedule(key, failure)
+        print(f"Retrying after {failure} failure at {time.strftime('%Y-%m-%d %H:%M', time.localtime(due_at))}")
+
+    def record_failure(self, row_idx, row, lead, error):
+        """Count a failed lookup against the row's URL and schedule the row to be picked up again"""
+        current_url = lead[3] if lead else ""
+        metrics.inc("leads_total", outcome="failed")
+        print(f"Error processing row {row_idx+1}: {str(error)}")
+        if lead:
+            key = identity_key(*lead[:3])
+            self.journal.mark(key, FAILED)
+            self.schedule_retry(key, retry_scheduler.NETWORK_ERROR)
+        elif self.scanner:
+            self.scanner.forget(row)
+        if current_url and "doctrine.fr/p/avocat" in current_url:
+            self.failed_urls[current_url] = self.failed_urls.get(current_url, 0) + 1
+            print(f"Added {current_url} to failed URLs (attempt {self.failed_urls[current_url]})")
 
     def process_single_lead(self, leads_sheet, processed_sheet, row_idx, row, headers):
         """Process a single lead"""
+        lead = None
         try:
-            # Extract indices and basic data
-            first_name_index = headers.index("First Name")
-            last_name_index = headers.index("Last Name")
-            city_index = headers.index("CITY")
-            url_index = headers.index("doctrineURL")
-            specialty_indices = []
-            for i in range(1, 6):
-                specialty_indices.append(headers.index(f"speciality {i}"))
-            serment_index = headers.index("Serment")
-            
-            # Extract data
-            first_name = row[first_name_index].strip()
-            last_name = row[last_name_index].strip()
-            city = row[city_index].strip()
-            current_url = row[url_index].strip() if url_index < len(row) else ""
-
-            # Check if URL is already processed or has failed too many times
-            if current_url and "doctrine.fr/p/avocat" in current_url:
-                if current_url in self.processed_urls:
-                    print(f"Skipping already processed: {first_name} {last_name} ({current_url})")
-                    return
-                if current_url in self.failed_urls:
-                    attempts = self.failed_urls[current_url]
-                    if attempts >= self.max_url_attempts:
-                        print(f"Skipping {current_url} after {attempts} failed attempts")
-                        return
-                    print(f"Retrying {current_url} (attempt {attempts + 1}/{self.max_url_attempts})")
-                print(f"Starting new: {first_name} {last_name} ({current_url})")
-
-            if not first_name or not last_name or not city:
-                print(f"Missing required data for row {row_idx+1}")
+            lead = self.prepare_lead(row_idx, row, headers)
+            if not lead:
                 return
-
-            print(f"Processing: {first_name} {last_name} in {city}")
             
             # Extract specialties and oath date
-            specialties, oath_date, lawyer_url = specialty_extractor.extract_lawyer_data(
-                first_name, last_name, city
-            )
-
-            # Initialize update cells
-            update_cells = []
-            
-            # Update specialties (up to 5)
-            for i, idx in enumerate(specialty_indices):
-                specialty_value = "None"
-                if specialties and i < len(specialties):
-                    specialty_value = specialties[i]
-                update_cells.append(gspread.Cell(row_idx+1, idx+1, specialty_value))
-            
-            # Update oath date and URL
-            update_cells.append(gspread.Cell(row_idx+1, serment_index+1, oath_date))
-            update_cells.append(gspread.Cell(row_idx+1, url_index+1, lawyer_url))
-            
-            # Update the sheet
-            if update_cells:
-                self.update_sheet_with_backoff(leads_sheet, update_cells)
-                updated_row = leads_sheet.row_values(row_idx + 1)
-                
-                # Check if we have both valid URL and oath date
-                url_value = updated_row[url_index].strip()
-                oath_date_value = updated_row[serment_index].strip()
-                
-                has_valid_url = url_value and url_value not in ["None", "Not found"]
-                has_valid_oath = oath_date_value and oath_date_value != "Not found"
-                
-                if has_valid_url and has_valid_oath:
-                    # Move to processed sheet and delete
-                    if self.move_to_processed(leads_sheet, processed_sheet, row_idx, updated_row):
-                        try:
-                            leads_sheet.delete_rows(row_idx + 1)
-                            print(f"Successfully moved and deleted row {row_idx+1}")
-                        except Exception as e:
-                            print(f"Error deleting row {row_idx+1}: {str(e)}")
-                else:
-                    missing_items = []
-                    if not has_valid_url:
-                        missing_items.append("URL")
-                    if not has_valid_oath:
-                        missing_items.append("oath date")
-                    print(f"Row {row_idx+1} kept for retry: Missing {' and '.join(missing_items)}")
-            
-            print(f"Successfully processed {first_name} {last_name}")
-            
-            # Add URL to processed set if successful
-            if lawyer_url:
-                self.processed_urls.add(lawyer_url)
-                if lawyer_url in self.failed_urls:
-                    del self.failed_urls[lawyer_url]  # Remove from failed URLs if successful
-                print(f"Added to processed: {lawyer_url}")
+            result = self.lookup_lead(lead)
+            self.apply_result(row_idx, row, headers, lead, result)
 
         except Exception as e:
-            print(f"Error processing row {row_idx+1}: {str(e)}")
-            if current_url and "doctrine.fr/p/avocat" in current_url:
-                self.failed_urls[current_url] = self.failed_urls.get(current_url, 0) + 1
-                print(f"Added {current_url} to failed URLs (attempt {self.failed_urls[current_url]})")
+            self.record_failure(row_idx, row, lead, e)
+
+    def process_lead_batch(self, batch, headers):
+        """Look up a batch of (row_idx, row) pairs concurrently and queue their results"""
+        prepared = []
+        for row_idx, row in batch:
+            try:
+                lead = self.prepare_lead(row_idx, row, headers)
+            except Exception as e:
+                self.record_failure(row_idx, row, None, e)
+                continue
+            if lead:
+                prepared.append((row_idx, row, lead))
+        if not prepared:
+            return
+
+        # Leads fetched before a restart are written back from the journal, and
+        # duplicate leads in the batch share one lookup
+        results = {}
+        to_fetch = {}  # identity key -> indices of the rows waiting on it
+        for i, (_, _, lead) in enumerate(prepared):
+            key = identity_key(*lead[:3])
+            journaled = self.journal.pending_result(key)
+            if journaled:
+                print(f"Resuming from journal: {lead[0]} {lead[1]} in {lead[2]}")
+                results[i] = journaled
+            elif key in to_fetch:
+                to_fetch[key].append(i)
+            else:
+                self.journal.mark(key, QUEUED)
+                to_fetch[key] = [i]
+
+        duplicates = sum(len(indices) - 1 for indices in to_fetch.values())
+        if duplicates:
+            self.client.single_flight.record_shared(duplicates)
+            print(f"{duplicates} duplicate leads in this batch share a lookup")
+        fetched = self.engine.run([
+            prepared[indices[0]][2][:3] + (key in self.retrying,) for key, indices in to_fetch.items()
+        ])
+        for (key, indices), result in zip(to_fetch.items(), fetched):
+            if not isinstance(result, BaseException):
+                self.journal.mark(key, FETCHED, result)
+            # Every copy is queued into the same batched sheet update
+            for i in indices:
+                results[i] = result
+
+        for i, (row_idx, row, lead) in enumerate(prepared):
+            try:
+                result = results[i]
+                if isinstance(result, BaseException):
+                    raise result
+                self.apply_result(row_idx, row, headers, lead, result)
+            except Exception as e:
+                self.record_failure(row_idx, row, lead, e)
 
     def process_leads(self):
+        if self.bulk_source:
+            self.process_bulk()
+            return
+
         leads_sheet, processed_sheet = self.setup_google_sheets()
         if not leads_sheet or not processed_sheet:
             return
 
+        self.writer = SheetWriteBuffer(
+            leads_sheet, processed_sheet,
+            max_pending=self.write_batch_size,
+            max_age=self.write_batch_age,
+            rate_limiter=self.sheets_limiter,
+            journal=self.journal,
+            processed_lock=self.processed_lock()
+        )
+        self.start_run()
+        if self.incremental_scan or self.lease_store:
+            self.scanner = SheetScanner(leads_sheet, rate_limiter=self.sheets_limiter)
+        try:
+            self.run_cycles(leads_sheet, processed_sheet)
+        finally:
+            self.close()
+
+    def start_run(self):
+        """Start metrics and profiling if configured and tidy the local stores"""
+        if self.metrics_port:
+            metrics.start_server(self.metrics_port)
+        if self.metrics_file:
+            metrics.start_snapshots(self.metrics_file, self.metrics_interval)
+        if self.profile_leads:
+            metrics.profiler.request(self.profile_leads)
+        self.cache.purge_expired()
+        self.journal.compact()
+        states = self.journal.summary()
+        if states:
+            print("Resuming from journal: " + ", ".join(f"{count} {state}" for state, count in sorted(states.items())))
+
+    def close(self):
+        """Write back what is buffered and close every client and store (shared ones are left open)"""
+        self.flush_writes(final=True)
+        self.engine.close()
+        self.journal.close()
+        self.retries.close()
+        if self.refresher:
+            self.refresher.close()
+        if not self.shared:
+            self.client.close()
+            self.cache.close()
+            self.browser.close()
+
+    def process_bulk(self):
+        """
+        Bulk mode: look up every lead of an export in one pass. Results are
+        appended to a local store as they come in, so lookups never wait on
+        the Sheets quota, and uploaded in bulk at the end (or every
+        bulk_upload_interval seconds). Leads already in the store are skipped,
+        so an interrupted pass picks up where it stopped.
+        """
+        sheets = []
+
+        def open_sheets():
+            if not sheets:
+                sheets.extend(self.setup_google_sheets())
+            return sheets
+
+        if self.bulk_source == "sheet":
+            leads_sheet, _ = open_sheets()
+            if not leads_sheet:
+                return
+            table = self.sheets_limiter.call("exporting leads", leads_sheet.get_all_values)
+            headers, rows = ([h.strip() for h in table[0]], table[1:]) if table else ([], [])
+        else:
+            headers, rows = read_table(self.bulk_source)
+        if not headers:
+            print(f"No leads in {self.bulk_source}")
+            return
+
+        store = ResultStore(self.bulk_store)
+        self.writer = BulkWriteBuffer(
+            store, headers, open_sheets=open_sheets if self.bulk_upload else None,
+            upload_interval=self.bulk_upload_interval, chunk_rows=self.bulk_chunk_rows,
+            rate_limiter=self.sheets_limiter, journal=self.journal, processed_lock=self.processed_lock()
+        )
+        self.start_run()
+        try:
+            # Row 1 is the header row, as in the sheet; moves copy the exported rows
+            table = LeadTable.from_values(headers, rows, start=1, keep_rows=True)
+            pending = list(table.pending(skip_keys=store.done_keys()))
+            print(f"Bulk pass over {len(table)} leads from {self.bulk_source}, {len(table) - len(pending)} already done")
+
+            eligible = self.select_eligible(headers, pending, set())
+            self.prefetch_cities(eligible, headers)
+            self.process_rows(None, None, eligible, headers)
+            self.flush_writes(final=True)
+            self.print_summary()
+            if not self.bulk_upload:
+                print(f"Results kept in {self.bulk_store}")
+        finally:
+            self.close()
+            store.close()
+
+    def read_leads(self, leads_sheet, due=()):
+        """
+        Return the header row and the (row_idx, row) pairs to consider this
+        cycle; `due` holds identity keys of leads whose retry is due
+        """
+        if self.scanner:
+            return self.scanner.scan(include=due)
+
+        # Get all records
+        all_values = leads_sheet.get_all_values()
+        if not all_values:
+            return [], []
+        headers = [h.strip() for h in all_values[0]]
+        # The full rows are at hand, so moves copy them instead of reading them back
+        return headers, LeadTable.from_values(headers, all_values[1:], start=1, keep_rows=True)
+
+    def select_stage(self, item, headers):
+        """Pipeline stage: keep rows that need a lookup"""
+        row_idx, row = item
+        try:
+            lead = self.prepare_lead(row_idx, row, headers)
+        except Exception as e:
+            return row_idx, row, None, e, None
+        if lead:
+            return row_idx, row, lead, None, None
+        return None
+
+    def lookup_stage(self, item):
+        """Pipeline stage: fetch the lead from the journal or doctrine.fr"""
+        row_idx, row, lead, error, _ = item
+        if error:
+            return item
+        try:
+            return row_idx, row, lead, self.lookup_lead(lead), None
+        except Exception as e:
+            return row_idx, row, lead, e, None
+
+    def validate_stage(self, item):
+        """Pipeline stage: build the cell values and decide whether the row moves"""
+        row_idx, row, lead, result, _ = item
+        if isinstance(result, BaseException):
+            return item
+        try:
+            return row_idx, row, lead, result, self.check_result(result)
+        except Exception as e:
+            return row_idx, row, lead, e, None
+
+    def write_stage(self, item, headers):
+        """Pipeline stage: queue the sheet updates; the only stage touching the write buffer"""
+        row_idx, row, lead, result, checked = item
+        try:
+            if isinstance(result, BaseException):
+                raise result
+            self.apply_result(row_idx, row, headers, lead, result, checked)
+        except Exception as e:
+            self.record_failure(row_idx, row, lead, e)
+
+    def process_pipelined(self, rows, headers):
+        """Run rows through selection, lookup, validation and write-back stages that overlap"""
+        pipeline = Pipeline(queue_size=self.pipeline_queue_size)
+        pipeline.add_stage("select", lambda item: self.select_stage(item, headers))
+        pipeline.add_stage("lookup", self.lookup_stage, workers=max(1, self.lookup_concurrency))
+        pipeline.add_stage("validate", self.validate_stage)
+        pipeline.add_stage("write", lambda item: self.write_stage(item, headers))
+        self.pipeline = pipeline
+        pipeline.run(rows, report_every=self.pipeline_report_interval)
+        print(f"Pipeline: {pipeline.report()}")
+
+    def process_rows(self, leads_sheet, processed_sheet, rows, headers):
+        """Look up and queue the results of a list of (row_idx, row) pairs"""
+        # The shared rate limiter paces requests, so there is no pause between leads
+        if self.pipelined:
+            self.process_pipelined(self.group_duplicates(rows, headers), headers)
+            return
+        if self.lookup_concurrency <= 1:
+            for row_idx, row in rows:
+                self.process_single_lead(leads_sheet, processed_sheet, row_idx, row, headers)
+            return
+        rows = self.group_duplicates(rows, headers)
+        batch_size = self.lookup_concurrency * 4
+        for start in range(0, len(rows), batch_size):
+            self.process_lead_batch(rows[start:start + batch_size], headers)
+
+    def group_duplicates(self, rows, headers):
+        """Order rows so copies of the same lead sit together and land in one batch"""
+        columns = column_map(headers)
+        key_columns = (columns.first_name, columns.last_name, columns.city)
+        groups = {}
+        for row_idx, row in rows:
+            key = identity_key(*(row[i] if i < len(row) else "" for i in key_columns))
+            groups.setdefault(key, []).append((row_idx, row))
+        return [item for group in groups.values() for item in group]
+
+    def process_claimed(self, leads_sheet, processed_sheet, rows, headers):
+        """Coordinated mode: lease rows a batch at a time, process them and write them back"""
+        for start in range(0, len(rows), self.lease_batch_size):
+            if self.should_stop:
+                break
+            owned, claimed = self.claim_rows(rows[start:start + self.lease_batch_size], headers)
+            if not owned:
+                continue
+            print(f"Worker {self.worker_id} claimed {len(claimed)} leads")
+            try:
+                self.process_rows(
+                    leads_sheet, processed_sheet, [(row_idx, row) for row_idx, row, _ in owned], headers
+                )
+                self.flush_writes(final=True)
+            finally:
+                self.release_claims(claimed)
+
+    def prefetch_cities(self, rows, headers):
+        """Build the city index for cities with many leads left to look up"""
+        city_index = self.client.city_index
+        if not city_index:
+            return
+        columns = column_map(headers)
+        key_columns = (columns.first_name, columns.last_name, columns.city)
+        leads = []
+        for _, row in rows:
+            lead = tuple(row[i] for i in key_columns)
+            if all(lead) and not self.journal.pending_result(identity_key(*lead)):
+                leads.append(lead)
+        try:
+            city_index.prefetch_dense(leads)
+        except Exception as e:
+            # The per-lead search still works without the index
+            print(f"City prefetch failed: {str(e)}")
+
+    def select_eligible(self, headers, rows, due):
+        """
+        Return the (row_idx, row) pairs worth looking up, skipping leads whose
+        retry is not due yet. Keys found in the rows are removed from `due`.
+        """
+        columns = column_map(headers)
+        url_index = columns.url
+        date_index = columns.serment
+        key_columns = (columns.first_name, columns.last_name, columns.city)
+        # Rows are only deleted at the end of the cycle, so any order works
+        eligible = []
+        for row_idx, row in rows:
+            # LeadTable rows span the header row and their cells are already stripped
+            current_url = row[url_index]
+            current_date = row[date_index]
+            key = identity_key(*(row[i] for i in key_columns))
+            if key in due:
+                # Its not-found answer may still be cached; ask doctrine.fr again
+                self.retrying.add(key)
+                due.discard(key)
+            if self.retries.waiting(key):
+                continue
+            if current_date=="Not found" and not self.retries.is_known(key):
+                # Marked before retries were scheduled; give it a retry date now
+                self.schedule_retry(key, retry_scheduler.NOT_FOUND)
+                continue
+            # Skip if URL is already processed or has failed too many times
+            if current_url and "doctrine.fr/p/avocat" in current_url:
+                if current_url in self.processed_urls:
+                    continue
+                if current_url in self.failed_urls and self.failed_urls[current_url] >= self.max_url_attempts:
+                    continue
+            
+            eligible.append((row_idx, row))
+        return eligible
+
+    def print_summary(self):
+        print(f"\nBatch summary:")
+        print(f"- Processed URLs: {len(self.processed_urls)}")
+        print(f"- Failed URLs: {len(self.failed_urls)}")
+        print(f"- {self.doctrine_limiter.report()}")
+        print(f"- {self.sheets_limiter.report()}")
+        print(f"- {self.cache.report()}")
+        print(f"- {self.client.single_flight.report(self.client.requests_saved())}")
+        if self.client.city_index:
+            print(f"- {self.client.city_index.report()}")
+        print(f"- {self.retries.report()}")
+        if self.refresher:
+            print(f"- refresh: {self.refresher.report()}")
+
+    def refresh_processed(self, processed_sheet):
+        """Re-check a batch of processed lawyers once refresh_interval has passed since the last batch"""
+        if not self.refresh_interval or time.time() - self.last_refresh < self.refresh_interval:
+            return
+        self.last_refresh = time.time()
+        if self.refresher is None:
+            self.refresher = Refresher(
+                self.client, processed_sheet, RefreshState(self.state_path("refresh_state.sqlite3")),
+                rate_limiter=self.sheets_limiter, batch_size=self.refresh_batch_size, max_age=self.refresh_age
+            )
+        try:
+            with metrics.span("refresh_batch"):
+                self.refresher.run_batch()
+        except Exception as e:
+            print(f"Refresh error: {str(e)}")
+
+    def run_cycles(self, leads_sheet, processed_sheet):
         while not self.should_stop:
+            due = set()
             try:
-                # Get all records
-                all_values = leads_sheet.get_all_values()
-                if len(all_values) <= 1:
+                due = set(self.retries.pop_due())
+                self.retrying.clear()
+                headers, rows = self.read_leads(leads_sheet, due)
+                if not rows:
+                    for key in due:
+                        self.retries.clear(key)
+                    if self.scanner:
+                        self.scanner.commit()
                     print("No new leads to process. Waiting...")
+                    self.refresh_processed(processed_sheet)
                     time.sleep(self.delay)
                     continue
 
-                headers = [h.strip() for h in all_values[0]]
-                url_index = headers.index("doctrineURL")
-                date_index = headers.index("Serment")
-                # Process rows from bottom to top
-                for row_idx in range(len(all_values) - 1, 0, -1):
-                    row = all_values[row_idx]
-                    current_url = row[url_index].strip() if url_index < len(row) else ""
-
-                    current_date = row[date_index].strip() if date_index < len(row) else ""
-                    if current_date=="Not found":
-                        print(current_date,"Skipping as not found")
-                        continue
-                    # Skip if URL is already processed or has failed too many times
-                    if current_url and "doctrine.fr/p/avocat" in current_url:
-                        if current_url in self.processed_urls:
-                            continue
-                        if current_url in self.failed_urls and self.failed_urls[current_url] >= self.max_url_attempts:
-                            continue
-                    
-                    self.process_single_lead(leads_sheet, processed_sheet, row_idx, row, headers)
-                    time.sleep(random.uniform(1, 2))  # Small delay between processing
+                eligible = self.select_eligible(headers, rows, due)
+                # Due leads no longer in the sheet were moved or deleted by hand
+                for key in due:
+                    self.retries.clear(key)
+
+                self.prefetch_cities(eligible, headers)
+                if self.lease_store:
+                    self.process_claimed(leads_sheet, processed_sheet, eligible, headers)
+                else:
+                    self.process_rows(leads_sheet, processed_sheet, eligible, headers)
                 
-                print(f"\nBatch summary:")
-                print(f"- Processed URLs: {len(self.processed_urls)}")
-                print(f"- Failed URLs: {len(self.failed_urls)}")
+                self.flush_writes(final=True)
+                if self.scanner:
+                    self.scanner.commit()
+                self.print_summary()
+                self.refresh_processed(processed_sheet)
                 print(f"Waiting {self.delay} seconds before checking for new leads...")
                 time.sleep(self.delay)
                 
             except Exception as e:
                 print(f"Main process error: {str(e)}")
+                # Due leads not reached this cycle stay due for the next one
+                self.retries.requeue(due)
+                # Rows of this scan not reached are returned again by the next one
+                if self.scanner:
+                    self.scanner.rollback()
+                self.flush_writes(final=True)
                 time.sleep(self.delay)
                 continue
 
@@ -311,17 +840,21 @@ def main():
             break
         except ValueError:
             print("Please enter a valid number!")
-    login()
-    print("Checking again if session is saved")
-    again_checker()
+    bulk_source = input("Enter a CSV or Parquet export to process in bulk (press Enter to work on the sheet directly): ").strip()
+
+    # Created first so the login steps hand their cookies straight to its client
+    processor = LeadProcessor(sheet_id=sheet_id, sheet_name=sheet_name, delay=delay)
+    processor.bulk_source = bulk_source or None
+    ensure_session(processor.client)
     print("\nStarting with following settings:")
     print(f"Sheet ID: {sheet_id}")
     print(f"Sheet Name: {sheet_name}")
     print(f"Check Interval: {delay} seconds")
+    if bulk_source:
+        print(f"Bulk Source: {bulk_source}")
     print("\nPress Ctrl+C to stop the process\n")
     
     try:
-        processor = LeadProcessor(sheet_id=sheet_id, sheet_name=sheet_name, delay=delay)
         processor.process_leads()
     except KeyboardInterrupt:
         print("\nStopping the process...")
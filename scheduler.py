@@ -0,0 +1,200 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+import specialty_extractor
+import run_bot
+from rate_limiter import AdaptiveRateLimiter, FairQueue
+from lookup_cache import LookupCache
+from browser_session import get_browser
+import metrics
+
+# Settings of a sheet that are not LeadProcessor attributes
+TARGET_KEYS = {"sheet_id", "sheet_name", "weight", "delay"}
+
+
+class SharedResources:
+    """
+    What the sheets scheduled in one process share: the doctrine.fr client
+    (one connection pool and session), the lookup cache, the gspread client
+    and the doctrine.fr and Google Sheets budgets. Each sheet draws on the
+    budgets through a FairQueue, in proportion to its weight. Sheets of the
+    same spreadsheet append to its processed sheet one at a time.
+    """
+
+    def __init__(self, credentials_file="credentials.json", state_dir="state", request_rate=2.0,
+                 max_request_rate=5.0, max_retries=5):
+        self.credentials_file = credentials_file
+        self.state_dir = state_dir  # Journals, retry schedules and bulk stores, one directory per sheet and spreadsheet
+        self.doctrine_limiter = AdaptiveRateLimiter(
+            request_rate, max_rate=max_request_rate, max_retries=max_retries, name="doctrine.fr"
+        )
+        self.sheets_limiter = AdaptiveRateLimiter(
+            1.0, max_rate=5.0, base_cooldown=30, max_retries=max_retries, name="Google Sheets"
+        )
+        self.doctrine_queue = FairQueue(self.doctrine_limiter)
+        self.sheets_queue = FairQueue(self.sheets_limiter)
+        self.cache = LookupCache("lookup_cache.sqlite3")
+        self.client = specialty_extractor.DoctrineClient(rate_limiter=self.doctrine_limiter, cache=self.cache)
+        get_browser().attach(self.client)  # Keeps its cookie file state in step with the sheets' views
+        self.lock = threading.Lock()
+        self.gspread_client = None
+        self.processed_locks = {}  # (sheet_id, processed sheet name) -> lock held while appending to it
+
+    def state_path(self, sheet_id, sheet_name, filename):
+        name = re.sub(r"[^\w.-]+", "_", sheet_name).strip("_") or "sheet"
+        directory = os.path.join(self.state_dir, re.sub(r"[^\w.-]+", "_", sheet_id), name)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+    def processed_lock(self, sheet_id, processed_sheet_name):
+        """The lock shared by every sheet of a spreadsheet that moves rows to the same processed sheet"""
+        with self.lock:
+            return self.processed_locks.setdefault((sheet_id, processed_sheet_name), threading.Lock())
+
+    def sheets_client(self):
+        """The gspread client, authorized once for every sheet"""
+        with self.lock:
+            if self.gspread_client is None:
+                self.gspread_client = run_bot.authorize_sheets(self.credentials_file)
+            return self.gspread_client
+
+    def close(self):
+        self.client.close()
+        self.cache.close()
+        get_browser().close()
+
+
+def load_config(path):
+    """
+    Read a JSON config:
+        {"delay": 5, "request_rate": 2.0,
+         "sheets": [{"sheet_id": "...", "sheet_name": "FRANCE: 78000 lawyers", "weight": 3},
+                    {"sheet_id": "...", "sheet_name": "Paris", "bulk_source": "paris.csv"}]}
+    Other keys of a sheet set the LeadProcessor attribute of the same name.
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_processors(config, shared):
+    """Create one LeadProcessor per configured sheet, all drawing on `shared`"""
+    processors = []
+    targets = set()
+    for target in config.get("sheets", []):
+        if not target.get("sheet_id"):
+            raise ValueError(f"Sheet without a sheet_id in the config: {target}")
+        sheet_name = target.get("sheet_name", "FRANCE: 78000 lawyers")
+        if (target["sheet_id"], sheet_name) in targets:
+            raise ValueError(f"Sheet '{sheet_name}' of spreadsheet {target['sheet_id']} is configured twice")
+        targets.add((target["sheet_id"], sheet_name))
+        weight = float(target.get("weight", 1))
+        if weight <= 0:
+            raise ValueError(f"Weight of '{sheet_name}' must be positive")
+        processor = run_bot.LeadProcessor(
+            sheet_id=target["sheet_id"], sheet_name=sheet_name, delay=target.get("delay", config.get("delay", 5)),
+            shared=shared, weight=weight
+        )
+        for key, value in target.items():
+            if key in TARGET_KEYS:
+                continue
+            if not hasattr(processor, key):
+                raise ValueError(f"Unknown setting '{key}' for sheet '{sheet_name}'")
+            setattr(processor, key, value)
+        processors.append(processor)
+    return processors
+
+
+def run_processor(processor, errors):
+    try:
+        processor.process_leads()
+    except Exception as e:
+        errors.append(e)
+        print(f"Sheet '{processor.sheet_name}' stopped: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process several sheets in one process with shared budgets")
+    parser.add_argument("--config", help="JSON file listing the sheets and their settings")
+    parser.add_argument(
+        "--sheet", nargs="+", action="append", default=[], metavar="VALUE",
+        help="SHEET_ID [SHEET_NAME [WEIGHT]]; may be given several times"
+    )
+    parser.add_argument("--delay", type=float, help="check interval in seconds")
+    parser.add_argument("--credentials", default="credentials.json")
+    parser.add_argument("--state-dir", default="state", help="per-sheet journals, retry schedules and bulk stores")
+    parser.add_argument("--request-rate", type=float, help="starting doctrine.fr requests per second")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this localhost port")
+    parser.add_argument("--no-browser", action="store_true", help="exit instead of opening a browser to log in, and leave CAPTCHAs to the retry queue")
+    args = parser.parse_args()
+
+    config = load_config(args.config) if args.config else {}
+    config.setdefault("sheets", [])
+    for values in args.sheet:
+        if len(values) > 3:
+            parser.error("--sheet takes SHEET_ID [SHEET_NAME [WEIGHT]]")
+        target = {"sheet_id": values[0]}
+        if len(values) > 1:
+            target["sheet_name"] = values[1]
+        if len(values) > 2:
+            target["weight"] = float(values[2])
+        config["sheets"].append(target)
+    if args.delay is not None:
+        config["delay"] = args.delay
+    if args.request_rate is not None:
+        config["request_rate"] = args.request_rate
+    if not config["sheets"]:
+        parser.error("no sheets: give --config or --sheet")
+
+    shared = SharedResources(
+        credentials_file=config.get("credentials", args.credentials),
+        state_dir=config.get("state_dir", args.state_dir),
+        request_rate=config.get("request_rate", 2.0),
+        max_request_rate=config.get("max_request_rate", 5.0)
+    )
+    # Set before the sheets take their views of the client
+    shared.client.allow_browser = not args.no_browser
+    try:
+        processors = build_processors(config, shared)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not run_bot.ensure_session(shared.client, allow_browser=not args.no_browser):
+        sys.exit(1)
+    metrics_port = config.get("metrics_port", args.metrics_port)
+    if metrics_port:
+        metrics.start_server(metrics_port)
+
+    print(f"Starting {len(processors)} sheets:")
+    for processor in processors:
+        mode = f"bulk from {processor.bulk_source}" if processor.bulk_source else f"every {processor.delay:g} seconds"
+        print(f"- {processor.sheet_name} ({processor.sheet_id}), weight {processor.weight:g}, {mode}")
+    print("\nPress Ctrl+C to stop the process\n")
+
+    errors = []
+    threads = []
+    for processor in processors:
+        thread = threading.Thread(
+            target=run_processor, args=(processor, errors), name=processor.sheet_name, daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nStopping the process (finishing the current cycle of each sheet)...")
+        for processor in processors:
+            processor.should_stop = True
+        for thread in threads:
+            thread.join()
+    finally:
+        shared.close()
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
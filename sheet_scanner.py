@@ -0,0 +1,131 @@
+from collections import Counter, defaultdict
+from lookup_cache import identity_key
+from lead_table import LeadTable, normalize
+
+
+class SheetScanner:
+    """
+    Scan the leads sheet one cycle at a time, downloading only the columns
+    needed to decide what to do with a row and returning only rows that are
+    new or changed since the previous cycle.
+    """
+
+    scan_headers = ["First Name", "Last Name", "CITY", "doctrineURL", "Serment"]
+
+    def __init__(self, leads_sheet, rate_limiter=None):
+        self.leads_sheet = leads_sheet
+        self.rate_limiter = rate_limiter  # Shared Sheets budget, if any
+        self.headers = None
+        self.column_indices = []  # Sheet column indices of scan_headers
+        self.snapshot = Counter()  # Signatures of rows seen in the previous cycle
+        self.previous = None  # Snapshot before the last scan, until its cycle is committed
+
+    def _call(self, description, func, *args, **kwargs):
+        if self.rate_limiter:
+            return self.rate_limiter.call(description, func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def _column_range(self, col_idx):
+        from gspread.utils import rowcol_to_a1
+
+        letter = rowcol_to_a1(1, col_idx + 1).rstrip("0123456789")
+        return f"{letter}2:{letter}"
+
+    def _set_headers(self, headers):
+        self.headers = headers
+        self.column_indices = [headers.index(name) for name in self.scan_headers]
+        # The layout changed, so nothing from the previous snapshot can be trusted
+        self.snapshot = Counter()
+
+    def signature(self, row):
+        # None cells are written as empty ones, so they must read the same
+        return tuple(normalize(row[idx]) if idx < len(row) else "" for idx in self.column_indices)
+
+    def _fetch(self):
+        """Fetch the header row and the scanned columns in one request"""
+        ranges = ["1:1"] + [self._column_range(idx) for idx in self.column_indices]
+        results = self._call("scanning leads", self.leads_sheet.batch_get, ranges, major_dimension="COLUMNS")
+        headers = [str(col[0]).strip() if col else "" for col in results[0]]
+        columns = [list(result[0]) if result else [] for result in results[1:]]
+        return headers, columns
+
+    def scan(self, include=()):
+        """
+        Return (headers, rows) where rows is a LeadTable of the rows that are
+        new or changed, plus unchanged rows whose lead's identity key is in
+        `include`. It only holds the scanned columns; the other cells of its
+        rows read as empty.
+        """
+        if self.headers is None:
+            self._set_headers([h.strip() for h in self._call("reading headers", self.leads_sheet.row_values, 1)])
+
+        headers, columns = self._fetch()
+        if headers != self.headers:
+            print("Header row changed, rescanning the whole sheet")
+            self._set_headers(headers)
+            headers, columns = self._fetch()
+
+        row_count = max((len(col) for col in columns), default=0)
+        current = Counter()
+        seen = Counter()
+        changed_rows = LeadTable(headers, columns=self.scan_headers)
+        for offset in range(row_count):
+            sig = tuple(normalize(col[offset]) if offset < len(col) else "" for col in columns)
+            current[sig] += 1
+            # Identical rows are matched by count so duplicates are not collapsed
+            if seen[sig] < self.snapshot[sig]:
+                seen[sig] += 1
+                if not include or identity_key(*sig[:3]) not in include:
+                    continue
+            changed_rows.add(offset + 1, sig)
+
+        self.previous = self.snapshot
+        self.snapshot = current
+        print(f"Scanned {row_count} rows, {len(changed_rows)} new, changed or due for retry")
+        return headers, changed_rows
+
+    def commit(self):
+        """The rows of the last scan were all handled: keep its snapshot"""
+        self.previous = None
+
+    def rollback(self):
+        """
+        The cycle of the last scan failed: go back to the snapshot before it,
+        so the next scan returns the same rows again.
+        """
+        if self.previous is not None:
+            self.snapshot = self.previous
+            self.previous = None
+
+    def locate(self):
+        """
+        Map each lead's identity key to the row numbers it currently occupies,
+        in sheet order. Used to re-find rows after other workers deleted some.
+        Afterwards self.headers is the sheet's current header row.
+        """
+        if self.headers is None:
+            self._set_headers([h.strip() for h in self._call("reading headers", self.leads_sheet.row_values, 1)])
+        headers, columns = self._fetch()
+        if headers != self.headers:
+            # Columns were moved: self.headers is the sheet's header row once more
+            self._set_headers(headers)
+            _, columns = self._fetch()
+        first_names, last_names, cities = columns[0], columns[1], columns[2]
+        row_count = max((len(col) for col in columns), default=0)
+        cell = lambda col, offset: col[offset] if offset < len(col) else ""
+        rows = defaultdict(list)
+        for offset in range(row_count):
+            key = identity_key(cell(first_names, offset), cell(last_names, offset), cell(cities, offset))
+            rows[key].append(offset + 2)
+        return rows
+
+    def replace(self, old_row, new_row):
+        """Record that a row will read as `new_row` next cycle, so it is not picked up again"""
+        self.forget(old_row)
+        self.snapshot[self.signature(new_row)] += 1
+
+    def forget(self, row):
+        """Drop a row from the snapshot so the next scan returns it again"""
+        sig = self.signature(row)
+        if self.snapshot[sig] > 0:
+            self.snapshot[sig] -= 1
@@ -0,0 +1,346 @@
+import time
+from collections import Counter
+from rate_limiter import AdaptiveRateLimiter
+from journal import WRITTEN, MOVED, DELETED
+from lead_table import column_map, normalize
+import metrics
+
+# Ranges per batch_get: they go in the request URL, which the API caps in length
+MAX_BATCH_RANGES = 200
+
+
+def row_signature(row):
+    """A row's cells as Sheets gives them back: stripped strings, no trailing empty cells"""
+    cells = [normalize(value) for value in row]
+    while cells and not cells[-1]:
+        cells.pop()
+    return tuple(cells)
+
+
+class SheetWriteBuffer:
+    """
+    Buffer lead results in memory and write them back to Google Sheets in a
+    few batched requests instead of several API calls per lead.
+    """
+
+    def __init__(self, leads_sheet, processed_sheet, max_pending=50, max_age=30,
+                 rate_limiter=None, journal=None, processed_lock=None):
+        self.leads_sheet = leads_sheet
+        self.processed_sheet = processed_sheet
+        self.max_pending = max_pending  # Flush once this many rows are buffered
+        self.max_age = float(max_age)  # Flush once the oldest buffered row is this old
+        # Paces every Sheets call and backs off when the quota is hit
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(1.0, max_rate=5.0, name="Google Sheets")
+        self.pending_updates = {}  # row number -> {column number: value}
+        self.pending_moves = []  # (row number, row data, key, cells) waiting for the processed sheet
+        self.first_pending_at = None
+        self.key_header = "doctrineURL"  # Column that identifies a processed row
+        self.processed_tail = None  # Last used row of the processed sheet
+        self.processed_row_count = None  # Rows currently allocated in the processed sheet
+        self.pending_deletes = set()  # Moved row numbers to delete at the end of the cycle
+        self.journal = journal  # Optional LeadJournal told about each write-back step
+        self.journal_keys = {}  # row number -> journal key of the lead in that row
+        # Held while appending when other buffers in this process append to the same processed sheet
+        self.processed_lock = processed_lock
+        self.started_at = time.time()
+        self.replayed = None  # Counter of (journal key, row) an interrupted run already appended
+        self.open_appends = []  # Journal ids of appends whose leads rows are not deleted yet
+
+    def pending_count(self):
+        return len(self.pending_updates) + len(self.pending_moves)
+
+    def _touch(self):
+        if self.first_pending_at is None:
+            self.first_pending_at = time.time()
+
+    def queue_update(self, row_idx, row, headers, values, journal_key=None):
+        """
+        Queue cell values for a row and return the updated row built in memory.
+        `values` maps header names to the new cell values.
+        """
+        if journal_key:
+            self.journal_keys[row_idx + 1] = journal_key
+        updated_row = list(row) + [""] * max(0, len(headers) - len(row))
+        cells = self.pending_updates.setdefault(row_idx + 1, {})
+        columns = column_map(headers)
+        for header, value in values.items():
+            col_idx = columns[header]
+            updated_row[col_idx] = value
+            cells[col_idx + 1] = value
+        self._touch()
+        return updated_row
+
+    def queue_move(self, row_idx, row_data, key=None, partial=False):
+        """
+        Queue a finished row to be copied to the processed sheet and deleted.
+        `key` identifies the row (its doctrine URL) so it is never appended twice.
+        A `partial` row only holds some columns; the rest are read back in
+        batched requests when the buffer is flushed.
+        """
+        # The row is about to be removed, so writing its cells first is wasted quota
+        cells = self.pending_updates.pop(row_idx + 1, {})
+        self.pending_moves.append((row_idx + 1, None if partial else list(row_data), key, cells))
+        self._touch()
+
+    def should_flush(self):
+        if not self.pending_count():
+            return False
+        if self.pending_count() >= self.max_pending:
+            return True
+        return time.time() - self.first_pending_at >= self.max_age
+
+    def relocate(self, key_rows):
+        """
+        Move buffered work to the rows its leads occupy now. `key_rows` maps
+        journal keys to current row numbers (see SheetScanner.locate); work for
+        a lead that is no longer in the sheet is dropped. The processed sheet's
+        tail is re-read on the next flush, since other writers may have
+        appended to it.
+        """
+        self.processed_tail = None
+        available = {key: list(rows) for key, rows in key_rows.items()}
+        mapping = {}
+        for row_num in sorted(self.journal_keys):
+            rows = available.get(self.journal_keys[row_num])
+            if rows:
+                mapping[row_num] = rows.pop(0)
+            else:
+                print(f"Row {row_num} is no longer in the sheet, dropping its pending write")
+
+        self.pending_updates = {
+            mapping[r]: cells for r, cells in self.pending_updates.items() if r in mapping
+        }
+        self.pending_moves = [
+            (mapping[move[0]],) + tuple(move[1:]) for move in self.pending_moves if move[0] in mapping
+        ]
+        self.pending_deletes = {mapping[r] for r in self.pending_deletes if r in mapping}
+        self.journal_keys = {mapping[r]: key for r, key in self.journal_keys.items() if r in mapping}
+
+    def _journal(self, row_nums, state, done=False):
+        if not self.journal:
+            return
+        if done:
+            keys = [self.journal_keys.pop(row_num, None) for row_num in row_nums]
+        else:
+            keys = [self.journal_keys.get(row_num) for row_num in row_nums]
+        self.journal.mark_many(keys, state)
+
+    def call_with_backoff(self, description, func, *args, **kwargs):
+        """Run a Sheets call within the rate budget, backing off on quota errors"""
+        return self.rate_limiter.call(description, func, *args, **kwargs)
+
+    def _update_ranges(self):
+        """Group each row's buffered cells into contiguous column ranges"""
+        from gspread.utils import rowcol_to_a1
+
+        data = []
+        for row_num in sorted(self.pending_updates):
+            cells = self.pending_updates[row_num]
+            run_start, run_values = None, []
+            for col_num in sorted(cells):
+                if run_start is not None and col_num == run_start + len(run_values):
+                    run_values.append(cells[col_num])
+                    continue
+                if run_values:
+                    data.append({"range": rowcol_to_a1(row_num, run_start), "values": [run_values]})
+                run_start, run_values = col_num, [cells[col_num]]
+            if run_values:
+                data.append({"range": rowcol_to_a1(row_num, run_start), "values": [run_values]})
+        return data
+
+    def _load_processed_tail(self):
+        """
+        Find the processed sheet's last used row from its key column plus
+        whatever rows follow that column's last value
+        """
+        headers = self.call_with_backoff("reading processed sheet", self.processed_sheet.row_values, 1)
+        headers = [h.strip() for h in headers]
+        key_rows = 1
+        if self.key_header in headers:
+            key_values = self.call_with_backoff(
+                "reading processed sheet", self.processed_sheet.col_values, headers.index(self.key_header) + 1
+            )
+            key_rows = max(len(key_values), 1)
+        self.processed_row_count = self.processed_sheet.row_count
+        trailing = []
+        if key_rows < self.processed_row_count:
+            # Rows without a key (e.g. added by hand) may follow; Sheets drops trailing empty rows
+            results = self.call_with_backoff(
+                "reading processed sheet", self.processed_sheet.batch_get,
+                [f"A{key_rows + 1}:{self.processed_row_count}"]
+            )
+            trailing = results[0] if results else []
+        self.processed_tail = key_rows + len(trailing)
+        print(f"Processed sheet tail at row {self.processed_tail}")
+
+    def _load_replayed(self):
+        """
+        Find the rows an interrupted run appended but whose leads rows it
+        never deleted: its journaled appends whose range still holds exactly
+        those rows. Moving such a row again only deletes it; any other
+        journaled row is appended again.
+        """
+        self.replayed = Counter()
+        if not self.journal:
+            return
+        for append_id, start_row, rows, keys in self.journal.unfinished_appends(before=self.started_at):
+            self.open_appends.append(append_id)
+            results = self.call_with_backoff(
+                "reading processed sheet", self.processed_sheet.batch_get,
+                [f"A{start_row}:{start_row + len(rows) - 1}"]
+            )
+            found = [row_signature(row) for row in (results[0] if results else [])]
+            expected = [row_signature(row) for row in rows]
+            if found + [()] * (len(expected) - len(found)) == expected:
+                self.replayed.update(zip(keys, expected))
+        if self.replayed:
+            print(f"{sum(self.replayed.values())} rows were moved by an interrupted run; their leads rows will be deleted")
+
+    def _fill_partial_moves(self):
+        """Read the full rows of moves queued from a column-projected scan"""
+        partial = [i for i, move in enumerate(self.pending_moves) if move[1] is None]
+        if not partial:
+            return
+        ranges = [f"A{self.pending_moves[i][0]}:{self.pending_moves[i][0]}" for i in partial]
+        results = []
+        for start in range(0, len(ranges), MAX_BATCH_RANGES):
+            results += self.call_with_backoff(
+                "reading moved rows", self.leads_sheet.batch_get, ranges[start:start + MAX_BATCH_RANGES]
+            )
+        for i, result in zip(partial, results):
+            row_num, _, key, cells = self.pending_moves[i]
+            row_data = list(result[0]) if result else []
+            width = max([len(row_data)] + list(cells))
+            row_data += [""] * (width - len(row_data))
+            for col_num, value in cells.items():
+                row_data[col_num - 1] = value
+            self.pending_moves[i] = (row_num, row_data, key, cells)
+
+    def _append_processed(self):
+        """
+        Write the buffered rows right after the processed sheet's tail.
+        The target range is fixed before the request is sent, so retrying a
+        flush rewrites the same rows instead of appending duplicates. With a
+        processed_lock, the tail is re-read under the lock before each append,
+        since other buffers may have appended since.
+        """
+        if self.processed_lock is None:
+            self._append_rows()
+            return
+        with self.processed_lock:
+            self._load_processed_tail()
+            self._append_rows()
+
+    def _append_rows(self):
+        if self.processed_tail is None:
+            self._load_processed_tail()
+
+        if self.replayed is None:
+            self._load_replayed()
+        # Every move ends up deleted from the leads sheet, so only rows known
+        # to be in the processed sheet already may be left out
+        rows, keys = [], []
+        for row_num, row_data, key, _ in self.pending_moves:
+            journal_key = self.journal_keys.get(row_num)
+            signature = row_signature(row_data)
+            if self.replayed[journal_key, signature]:
+                self.replayed[journal_key, signature] -= 1
+                print(f"Skipping row already in the processed sheet: {key}")
+                continue
+            rows.append(row_data)
+            keys.append(journal_key)
+        if not rows:
+            return
+
+        start_row = self.processed_tail + 1
+        end_row = self.processed_tail + len(rows)
+        if end_row > self.processed_row_count:
+            extra_rows = max(end_row - self.processed_row_count, 1000)
+            self.call_with_backoff("resizing processed sheet", self.processed_sheet.add_rows, extra_rows)
+            self.processed_row_count += extra_rows
+
+        if self.journal:
+            self.open_appends.append(self.journal.record_append(start_row, rows, keys))
+        self.call_with_backoff(
+            "moving to processed sheet", self.processed_sheet.update,
+            values=rows, range_name=f"A{start_row}"
+        )
+        self.processed_tail = end_row
+        metrics.inc("rows_moved_total", len(rows))
+        print(f"Moved {len(rows)} rows to processed sheet (rows {start_row}-{end_row})")
+
+    def _delete_ranges(self):
+        """Merge the rows to delete into contiguous (start, end) ranges, bottom first"""
+        ranges = []
+        for row_num in sorted(self.pending_deletes, reverse=True):
+            if ranges and ranges[-1][0] == row_num + 1:
+                ranges[-1] = (row_num, ranges[-1][1])
+            else:
+                ranges.append((row_num, row_num))
+        return ranges
+
+    def commit_deletes(self):
+        """
+        Remove every moved row in one batchUpdate of deleteDimension requests.
+        Ranges are sent bottom first so each delete leaves the rows above it in
+        place. The journaled appends are then finished.
+        """
+        if not self.pending_deletes:
+            self._finish_appends()
+            return
+        ranges = self._delete_ranges()
+        requests = []
+        for start_row, end_row in ranges:
+            requests.append({
+                "deleteDimension": {
+                    "range": {
+                        "sheetId": self.leads_sheet.id,
+                        "dimension": "ROWS",
+                        "startIndex": start_row - 1,
+                        "endIndex": end_row
+                    }
+                }
+            })
+        self.call_with_backoff(
+            "deleting rows", self.leads_sheet.spreadsheet.batch_update, {"requests": requests}
+        )
+        metrics.inc("rows_deleted_total", len(self.pending_deletes))
+        print(f"Deleted {len(self.pending_deletes)} rows in {len(ranges)} ranges")
+        self._journal(self.pending_deletes, DELETED, done=True)
+        self.pending_deletes = set()
+        self._finish_appends()
+
+    def _finish_appends(self):
+        if self.journal:
+            self.journal.clear_appends(self.open_appends)
+        self.open_appends = []
+
+    def flush(self, final=False):
+        """
+        Write all buffered results: cell updates in one request and processed
+        rows in one request after the tracked tail. Moved rows are only deleted
+        on the final flush of a cycle, so row numbers from the cycle's snapshot
+        stay valid until then.
+        """
+        if self.pending_count():
+            data = self._update_ranges()
+            if data:
+                self.call_with_backoff("updating leads", self.leads_sheet.batch_update, data)
+                metrics.inc("rows_updated_total", len(self.pending_updates))
+                print(f"Flushed {len(self.pending_updates)} updated rows in one request")
+            self._journal(list(self.pending_updates), WRITTEN, done=True)
+            self.pending_updates = {}
+
+            if self.pending_moves:
+                self._fill_partial_moves()
+                self._append_processed()
+                moved_rows = [move[0] for move in self.pending_moves]
+                self._journal(moved_rows, MOVED)
+                self.pending_deletes.update(moved_rows)
+                self.pending_moves = []
+
+            self.first_pending_at = None
+
+        if final:
+            self.commit_deletes()
+        return True
@@ -0,0 +1,57 @@
+import threading
+import metrics
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one. The first caller
+    runs the function; callers arriving while it is in flight wait for it and
+    get the same result (or exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}  # key -> Future of the running call
+        self.calls = 0
+        self.shared = 0  # Calls answered by another caller's work
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            self.calls += 1
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.shared += 1
+                metrics.inc("lookups_shared_total")
+                leader = False
+            else:
+                future = self.in_flight[key] = Future()
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def record_shared(self, count):
+        """Count duplicates that were merged before reaching do()"""
+        with self.lock:
+            self.calls += count
+            self.shared += count
+        metrics.inc("lookups_shared_total", count)
+
+    def report(self, requests_saved=None):
+        report = f"single-flight: {self.shared} of {self.calls} lookups shared an in-flight lookup"
+        if requests_saved is not None:
+            report += f" (~{requests_saved} requests saved)"
+        return report
@@ -1,212 +1,510 @@
 import requests
+from requests.adapters import HTTPAdapter
+from rate_limiter import AdaptiveRateLimiter, parse_retry_after
+from lead_matcher import LeadMatcher
+from lookup_cache import identity_key
+from single_flight import SingleFlight
+from browser_session import get_browser
+import retry_scheduler
+import metrics
 import json
-import re
-import pandas as pd
+import copy
+import heapq
+from operator import itemgetter
 import os
-import sys
-import time
-import os
-from seleniumbase import SB
+import threading
 
-def solve_captcha(url):
-    user_data_dir = os.path.join(os.getcwd(), 'user_data')
-    extension_dir = os.path.join(os.getcwd(), 'extension')
-    
-    # Using the SeleniumBase context manager
-    with SB(user_data_dir=user_data_dir, extension_dir=extension_dir) as sb:
-        sb.open(url)
-        time.sleep(30)
+NOT_FOUND = ([], "Not found", None)
+DOCTRINE_URL = "https://www.doctrine.fr"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"
 
-def get_lawyer_id(session, first_name, last_name, city):
-    """
-    Extract lawyer ID and oath date directly from doctrine.fr API using existing session
-    """
-    # Base URL for the API
-    base_url = "https://www.doctrine.fr/api/v2/search"
+def solve_captcha(url):
+    """Have the CAPTCHA on url solved in the process-wide browser; True once the page loads again"""
+    return get_browser().solve_captcha(url)
 
-    # Parameters for the search
-    params = {
-        "q": f"{first_name} {last_name} {city}",
+def search_params(query, start=0, size=5, top_only=True):
+    """Query parameters for a lawyer search on /api/v2/search"""
+    return {
+        "q": query,
         "chrono": "false",
         "sort_nbr_commentaire": "false",
         "chrono_inverted": "false",
         "sort_alphanumeric": "false",
-        "from": 0,
-        "size": 5,
+        "from": start,
+        "size": size,
         "type": "lawyer",
-        "only_top_results": "true",
+        "only_top_results": "true" if top_only else "false",
         "exclude_moyens": "false",
     }
 
+def get_lawyer_id(session, first_name, last_name, city, site_url=DOCTRINE_URL):
+    """
+    Extract lawyer ID and oath date directly from doctrine.fr API using existing session.
+    Returns (None, "Not found") when there is no match and (None, None) when
+    the search request itself failed.
+    """
+    # Base URL for the API
+    base_url = f"{site_url}/api/v2/search"
+
+    # Parameters for the search
+    params = search_params(f"{first_name} {last_name} {city}")
+
     # Headers for search
     headers = {
         "Accept": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"
+        "User-Agent": USER_AGENT
     }
 
-    session.headers.update(headers)
-
     try:
-        response = session.get(base_url, params=params)
+        with metrics.span("doctrine_search"):
+            response = session.get(base_url, params=params, headers=headers)
 
         if response.status_code == 200:
             data = response.json()
             hits = data.get("hits", [])
-            if hits:  # Check if there's at least one result
-                lawyer_id = hits[0].get("id")
-                oath_date = hits[0].get("sermentDate", "Not found")
+            # Only a hit whose name and city match the lead is worth fetching
+            hit = LeadMatcher(first_name, last_name, city).best(hits)
+            if hit:
+                lawyer_id = hit.get("id")
+                oath_date = hit.get("sermentDate", "Not found")
                 return lawyer_id, oath_date
+            if hits:
+                print(f"No confident match among {len(hits)} results for {first_name} {last_name} in {city}")
         elif response.status_code == 404:
             print(f"Lawyer not found: {first_name} {last_name} in {city}")
         else:
             print(f"API request failed with status code {response.status_code}")
+            return None, None
             
     except Exception as e:
         print(f"Error searching for lawyer: {str(e)}")
+        return None, None
     
     return None, "Not found"
 
-def extract_data(data):
+# Statuses with which the decisions endpoint rejects a stale or foreign readKey
+READ_KEY_REJECTED = (400, 401, 403)
+NEXT_DATA_START = b'<script id="__NEXT_DATA__" type="application/json">'
+NEXT_DATA_END = b'</script>'
+
+def read_next_data(response, chunk_size=16384):
+    """
+    Read a streamed page only until its __NEXT_DATA__ script has closed and
+    return the script's JSON text, or None if the page has no such script
+    """
+    buffer = b""
+    start = -1
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            buffer += chunk
+            if start < 0:
+                start = buffer.find(NEXT_DATA_START)
+                if start < 0:
+                    # Keep just enough of the tail to match a marker split across chunks
+                    buffer = buffer[-len(NEXT_DATA_START):]
+                    continue
+                buffer = buffer[start + len(NEXT_DATA_START):]
+            end = buffer.find(NEXT_DATA_END)
+            if end >= 0:
+                return buffer[:end].decode("utf-8", errors="replace")
+        return None
+    finally:
+        response.close()
+
+def iter_subcategories(data):
+    """Yield (category name, count) for every domains[].sub[] entry"""
+    for domain in data.get('domains', []):
+        for sub in domain.get('sub', []):
+            yield sub['categoryName'], sub['count']
+
+def extract_data(data, top=5):
+    """Return the `top` (subcategory, count) pairs with the highest counts"""
     try:
-        # Extract subcategories with their counts
-        subcategories = []
-        for domain in data.get('domains', []):
-            for sub in domain.get('sub', []):
-                subcategories.append({
-                    'Subcategory': sub['categoryName'], 
-                    'Count': sub['count']
-                })
-        
-        # If no subcategories found, return empty DataFrame
-        if not subcategories:
-            return pd.DataFrame(columns=['Subcategory', 'Count'])
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(subcategories)
-        
-        # Sort by count in descending order and select the top 5
-        top_subcategories = df.sort_values(by='Count', ascending=False).head(5)
-        return top_subcategories
+        # Partial selection: only the current top entries are kept while streaming
+        return heapq.nlargest(top, iter_subcategories(data), key=itemgetter(1))
     except Exception as e:
         print(f"Error extracting specialties: {str(e)}")
-        return pd.DataFrame(columns=['Subcategory', 'Count'])
+        return []
 
-def extract_lawyer_data(first_name, last_name, city):
+class DoctrineClient:
     """
-    Extract lawyer specialties and oath date from doctrine.fr
+    Long-lived doctrine.fr client shared across leads. Keeps connections alive
+    in a sized pool and reloads the session cookie only when the file changes.
     """
-    # Create a session for all requests
-    session = requests.Session()
-    retry_count = 0
-    max_retries = 5
-    delay = 120  # Fixed 2 minutes delay
-    
-    # Read session cookie from file
-    try:
-        cookie_file = "session_cookie.txt"
-        if not os.path.exists(cookie_file):
-            print(f"Error: {cookie_file} not found.")
-            return [], "Not found", None
-            
-        with open(cookie_file, "r") as f:
-            session_cookie = f.read().strip()
-            if not session_cookie:
-                print(f"Error: {cookie_file} is empty.")
-                return [], "Not found", None
-            session.cookies.update({"session": session_cookie})
-    except Exception as e:
-        print(f"Error reading session cookie: {str(e)}")
-        return [], "Not found", None
-
-    # Get lawyer ID and oath date from API
-    lawyer_id, oath_date = get_lawyer_id(session, first_name, last_name, city)
-    if not lawyer_id:
-        print(f"Could not find lawyer ID for {first_name} {last_name} in {city}")
-        return [], "Not found", None
-    if oath_date=="Not found":
-        print("No Oath Date")
-        return [], "Not found", None
-    # URL for the lawyer page
-    url_lawyer_page = f"https://www.doctrine.fr/p/avocat/{lawyer_id}"
-    print(f"URL for the lawyer page: {url_lawyer_page}")
-
-    while retry_count < max_retries:
+
+    def __init__(self, cookie_file="session_cookie.txt", pool_size=10, rate_limiter=None,
+                 site_url=DOCTRINE_URL, cache=None):
+        self.cookie_file = cookie_file
+        self.site_url = site_url
+        # Shared request budget; adapts to 429/403 responses and Retry-After
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(2.0, max_rate=5.0, name="doctrine.fr")
+        self.cache = cache  # Optional LookupCache checked before any request
+        self.read_keys = {}  # lawyer ID -> readKey, used when there is no cache
+        self.city_index = None  # Optional CityIndex consulted before the per-lead search
+        self.single_flight = SingleFlight()  # Identical leads in flight share one lookup
+        self.fetch_count = 0  # Lookups that went to the network
+        self.failures = {}  # identity key -> why the last lookup of a lead found nothing
+        self.stats_lock = threading.Lock()
+        self.cookie_mtime = None
+        self.browser = None  # BrowserSession for CAPTCHAs; the process-wide one if None
+        self.allow_browser = True  # False: CAPTCHAs go to the retry queue instead of opening a browser
+        self.running = threading.Event()  # Cleared while a browser step is in progress
+        self.running.set()
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.max_retries = 5
+
+    def load_cookie(self):
+        """Load the session cookie, re-reading the file only if it was modified"""
         try:
-            # Headers for lawyer page
-            headers_first = {
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36",
-                "Referer": "https://www.doctrine.fr",
-                "Upgrade-Insecure-Requests": "1"
-            }
-
-            session.headers.update(headers_first)
-            response_first = session.get(url_lawyer_page)
-
-            if response_first.status_code == 404:
-                print(f"Lawyer page not found: {url_lawyer_page}")
-                return [], "Not found", None
-            elif response_first.status_code in [429, 403]:
-                retry_count += 1
-                print(f"\n⚠️ Rate limit detected! Waiting {delay} seconds before retry {retry_count}/{max_retries}")
-                time.sleep(delay)
-                continue
-            elif response_first.status_code != 200:
-                print(f"Failed with status code {response_first.status_code}")
-                return [], "Not found", None
-            if response_first.status_code == 200:
-                match = re.search(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', response_first.text, re.DOTALL)
-                
-                if match:
-                    try:
-                        json_data = match.group(1)
-                        data = json.loads(json_data)
-                        read_key = data["props"]["pageProps"]["readKey"]
-
-                        # Get specialties
-                        headers_second = {
-                            "Accept": "application/json",
-                            "Content-Type": "application/json",
-                            "Referer": url_lawyer_page,
-                        }
-                        session.headers.update(headers_second)
-                        
-                        url_decisions = f"https://www.doctrine.fr/api/v2/lawyers/{lawyer_id}/decisions"
-                        response_second = session.get(url_decisions, params={"read_key": read_key})
-
-                        if response_second.status_code == 200:
-                            decisions_data = response_second.json()
-                            top_subcategories = extract_data(decisions_data)
-                            specialties = top_subcategories['Subcategory'].tolist()
-                            if not specialties:
-                                specialties = ["None"] * 5
-                            session.close()
-                            return specialties, oath_date, url_lawyer_page
-
-                    except KeyError as e:
-                        retry_count += 1
-                        if retry_count >= max_retries:
-                            print("\n⚠️ CAPTCHA detected after maximum retries! Stopping the process.")
-                            sys.exit(1)
-                        print(f"\n⚠️ Access denied! Setting pause for all threads...")
-                        print("Please solve the CAPTCHA")
-                        print("Solving Captcha", url_lawyer_page)
-                        solve_captcha(url_lawyer_page)
-                        continue
-
-            print(f"Failed with status code {response_first.status_code}")
-            return [], "Not found", None
+            if not os.path.exists(self.cookie_file):
+                print(f"Error: {self.cookie_file} not found.")
+                return False
+
+            mtime = os.path.getmtime(self.cookie_file)
+            if mtime == self.cookie_mtime:
+                return True
+
+            with open(self.cookie_file, "r") as f:
+                session_cookie = f.read().strip()
+            if not session_cookie:
+                print(f"Error: {self.cookie_file} is empty.")
+                return False
+            self.session.cookies.set("session", session_cookie)
+            self.cookie_mtime = mtime
+            return True
+        except Exception as e:
+            print(f"Error reading session cookie: {str(e)}")
+            return False
 
+    def set_cookies(self, cookies):
+        """
+        Replace the session's cookies with a browser's (Selenium cookie dicts)
+        and save the session cookie to the cookie file for the next start
+        """
+        self.session.cookies.clear()
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie["name"], cookie["value"], domain=cookie.get("domain", ""), path=cookie.get("path", "/")
+            )
+        session_cookie = next((c["value"] for c in cookies if c["name"] == "session"), None)
+        if session_cookie:
+            with open(self.cookie_file, "w") as f:
+                f.write(session_cookie)
+            # Already loaded; load_cookie() must not add it again without a domain
+            self.cookie_mtime = os.path.getmtime(self.cookie_file)
+
+    def pause(self):
+        """Hold every request until resume(), e.g. while a person solves a CAPTCHA"""
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def view(self, rate_limiter):
+        """
+        A client that shares this one's session (connection pool and cookies),
+        cache and single-flight group but draws on its own rate limiter, e.g.
+        one sheet's fair share of a budget shared by several sheets
+        """
+        client = copy.copy(self)
+        client.rate_limiter = rate_limiter
+        client.city_index = None
+        client.fetch_count = 0
+        return client
+
+    def check_session(self):
+        """
+        Check the saved session with one request that is not redirected.
+        True if the dashboard answers 200, i.e. no browser login is needed.
+        """
+        if not self.load_cookie():
+            return False
+        try:
+            response = self.get(f"{self.site_url}/dashboard", throttle_statuses=(429,),
+                                allow_redirects=False, stream=True, timeout=30)
+            response.close()
         except Exception as e:
-            print(f"Error processing request: {str(e)}")
+            print(f"Error checking the session: {str(e)}")
+            return False
+        return response.status_code == 200
+
+    def solve_captcha(self, url, generation=None):
+        browser = self.browser or get_browser()
+        browser.attach(self)
+        return browser.solve_captcha(url, generation)
+
+    def requests_saved(self):
+        """Estimate of the requests single-flight avoided, at the average cost of a lookup"""
+        if not self.fetch_count:
+            return 0
+        requests = self.rate_limiter.success_count + self.rate_limiter.throttle_count
+        return round(self.single_flight.shared * requests / self.fetch_count)
+
+    def close(self):
+        self.session.close()
+
+    def get(self, url, throttle_statuses=(429, 403), **kwargs):
+        """
+        Send a GET request through the pooled session, within the rate budget.
+        Rate-limited responses (`throttle_statuses`) slow the budget down and
+        are retried up to max_retries times; the last response is returned
+        either way.
+        """
+        retry_count = 0
+        while True:
+            self.running.wait()
+            self.rate_limiter.acquire()
+            response = self.session.get(url, **kwargs)
+            metrics.inc("doctrine_responses_total", status=response.status_code)
+            if response.status_code not in throttle_statuses:
+                self.rate_limiter.on_success()
+                return response
+
             retry_count += 1
-            if retry_count >= max_retries:
-                break
-            print(f"\n⚠️ Error occurred! Waiting {delay} seconds before retry {retry_count}/{max_retries}")
-            time.sleep(delay)
+            self.rate_limiter.on_throttle(parse_retry_after(response.headers.get("Retry-After")))
+            if retry_count >= self.max_retries:
+                return response
+            response.close()
+            metrics.inc("retries_total", service="doctrine.fr")
+            print(f"Rate limit detected! Retry {retry_count}/{self.max_retries}")
+
+    def get_read_key(self, lawyer_id):
+        if self.cache:
+            return self.cache.get_read_key(lawyer_id)
+        return self.read_keys.get(lawyer_id)
+
+    def store_read_key(self, lawyer_id, read_key):
+        if self.cache:
+            self.cache.put_read_key(lawyer_id, read_key)
+        else:
+            self.read_keys[lawyer_id] = read_key
+
+    def drop_read_key(self, lawyer_id):
+        if self.cache:
+            self.cache.drop_read_key(lawyer_id)
+        else:
+            self.read_keys.pop(lawyer_id, None)
+
+    def get_decisions(self, lawyer_id, read_key, url_lawyer_page, throttle_statuses=(429, 403), validators=None):
+        """
+        Request a lawyer's decisions with the readKey from their profile page.
+        `validators` are conditional headers (If-None-Match, If-Modified-Since).
+        """
+        headers_second = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "User-Agent": USER_AGENT,
+            "Referer": url_lawyer_page,
+        }
+        headers_second.update(validators or {})
+        url_decisions = f"{self.site_url}/api/v2/lawyers/{lawyer_id}/decisions"
+        with metrics.span("doctrine_decisions"):
+            return self.get(
+                url_decisions, throttle_statuses=throttle_statuses,
+                params={"read_key": read_key}, headers=headers_second
+            )
+
+    def find_lawyer(self, first_name, last_name, city):
+        """Resolve a lead to (lawyer_id, oath_date), from the city index when it knows the name"""
+        if self.city_index:
+            found = self.city_index.resolve(first_name, last_name, city)
+            if found:
+                return found
+        return get_lawyer_id(self, first_name, last_name, city, self.site_url)
+
+    def lookup(self, first_name, last_name, city, fresh=False):
+        """
+        Extract lawyer specialties and oath date from doctrine.fr, answering
+        from the lookup cache when it holds a fresh result. `fresh` skips the
+        cache, e.g. for a retry whose earlier answer may still be cached.
+        Concurrent lookups of the same normalized lead wait for the first one
+        instead of repeating it.
+        """
+        return self.single_flight.do(
+            identity_key(first_name, last_name, city), self._lookup, first_name, last_name, city, fresh
+        )
+
+    def _lookup(self, first_name, last_name, city, fresh=False):
+        if self.cache and not fresh:
+            cached = self.cache.get(first_name, last_name, city)
+            if cached:
+                metrics.inc("lookup_cache_total", result="hit")
+                print(f"Cache hit: {first_name} {last_name} in {city}")
+                self.record_failure(first_name, last_name, city, None if cached[2] else retry_scheduler.NOT_FOUND)
+                return cached
+            metrics.inc("lookup_cache_total", result="miss")
+
+        with self.stats_lock:
+            self.fetch_count += 1
+        with metrics.span("lookup"):
+            result, failure = self.fetch(first_name, last_name, city)
+        definitive = failure in (None, retry_scheduler.NOT_FOUND)
+        metrics.inc("lookups_total", outcome="found" if result[2] else "not_found" if definitive else "failed")
+        self.record_failure(first_name, last_name, city, failure)
+        if self.cache and definitive:
+            self.cache.put(first_name, last_name, city, result)
+        return result
+
+    def record_failure(self, first_name, last_name, city, failure):
+        key = identity_key(first_name, last_name, city)
+        with self.stats_lock:
+            if failure:
+                self.failures[key] = failure
+            else:
+                self.failures.pop(key, None)
+
+    def last_failure(self, first_name, last_name, city):
+        """Why the last lookup of a lead found nothing (a retry_scheduler kind), or None if it succeeded"""
+        with self.stats_lock:
+            return self.failures.get(identity_key(first_name, last_name, city))
+
+    def fetch(self, first_name, last_name, city):
+        """
+        Look a lawyer up on doctrine.fr. Returns (result, failure) where
+        failure is None when the lawyer was found, retry_scheduler.NOT_FOUND
+        when the site has no match, and otherwise the kind of error that kept
+        the site from answering, in which case the result must not be cached.
+        """
+        retry_count = 0
+        max_retries = self.max_retries
+
+        if not self.load_cookie():
+            return NOT_FOUND, retry_scheduler.NETWORK_ERROR
+
+        # Get lawyer ID and oath date from the city index or the API
+        lawyer_id, oath_date = self.find_lawyer(first_name, last_name, city)
+        if not lawyer_id:
+            print(f"Could not find lawyer ID for {first_name} {last_name} in {city}")
+            # oath_date is None when the search request itself failed
+            if oath_date is None:
+                return NOT_FOUND, retry_scheduler.NETWORK_ERROR
+            return NOT_FOUND, retry_scheduler.NOT_FOUND
+        if oath_date=="Not found":
+            print("No Oath Date")
+            return NOT_FOUND, retry_scheduler.NOT_FOUND
+        # URL for the lawyer page
+        url_lawyer_page = f"{self.site_url}/p/avocat/{lawyer_id}"
+        print(f"URL for the lawyer page: {url_lawyer_page}")
 
-    session.close()
-    return [], "Not found", None
+        # A stored readKey skips the profile page; only 429 counts as throttling
+        # here because a stale key is rejected with an error status
+        read_key = self.get_read_key(lawyer_id)
+        if read_key:
+            response_second = self.get_decisions(
+                lawyer_id, read_key, url_lawyer_page, throttle_statuses=(429,)
+            )
+            if response_second.status_code == 200:
+                metrics.inc("read_key_total", result="reused")
+                return (top_specialties(response_second.json()), oath_date, url_lawyer_page), None
+            if response_second.status_code == 429:
+                # Throttled, not rejected: the key is still good for the retry
+                print(f"Still rate limited after {max_retries} retries: {url_lawyer_page}")
+                return NOT_FOUND, retry_scheduler.RATE_LIMITED
+            if response_second.status_code in READ_KEY_REJECTED:
+                metrics.inc("read_key_total", result="rejected")
+                print(f"Stored readKey rejected (status {response_second.status_code}), fetching profile page")
+                self.drop_read_key(lawyer_id)
+
+        while retry_count < max_retries:
+            # Browser steps finished after this point already brought fresh cookies
+            generation = (self.browser or get_browser()).generation
+            try:
+                # Headers for lawyer page
+                headers_first = {
+                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+                    "User-Agent": USER_AGENT,
+                    "Referer": self.site_url,
+                    "Upgrade-Insecure-Requests": "1"
+                }
+
+                with metrics.span("doctrine_page"):
+                    response_first = self.get(url_lawyer_page, headers=headers_first, stream=True)
+                try:
+                    if response_first.status_code == 404:
+                        print(f"Lawyer page not found: {url_lawyer_page}")
+                        return NOT_FOUND, retry_scheduler.NOT_FOUND
+                    elif response_first.status_code in [429, 403]:
+                        # get() has already retried within the rate budget; a lasting
+                        # 403 is the site blocking the session rather than throttling
+                        print(f"Still rate limited after {max_retries} retries: {url_lawyer_page}")
+                        if response_first.status_code == 429:
+                            return NOT_FOUND, retry_scheduler.RATE_LIMITED
+                        return NOT_FOUND, retry_scheduler.CAPTCHA
+                    elif response_first.status_code != 200:
+                        print(f"Failed with status code {response_first.status_code}")
+                        return NOT_FOUND, retry_scheduler.NETWORK_ERROR
+                    if response_first.status_code == 200:
+                        with metrics.span("doctrine_page_read"):
+                            json_data = read_next_data(response_first)
+
+                        if json_data:
+                            try:
+                                data = json.loads(json_data)
+                                read_key = data["props"]["pageProps"]["readKey"]
+                                self.store_read_key(lawyer_id, read_key)
+
+                                # Get specialties
+                                response_second = self.get_decisions(lawyer_id, read_key, url_lawyer_page)
+
+                                if response_second.status_code == 200:
+                                    specialties = top_specialties(response_second.json())
+                                    return (specialties, oath_date, url_lawyer_page), None
+
+                            except KeyError as e:
+                                if not self.allow_browser:
+                                    # The retry scheduler brings the lead back once the CAPTCHA has gone
+                                    print("\n⚠️ CAPTCHA detected and no browser allowed! Skipping this lead.")
+                                    return NOT_FOUND, retry_scheduler.CAPTCHA
+                                retry_count += 1
+                                if retry_count >= max_retries:
+                                    # The retry scheduler brings the lead back later
+                                    print("\n⚠️ CAPTCHA detected after maximum retries! Skipping this lead.")
+                                    return NOT_FOUND, retry_scheduler.CAPTCHA
+                                self.solve_captcha(url_lawyer_page, generation)
+                                continue
+
+                    print(f"Failed with status code {response_first.status_code}")
+                    return NOT_FOUND, retry_scheduler.NETWORK_ERROR
+                finally:
+                    # The page is streamed: give its connection back to the pool
+                    response_first.close()
+
+            except Exception as e:
+                print(f"Error processing request: {str(e)}")
+                retry_count += 1
+                if retry_count >= max_retries:
+                    break
+                print(f"\n⚠️ Error occurred! Backing off before retry {retry_count}/{max_retries}")
+                self.rate_limiter.on_throttle()
+
+        return NOT_FOUND, retry_scheduler.NETWORK_ERROR
+
+
+_default_client = None
+
+def get_client():
+    """Return the process-wide DoctrineClient, creating it on first use"""
+    global _default_client
+    if _default_client is None:
+        _default_client = DoctrineClient()
+    return _default_client
+
+def top_specialties(decisions_data):
+    """Top 5 subcategory names from a /decisions payload, or ["None"] * 5 if there are none"""
+    specialties = [name for name, _ in extract_data(decisions_data)]
+    if not specialties:
+        specialties = ["None"] * 5
+    return specialties
+
+def extract_lawyer_data(first_name, last_name, city):
+    """
+    Extract lawyer specialties and oath date from doctrine.fr
+    """
+    return get_client().lookup(first_name, last_name, city)
 
 def main():
     # Example usage
@@ -0,0 +1,63 @@
+import sys
+import socket
+import argparse
+import multiprocessing
+from lease_store import open_store
+
+
+def run_worker(sheet_id, sheet_name, delay, store_spec, worker_id):
+    """Run one LeadProcessor that claims its rows through the shared lease store"""
+    import run_bot
+
+    store = open_store(store_spec)
+    processor = run_bot.LeadProcessor(
+        sheet_id=sheet_id, sheet_name=sheet_name, delay=delay,
+        lease_store=store, worker_id=worker_id
+    )
+    # Concurrent workers must not start Chrome on one shared profile
+    processor.client.allow_browser = False
+    try:
+        processor.process_leads()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process one sheet with several coordinated workers")
+    parser.add_argument("--sheet-id", required=True)
+    parser.add_argument("--sheet-name", default="FRANCE: 78000 lawyers")
+    parser.add_argument("--delay", type=float, default=5, help="check interval in seconds")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes on this host")
+    parser.add_argument(
+        "--store", default="sqlite:leases.sqlite3",
+        help="lease store: sqlite:<path> for one host, or the http:// URL of a lease coordinator"
+    )
+    args = parser.parse_args()
+
+    print(f"Starting {args.workers} workers on {args.sheet_name} (lease store: {args.store})")
+    print("The doctrine.fr session must already be saved; workers do not open a browser.")
+    processes = []
+    for i in range(args.workers):
+        worker_id = f"{socket.gethostname()}-w{i}"
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(args.sheet_id, args.sheet_name, args.delay, args.store, worker_id),
+            name=worker_id
+        )
+        process.start()
+        processes.append(process)
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\nStopping the workers...")
+        for process in processes:
+            process.join()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()